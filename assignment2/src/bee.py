@@ -1,19 +1,23 @@
 import logging
 import os
 import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import heapq
 import bisect
 import math
 
 import numpy as np
-import tensorflow as tf
-import tensorflow.keras.models as keras_model
-from scipy.interpolate import CubicSpline
 
+from bustle_model import NumpyBustleModel
+from inference_server import InferenceClient
+from program_bank import ProgramBank
 from sygus_string_dsl import *
 from sygus_parser import StrParser
+from search_trace import SearchTraceWriter, SearchTraceReplay
 from utils import *
+from solution_cache import SolutionCache
 
 
 limit_decimal_places = True
@@ -21,28 +25,43 @@ limit_decimal_places = True
 
 class ProgramList:
 
-    def __init__(self, string_variables_list, integer_variables_list, input_output):
+    def __init__(self, string_variables_list, integer_variables_list, input_output, trace=None):
         """
-        self.plist has a structure like this:
-        {"cost":  
-            {"type1": [] programs, 
-             "type2": [] programs,
-             ...},
-         "cost2":  
-            {"type1": [] programs, 
-            "type2": [] programs,
-            ...},
-            ...
-        }  
+        self.bank holds the programs by cost and type, as rows of NumPy arrays (see program_bank.py).
+        The programs that are grown and scored during a level are candidates:
+            (operation, children ids, cost before the model, outputs)
         """
         self.number_reheapify_calls = 0
-        self.plist = {}
-        self.number_programs = 0
+        self.bank = ProgramBank(len(input_output))
+        # Environments of the examples, the outputs of the terminals are computed on them.
+        self.envs = [{variable: example[variable] for variable in string_variables_list + integer_variables_list}
+                     for example in input_output]
         self.parent_input_output = input_output
         self.string_variables = string_variables_list
         self.integer_variables = integer_variables_list
         self.parent_ps = []
         self.batch_jobs = []
+        """
+        Candidates of the current cost level that are being scored: [(candidates, probabilities), ...] in the order
+        they were inserted, probabilities is a future of the inference_executor when the pipeline is enabled
+        (see INFERENCE_MICRO_BATCH_SIZE). process_batch_jobs merges them in that order at the end of the level.
+        """
+        self.scored_batches = []
+        self.inference_executor = ThreadPoolExecutor(max_workers=1) if INFERENCE_MICRO_BATCH_SIZE > 0 else None
+        """
+        The prediction of the model only depends on the property signature, and parent_ps is the same for
+        every program: self.prediction_memo maps the (bit-packed) sub-program part of the signature to the
+        predicted probability, in least recently used order.
+        """
+        self.prediction_memo = OrderedDict()
+        self.number_predicted_programs = 0
+        self.number_prediction_memo_hits = 0
+        """
+        Optional search trace (see search_trace.py): a SearchTraceWriter records the probability of every stored
+        program, a SearchTraceReplay gives the recorded probabilities instead of the model. The programs are
+        given to the trace in the order of the bank.
+        """
+        self.trace = trace
         self.property_encodings = {
             AllTrue: EncodedAllTrue,
             AllFalse: EncodedAllFalse,
@@ -50,26 +69,38 @@ class ProgramList:
             Padding: EncodedPadding
         }
         """
-         self.pq_store has a structure like this:
-        {
-            'arity': [
-                [cost, order, combination],...
-                ],
-                ...
-            ],
-        }
+        self.pq is a single heap for the combinations of every arity, of tuples:
+            (cost, arity, order, combination)
         Arity = No. of inputs to any operation. 
         We combine them based on arity. This reduces the number of operations we need to consider.
+        At the same cost, the combinations of smaller arities come first.
         Order is just maintained to break the tie when cost is same.
-        Combination is the actual combination of operations based on indices of the costs from costs_list.
+        Combination is the actual combination of operations based on indices of the costs from costs_list,
+        as a tuple.
+        self.pq_live[order] is the entry of the combination with that order that is still in the heap. An entry
+        that was popped or re-keyed (see rekey_pqs) is not in pq_live anymore, it is skipped when it
+        reaches the top of the heap.
         """
-        self.pq_store = {}
+        self.pq = []
+        self.pq_live = {}
 
         """
-        Maintains popped elements from pq_store, indexed by arity. So that we can perform the grow step.
+        self.pq_buckets[max index] is the set of orders of the live entries whose combination has that largest
+        index: only the combinations with an index at or after the first changed position of cost_list have
+        to be re-keyed.
+        """
+        self.pq_buckets = {}
+
+        """
+        Maintains popped elements from pq, indexed by arity. So that we can perform the grow step.
         """
         self.pq_popped = {}
+        """
+        Sorted list of the distinct (integer) costs of the programs, self.costs is the same costs as a set
+        for membership tests (see insert_cost).
+        """
         self.cost_list = []
+        self.costs = set()
         self.order = 0
 
         """
@@ -93,81 +124,102 @@ class ProgramList:
         calculate_ps_for_problem(self,
                                  string_variables_list, integer_variables_list)
 
-    def insert(self, program):
-        self.batch_jobs.append(program)
-
-    def process_batch_jobs(self):
-
-        batch_size = 100000
-        total_jobs = len(self.batch_jobs)
+        """
+        self.feature_buffer holds the property signatures of the micro-batch that is scored, it is reused by every
+        micro-batch (they are scored one at a time) and grown up to self.micro_batch_size rows, the rows that fit
+        in INFERENCE_MEMORY_BUDGET. The columns of parent_ps are only written when the buffer is allocated.
+        """
+        row_bytes = (len(self.parent_ps) + SUB_PROGRAM_PS_LENGTH) * np.dtype(np.float32).itemsize
+        self.micro_batch_size = max(1, INFERENCE_MEMORY_BUDGET // row_bytes)
+        if self.inference_executor is not None:
+            self.micro_batch_size = min(self.micro_batch_size, INFERENCE_MICRO_BATCH_SIZE)
+        self.feature_buffer = np.empty((0, len(self.parent_ps) + SUB_PROGRAM_PS_LENGTH), dtype=np.float32)
+
+    def insert(self, candidate):
+        self.batch_jobs.append(candidate)
+        if self.inference_executor is not None and len(self.batch_jobs) >= self.micro_batch_size:
+            self.submit_batch_jobs(self.micro_batch_size)
+
+    def submit_batch_jobs(self, batch_size):
+        # Scores the first batch_size buffered programs, on the worker thread if the pipeline is enabled.
+        current_batch = self.batch_jobs[:batch_size]
+        del self.batch_jobs[:batch_size]
+        if self.inference_executor is not None:
+            self.scored_batches.append(
+                (current_batch, self.inference_executor.submit(self.score_programs, current_batch)))
+        else:
+            self.scored_batches.append((current_batch, self.score_programs(current_batch)))
+
+    def score_programs(self, current_batch):
+        """
+        Predicted probabilities of the candidates. Only touches the prediction memo and its counters, which
+        are not read while the worker thread runs.
+        """
+        if self.trace is not None and self.trace.replay:
+            return self.trace.probabilities([candidate[:2] for candidate in current_batch])
 
-        # Used to store the costs of the programs for the current batch - needed to heapify.
-        self.last_costs_generated = []
+        # outputs of the candidates of the current batch on the input-output pairs,
+        # computed by BeeSearch.evaluate.
+        current_batch_outputs = [candidate[3] for candidate in current_batch]
+        current_batch_types = [self.bank.probes[candidate[0]].getReturnType() for candidate in current_batch]
 
-        # step by batch size
-        for job_index in range(0, total_jobs, batch_size):
+        # property signatures of the current batch, one row per candidate.
+        current_batch_ps = self.get_feature_rows(len(current_batch))
+        populate_batch_ps(self, current_batch_types, current_batch_outputs, current_batch_ps,
+                          STR_TYPES, INT_TYPES, BOOL_TYPES)
 
-            current_batch = self.batch_jobs[job_index:job_index + batch_size]
-            current_batch_ps = []  # property signatures of the current batch
+        # Predict the probability of the current batch.
+        return self.predict_probabilities(current_batch_ps)
 
-            for program in current_batch:
+    def get_feature_rows(self, number_rows):
+        """
+        The first number_rows rows of self.feature_buffer, the buffer is doubled (up to self.micro_batch_size
+        rows) when it is too small.
+        """
+        if number_rows > len(self.feature_buffer):
+            buffer_rows = min(self.micro_batch_size, max(number_rows, 2 * len(self.feature_buffer)))
+            self.feature_buffer = np.empty((buffer_rows, self.feature_buffer.shape[1]), dtype=np.float32)
+            self.feature_buffer[:, :len(self.parent_ps)] = self.parent_ps
+        return self.feature_buffer[:number_rows]
 
-                # Copy the parent property signature.
-                test_row = self.parent_ps.copy()
-                child_input_outputs = []
+    def process_batch_jobs(self):
 
-                # Run the program on all the input-output pairs.
-                for index, parent_input in enumerate(self.parent_input_output):
-                    child_input_output = parent_input.copy()
-                    child_output = program.interpret(child_input_output)
-                    child_input_output['cout'] = child_output
-                    child_input_output['out'] = self.parent_input_output[index]['out']
-                    child_input_outputs.append(child_input_output)
+        batch_size = self.micro_batch_size
 
-                # get the output of the subexpression
-                outputs = [output['cout'] for output in child_input_outputs]
+        # Used to store the costs of the programs for the current batch - needed to heapify.
+        self.last_costs_generated = []
 
-                # get ps for the sub-program.
-                populate_sub_program_ps(
-                    self, program, test_row, outputs, child_input_outputs, STR_TYPES, INT_TYPES, BOOL_TYPES)
+        # step by batch size
+        while len(self.batch_jobs) > 0:
+            self.submit_batch_jobs(batch_size)
 
-                # Append the test row to the current batch.
-                current_batch_ps.append(test_row)
+        # Merge the scored batches in insertion order.
+        for current_batch, scored_batch in self.scored_batches:
 
-            # Predict the probability of the current batch.
-            current_batch_predictions = BustleModel.predict(
-                np.array(current_batch_ps), verbose = 0)
+            current_batch_probabilities = scored_batch.result() if self.inference_executor is not None \
+                else scored_batch
 
-            for program_index, program in enumerate(current_batch):
+            for program_index, (operation, children, size, outputs) in enumerate(current_batch):
 
                 # Predicted probability of the program by the model.
-                program_probability = current_batch_predictions[program_index]
+                program_probability = current_batch_probabilities[program_index]
+                if self.trace is not None:
+                    self.trace.add(operation, children, program_probability)
                 # Penalization based on W(unbound)
-                additional_weight = -math.log(program_probability[0], 2)
+                additional_weight = -math.log(program_probability, 2)
                 if (not additional_weight > 0):
                     # Safe check, not happens in practice.
                     additional_weight = 0.01
-                # Updated size of the program while avoiding floating point errors.
+                # Updated size of the program, quantized to an integer.
                 # New size = old size + W(unbound)
-                program.size = decimal_place_converter(
-                    program.size + additional_weight)
-                # program.size = program.size + additional_weight
-
-                # Storing the program.
-                if program.size not in self.plist:
-                    self.plist[program.size] = {}
+                size = quantize_cost(size + additional_weight)
 
-                if program.size not in self.cost_list:
+                if self.insert_cost(size):
                     # bisect.insrot is essentially a binary search - inserts el in a sorted list.
-                    bisect.insort(self.last_costs_generated, program.size)
-                    bisect.insort(self.cost_list, program.size)
+                    bisect.insort(self.last_costs_generated, size)
 
-                if program.getReturnType() not in self.plist[program.size]:
-                    self.plist[program.size][program.getReturnType()] = []
-
-                self.plist[program.size][program.getReturnType()
-                                         ].append(program)
-                self.number_programs += 1
+                # Storing the program.
+                self.bank.add(operation, children, size, outputs)
 
         # Code for heapifying the PQs.
         needToHeapify = False
@@ -179,40 +231,122 @@ class ProgramList:
                     needToHeapify = True
         if (needToHeapify):
             self.number_reheapify_calls += 1
-            self.heapify_pqs()
+            self.rekey_pqs(bisect.bisect_left(self.cost_list, self.last_costs_generated[0]))
 
         # Clearing the batch jobs.
-        self.batch_jobs.clear()
+        self.scored_batches = []
         return self.number_reheapify_calls
 
-    def heapify_pqs(self):
+    def close(self):
+        # Drops the micro-batches that are still pending, for a search that stops in the middle of a level.
+        if self.inference_executor is not None:
+            self.inference_executor.shutdown(wait=False, cancel_futures=True)
+
+    def predict_probabilities(self, batch_ps):
+        """
+        Probabilities of the rows of batch_ps, the model only runs on the signatures that are neither in
+        self.prediction_memo nor repeated earlier in the batch.
+        """
+        keys = np.packbits(batch_ps[:, len(self.parent_ps):] != 0, axis=1)
+        probabilities = np.empty(len(batch_ps), dtype=np.float32)
+        # signature -> rows of the batch, for the signatures that are not in the memo.
+        missing_rows = {}
+        for row_index, key in enumerate(map(bytes, keys)):
+            probability = self.prediction_memo.get(key)
+            if probability is None:
+                missing_rows.setdefault(key, []).append(row_index)
+            else:
+                self.prediction_memo.move_to_end(key)
+                probabilities[row_index] = probability
+
+        if missing_rows:
+            predictions = BustleModel.predict(
+                batch_ps[[rows[0] for rows in missing_rows.values()]], verbose = 0)
+            for (key, rows), prediction in zip(missing_rows.items(), predictions):
+                probabilities[rows] = prediction[0]
+                self.prediction_memo[key] = prediction[0]
+            while len(self.prediction_memo) > PREDICTION_MEMO_SIZE:
+                self.prediction_memo.popitem(last=False)
+
+        self.number_predicted_programs += len(batch_ps)
+        self.number_prediction_memo_hits += len(batch_ps) - len(missing_rows)
+        return probabilities
+
+    def rekey_pqs(self, first_changed_index):
+        """
+        The costs at first_changed_index and after in cost_list were inserted or shifted by the last batch,
+        the combinations that use one of them get the cost of their indices in the new cost_list.
+        The other combinations keep their cost, so the heap is not rebuilt: the re-keyed entries are pushed
+        again and their old entries become stale.
+        """
+        rekeyed_arities = set()
         for arity in range(1, MAX_ARITY + 1):
             if (self.pq_last_max[arity][self.HEAPIFY]):
                 self.pq_last_max[arity][self.HEAPIFY] = False
-                pq_for_current_arity = self.pq_store[arity]
-                # pq_for_current_arity = copy.deepcopy(pq_for_current_arity)
-                pq_for_current_arity = [[decimal_place_converter(sum(self.index_to_cost_comb(
-                    comb[2])) + 1), comb[1], comb[2]] for comb in pq_for_current_arity]
-                heapq.heapify(pq_for_current_arity)
-                self.pq_store[arity] = pq_for_current_arity
+                rekeyed_arities.add(arity)
 
-    # Initialize the program list with the literals and variables.
-    def init_insert(self, program):
+        for max_index, bucket in self.pq_buckets.items():
+            if max_index < first_changed_index:
+                continue
+            for order in bucket:
+                _, arity, _, combination = self.pq_live[order]
+                if arity not in rekeyed_arities:
+                    continue
+                cost = sum(self.index_to_cost_comb(combination)) + 1
+                if cost != self.pq_live[order][0]:
+                    self.pq_live[order] = (cost, arity, order, combination)
+                    heapq.heappush(self.pq, self.pq_live[order])
+
+    def push_combination(self, arity, cost, combination):
+        comb = (cost, arity, self.order, combination)
+        heapq.heappush(self.pq, comb)
+        self.pq_live[self.order] = comb
+        self.pq_buckets.setdefault(max(combination), set()).add(self.order)
+        self.order += 1  # Tie breaker.
+
+    def peek_combination(self):
+        # Cheapest live entry, None if the pq is empty.
+        while (len(self.pq) and self.pq_live.get(self.pq[0][2]) is not self.pq[0]):
+            heapq.heappop(self.pq)
+        return self.pq[0] if len(self.pq) else None
+
+    """
+    Pops the combinations that cost cost, in order, and adds them to the popped combinations.
+    Yields (arity, combination).
+    """
+
+    def pop_combinations(self, cost):
+        while True:
+            comb = self.peek_combination()
+            if comb is None or comb[0] != cost:
+                return
+            heapq.heappop(self.pq)
+            _, arity, order, combination = comb
+            del self.pq_live[order]
+            self.pq_buckets[max(combination)].discard(order)
+            self.pq_popped[arity].append(combination)
+            yield arity, combination
 
-        if program.size not in self.plist:
-            self.plist[program.size] = {}
+    # Initialize the program list with the literals and variables.
+    def init_insert(self, program, in_layers=True):
+        if self.trace is not None:
+            self.trace.add(type(program))
 
-        if program.getReturnType() not in self.plist[program.size]:
-            self.plist[program.size][program.getReturnType()] = []
+        self.bank.add_terminal(program, [program.interpret(env) for env in self.envs], in_layers)
 
-        self.plist[program.size][program.getReturnType()].append(program)
-        self.number_programs += 1
+    """
+    literal_tiers optionally maps string literals to a cost tier (see rank_literals),
+    a literal of tier t costs t more than the other terminals.
+    """
 
     def init_plist(self, string_literals_list, integer_literals_list, boolean_literals,
-                   string_variables_list, integer_variables_list):
+                   string_variables_list, integer_variables_list, literal_tiers=None):
 
         for string_literal in string_literals_list:
             init_program = StrLiteral(string_literal)
+            if literal_tiers is not None:
+                init_program.size += literal_tiers.get(string_literal, 0)
+                self.insert_cost(init_program.size)
             self.init_insert(init_program)
 
         for integer_literal in integer_literals_list:
@@ -231,28 +365,26 @@ class ProgramList:
             init_program = IntVar(int_var)
             self.init_insert(init_program)
 
-        self.cost_list.append(1)
-        self.initialize_pq_store()
+        # The constant operands of the BoolEqual candidates whose operands have types that are never equal.
+        for value in (1, 2):
+            self.init_insert(IntLiteral(value), in_layers=False)
 
-    def get_programs_all(self, size):
-
-        if size in self.plist:
-            programs = []
-            for value in self.plist[size].values():
-                programs.extend(value)
-            return programs
-
-        return []
-
-    def get_programs(self, size, return_type):
-        if size in self.plist:
-            if return_type in self.plist[size]:
-                return self.plist[size][return_type]
+        self.insert_cost(1)
+        self.initialize_pq_store()
 
-        return []
+    def insert_cost(self, cost):
+        """
+        Adds cost to cost_list, returns False if it was already there.
+        """
+        if cost in self.costs:
+            return False
+        self.costs.add(cost)
+        bisect.insort(self.cost_list, cost)
+        return True
 
     def get_number_programs(self):
-        return self.number_programs
+        # The constants of the bank are not programs of the search.
+        return len(self.bank) - len(self.bank.constants)
 
     """
     Returns combination of costs for a given combination of indices.
@@ -265,46 +397,26 @@ class ProgramList:
         return [self.cost_list[val] for val in combination]
 
     """
-    Initializes the priority queues.
-    - For each arity, we have a priority queue to keep things simple.
-    - Initially it is (0,...,k) where k is the arity.
+    Initializes the priority queue.
+    - Initially it has (0,...,0) for each arity k, with k zeros.
     """
 
     def initialize_pq_store(self):
         for arity in range(1, MAX_ARITY + 1):
             self.pq_popped[arity] = []
-            combination = [0] * arity
+            combination = (0,) * arity
             cost = (arity * self.cost_list[0]) + 1  # Initial cost.
-            combinationx = [cost, self.order, combination]
-            self.order += 1  # Tie breaker.
-            self.pq_store[arity] = [combinationx]
+            self.push_combination(arity, cost, combination)
             self.pq_last_max[arity] = {self.COST: 0,
                                        self.HEAPIFY: False, self.MAX_INDEX: 0}
 
     """
-    Returns a tuple of the next cheapest cost-tuple in the form of the arities containing the cheapest tuple. 
-    The tuple is of the form: [list_arity, costs]
+    Returns the cost of the next cheapest combinations, inf if there are no combinations left.
     """
 
     def get_next_cheapest(self):
-        comb_container = []
-        smallest_cost = float('inf')
-
-        for arity in range(1, MAX_ARITY + 1):
-
-            item = self.pq_store[arity]
-            if (len(item) == 0):
-                continue
-
-            current_cost = item[0][0]
-
-            if (current_cost <= smallest_cost):
-                if (current_cost < smallest_cost):
-                    comb_container = []
-                smallest_cost = current_cost
-                comb_container.append(arity)
-
-        return [comb_container, smallest_cost]
+        comb = self.peek_combination()
+        return comb[0] if comb is not None else float('inf')
 
     def generate_next_set_of_combinations(self):
         for arity in range(1, MAX_ARITY + 1):
@@ -313,7 +425,6 @@ class ProgramList:
             if (len(self.pq_popped[arity]) == 0):
                 continue
 
-            pq_for_current_arity = self.pq_store[arity]
             popped_combinations = self.pq_popped[arity]
             max_index = len(self.cost_list) - 1  # Max index allowed.
 
@@ -344,27 +455,23 @@ class ProgramList:
             for comb in popped_combinations:
 
                 for i in range(arity):
-                    cc = comb.copy()
 
                     # Does not happen in practice. Sanity check.
-                    if (cc[i] == max_index):
+                    if (comb[i] == max_index):
                         break
 
                     # Incrementing the tuple index at ith position.
-                    cc[i] = cc[i] + 1
+                    cc = comb[:i] + (comb[i] + 1,) + comb[i + 1:]
 
                     # Updating the maximum_index_used in this arity.
                     if (cc[i] > maximum_index_used):
                         maximum_index_used = cc[i]
 
                     # Calculating the cost of the new combination.
-                    cost = decimal_place_converter(
-                        sum(self.index_to_cost_comb(cc)) + 1)
+                    cost = sum(self.index_to_cost_comb(cc)) + 1
 
                     # Inserting the new combination into the priority queue.
-                    heapq.heappush(pq_for_current_arity, [
-                                   cost, self.order, cc])
-                    self.order += 1
+                    self.push_combination(arity, cost, cc)
 
                     # If the value at ith position is greater than 1, we do not need to expand it further.
                     if (cc[i] > 1):
@@ -377,110 +484,100 @@ class ProgramList:
 
 class BeeSearch:
 
-    def __init__(self, string_variables_list, integer_variables_list, input_output):
+    def __init__(self, string_variables_list, integer_variables_list, input_output, trace=None):
         self._variables = string_variables_list + integer_variables_list
         self._input_output = input_output
+        # Expected outputs of the examples, built once.
+        self._task_outputs = [inout['out'] for inout in input_output]
         self.plist = ProgramList(
-            string_variables_list, integer_variables_list, input_output)
+            string_variables_list, integer_variables_list, input_output, trace)
         self._outputs = set()
         self.number_evaluations = 0
         self.number_heapify_calls = 0
+        # Value domain caps (see value_domain_caps), set in synthesize from value_domain_factor.
+        self.value_domain_factor = VALUE_DOMAIN_FACTOR
+        self.max_int_magnitude = None
+        self.max_string_length = None
+        self.number_value_domain_rejections = 0
 
-    def is_correct(self, p):
-        is_program_correct = True
-        for inout in self._input_output:
-            env = self.init_env(inout)
-            out = p.interpret(env)
-            if out != inout['out']:
-                is_program_correct = False
-
-        return is_program_correct
-
-    def init_env(self, inout):
-        env = {}
-        for v in self._variables:
-            env[v] = inout[v]
-        return env
-
-    def has_equivalent(self, program):
-        p_out = []
-        for inout in self._input_output:
-            env = self.init_env(inout)
-            out = program.interpret(env)
-            if out is not None:
-                p_out.append(out)
-            else:
-                return True
+    def is_correct(self, candidate):
+        return candidate[3] == self._task_outputs
+
+    def has_equivalent(self, return_type, p_out):
+        """
+        Whether the outputs p_out of a candidate are ERROR, outside of the value domain, or the outputs of a
+        program that is already in the bank.
+        """
+        if p_out is None:
+            return True
+
+        if not within_value_domain(p_out, self.max_int_magnitude, self.max_string_length):
+            self.number_value_domain_rejections += 1
+            return True
 
-        tuple_out = tuple(p_out)
+        # Boolean outputs are keyed by their bitmask, so (True, False) is not taken for the integers (1, 0).
+        tuple_out = to_bitmask(p_out) if return_type == BOOL_TYPES['type'] else tuple(p_out)
 
         if tuple_out not in self._outputs:
             self._outputs.add(tuple_out)
             return False
         return True
 
-    def grow(self, cheapest_combinations, next_cheapest_cost):
-        new_programs = []
-        for cheapest_combination in cheapest_combinations:
-            # Pick the cheapest entry.
-            smallest_cost_arity = cheapest_combination
-
-            # Get all tthe combinations against that op
-            all_comb_of_arity = self.plist.pq_store[smallest_cost_arity]
-
-            # Remove all the cheapest combinations from the list.
-            while (len(all_comb_of_arity) and all_comb_of_arity[0][0] == next_cheapest_cost):
-
-                smallest_combination = heapq.heappop(all_comb_of_arity)
-
-                # Add that to the popped combinations.
-                self.plist.pq_popped[smallest_cost_arity].append(
-                    smallest_combination[2])
-
-                # Since programs are indexed by cost in the plist.
-                cost_combination = self.plist.index_to_cost_comb(
-                    smallest_combination[2])
-
-                for operation in NON_TERMINALS:
-                    if (operation.ARITY != smallest_cost_arity):
-                        continue
-                    for new_program in operation.grow(self.plist, cost_combination):
-                        self.number_evaluations += 1
-                        if not self.has_equivalent(new_program):
-                            new_programs.append(new_program)
-                            yield new_program
-
-        # For evaluating it later on w neural network.
-        for new_program in new_programs:
-            self.plist.insert(new_program)
+    def grow(self, next_cheapest_cost):
+        # Remove all the cheapest combinations from the list, they are added to the popped combinations.
+        for smallest_cost_arity, smallest_combination in self.plist.pop_combinations(next_cheapest_cost):
+
+            # Since programs are indexed by cost in the plist.
+            cost_combination = self.plist.index_to_cost_comb(
+                smallest_combination)
+
+            bank = self.plist.bank
+            for operation in NON_TERMINALS:
+                if (operation.ARITY != smallest_cost_arity):
+                    continue
+                return_type = bank.probes[operation].getReturnType()
+                for candidate_operation, children in bank.grow(operation, cost_combination):
+                    self.number_evaluations += 1
+                    # Candidates are evaluated from the outputs of their children.
+                    p_out = bank.evaluate(candidate_operation, children)
+                    if not self.has_equivalent(return_type, p_out):
+                        candidate = (candidate_operation, children, bank.cost(candidate_operation, children), p_out)
+                        # For evaluating it with the neural network, while the level goes on.
+                        self.plist.insert(candidate)
+                        yield candidate
 
         self.number_heapify_calls += self.plist.process_batch_jobs()
 
     def search(self, bound, string_literals_list, integer_literals_list,
                boolean_literals, string_variables_list,
-               integer_variables_list):
+               integer_variables_list, literal_tiers=None):
         # Init DSL
         self.plist.init_plist(string_literals_list, 
                               integer_literals_list, 
                               boolean_literals,
                               string_variables_list, 
                               integer_variables_list, 
+                              literal_tiers
                             )
         # start searching
         current_step = 0
         while current_step <= bound:
-            combination, cost = self.plist.get_next_cheapest()
-            for p in self.grow(combination, cost):
-                if self.is_correct(p):
-                    return p, self.number_evaluations, self.number_heapify_calls
+            cost = self.plist.get_next_cheapest()
+            for candidate in self.grow(cost):
+                if self.is_correct(candidate):
+                    self.plist.close()
+                    # The program objects are only built for the solution.
+                    program = self.plist.bank.candidate_program(*candidate[:2])
+                    return program, self.number_evaluations, self.number_heapify_calls
             self.plist.generate_next_set_of_combinations()
             current_step += 1
         # no program found
+        self.plist.close()
         return None, self.number_evaluations, self.number_heapify_calls
 
     def synthesize(self, bound, operations, string_literals_list, integer_literals_list,
                    boolean_literals, string_variables_list,
-                   integer_variables_list):
+                   integer_variables_list, literal_tiers=None):
 
         BustlePCFG.initialize(operations, 
                               string_literals_list, 
@@ -490,29 +587,40 @@ class BeeSearch:
                               integer_variables_list
                             )
 
+        self.max_int_magnitude, self.max_string_length = value_domain_caps(
+            self._input_output, string_literals_list, integer_literals_list, self.value_domain_factor)
+
         program_solution, evaluations, reheapifies = self.search(
                                                             bound, 
                                                             string_literals_list, 
                                                             integer_literals_list,
                                                             boolean_literals, 
                                                             string_variables_list, 
-                                                            integer_variables_list
+                                                            integer_variables_list,
+                                                            literal_tiers
                                                         )
 
         return program_solution, evaluations, reheapifies
 
 
-def load_bustle_model():
+def load_bustle_model(server_address=INFERENCE_SERVER_ADDRESS):
     global BustleModel
+    if server_address is not None:
+        # The model is loaded once by the shared inference server (inference_server.py).
+        BustleModel = InferenceClient(server_address)
+        return
     # can be changed to load different models
     model_filename = models_directory + "bustle_model_01.hdf5"
     os.makedirs(os.path.dirname(model_filename), exist_ok=True)
-    BustleModel = keras_model.load_model(model_filename)
+    if USE_KERAS_MODEL:
+        # TensorFlow is optional, only imported when the Keras model is requested.
+        import tensorflow.keras.models as keras_model
+        BustleModel = keras_model.load_model(model_filename)
+    else:
+        BustleModel = NumpyBustleModel.load(model_filename, BUSTLE_MODEL_PRECISION, BUSTLE_MODEL_THREADS)
 
 
 if __name__ == "__main__":
-    load_bustle_model()
-
     TaskId = None
     log_filename = logs_directory + "/bee-search.log"
     os.makedirs(os.path.dirname(log_filename), exist_ok=True)
@@ -521,18 +629,38 @@ if __name__ == "__main__":
     Should take three arguments:
     1. TaskId (1-205) - Total number of tasks is 205 in SyGuS - sygus_string_benchmarks.txt
     2. Hard or Easy - 0 for easy, 1 for hard, if not specified, defaults to easy.
+    Optional flags:
+    --no-cache - do not read or write the solution cache.
+    --record-trace=<file> - record the search trace (see search_trace.py) to the file.
+    --replay-trace=<file> - replay a recorded trace instead of running the model.
+    The solution cache is not used when a trace is recorded or replayed.
+    --inference-server=<socket> - run the model on a shared inference server (see inference_server.py).
+    --value-domain-factor=F - reject the programs with values larger than F times the largest value of the
+      task (see value_domain_caps), the search is no longer complete. Off by default (VALUE_DOMAIN_FACTOR).
     """
+    flags = [argument for argument in sys.argv[1:] if argument.startswith("--")]
+    arguments = [argument for argument in sys.argv if not argument.startswith("--")]
+    flag_values = dict(flag[2:].split("=", 1) for flag in flags if "=" in flag)
+    trace = None
+    if "record-trace" in flag_values:
+        trace = SearchTraceWriter(flag_values["record-trace"])
+    elif "replay-trace" in flag_values:
+        trace = SearchTraceReplay(flag_values["replay-trace"])
+    use_cache = "--no-cache" not in flags and trace is None
+    value_domain_factor = float(flag_values["value-domain-factor"]) if "value-domain-factor" in flag_values \
+        else VALUE_DOMAIN_FACTOR
+
     # Assert that the number of arguments is correct.
-    assert len(sys.argv) == 2 or len(sys.argv) == 3
+    assert len(arguments) == 2 or len(arguments) == 3
     # Assert that the task id is correct.
-    assert int(sys.argv[1]) >= 1 and int(sys.argv[1]) <= 205
+    assert int(arguments[1]) >= 1 and int(arguments[1]) <= 205
     # Assert that the difficulty is correct.
-    if len(sys.argv) == 3:
-        assert int(sys.argv[2]) == 0 or int(sys.argv[2]) == 1
+    if len(arguments) == 3:
+        assert int(arguments[2]) == 0 or int(arguments[2]) == 1
 
-    difficulty = int(sys.argv[2]) if len(sys.argv) == 3 else 0
+    difficulty = int(arguments[2]) if len(arguments) == 3 else 0
 
-    slurm_task_id = sys.argv[1]
+    slurm_task_id = arguments[1]
     TaskId = int(slurm_task_id) - 1
     logging.basicConfig(filename=log_filename,
                         filemode='a',
@@ -594,25 +722,63 @@ if __name__ == "__main__":
 
     input_output_examples = specifications[4]
 
-    synthesizer = BeeSearch(
-        string_variables, integer_variables, input_output_examples)
+    # In hard mode, literals that are unrelated to the task's examples are moved to more expensive tiers.
+    literal_tiers = None
+    if (accumulate_all and RANK_HARD_MODE_LITERALS):
+        string_literals, literal_tiers = rank_literals(
+            string_literals, specifications[1], input_output_examples, string_variables)
+
+    solution_cache = SolutionCache() if use_cache else None
+    cache_key = SolutionCache.make_key(string_variables, integer_variables,
+                                       string_literals, integer_literals,
+                                       input_output_examples, dsl_functions,
+                                       "bee", difficulty, value_domain_factor)
+    cached = solution_cache.get(
+        cache_key, input_output_examples) if solution_cache is not None else None
 
     begin_time = datetime.now()
-    solution, num, reheapifies = synthesizer.synthesize(float("inf"), dsl_functions,
-                                                        string_literals,
-                                                        integer_literals,
-                                                        [True, False],
-                                                        string_variables,
-                                                        integer_variables)
+    if cached is not None:
+        solution, cache_entry = cached
+        num = cache_entry['evaluations']
+        reheapifies = cache_entry['reheapifies']
+    else:
+        # The model is only needed when the task has to be searched, and not when a trace is replayed.
+        if trace is None or not trace.replay:
+            load_bustle_model(flag_values.get("inference-server", INFERENCE_SERVER_ADDRESS))
+
+        synthesizer = BeeSearch(
+            string_variables, integer_variables, input_output_examples, trace)
+        synthesizer.value_domain_factor = value_domain_factor
+
+        solution, num, reheapifies = synthesizer.synthesize(float("inf"), dsl_functions,
+                                                            string_literals,
+                                                            integer_literals,
+                                                            [True, False],
+                                                            string_variables,
+                                                            integer_variables,
+                                                            literal_tiers)
+
+        if solution is not None and solution_cache is not None:
+            solution_cache.put(cache_key, solution, num, reheapifies=reheapifies)
+        if trace is not None:
+            trace.close()
 
     if solution is not None:
         logging.info("Benchmark: " + str(benchmark))
         logging.info("Result: Success")
         logging.info("Program: " + solution.toString())
-        logging.info("Number of evaluations: " + str(num))
+        if cached is not None:
+            # This run did not search, the counts are the ones of the run that filled the cache.
+            logging.info("Cached: True")
+            logging.info("Number of evaluations of the cached run: " + str(num))
+        else:
+            logging.info("Number of evaluations: " + str(num))
         logging.info(str(datetime.now()))
         logging.info("Time taken: " + str(datetime.now() - begin_time))
-        logging.info("Number of calls to heapify: " + str(reheapifies))
+        if cached is not None:
+            logging.info("Number of calls to heapify of the cached run: " + str(reheapifies))
+        else:
+            logging.info("Number of calls to heapify: " + str(reheapifies))
     else:
         logging.info("Benchmark: " + str(benchmark))
         logging.info("Result: Fail")
@@ -622,4 +788,12 @@ if __name__ == "__main__":
         logging.info("Time taken: " + str(datetime.now() - begin_time))
         logging.info("Number of calls to heapify: " + str(reheapifies))
 
+    if cached is None:
+        logging.info("Number of value domain rejections: " +
+                     str(synthesizer.number_value_domain_rejections))
+        logging.info("Prediction memo hits: " + str(synthesizer.plist.number_prediction_memo_hits) +
+                     " of " + str(synthesizer.plist.number_predicted_programs) + " programs")
+        logging.info("Peak property signature buffer: " + str(len(synthesizer.plist.feature_buffer)) + " rows, " +
+                     str(round(synthesizer.plist.feature_buffer.nbytes / 2 ** 20, 1)) + " MB")
+
     logging.info("\n")
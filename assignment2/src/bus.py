@@ -1,16 +1,64 @@
 from datetime import datetime
+import bisect
 import logging
+import math
+import multiprocessing
 import os
+import pickle
+import queue
 from utils import *
 from sygus_parser import StrParser
 from itertools import product
 import sys
+import numpy as np
 from sygus_string_dsl import *
+from int_bank import IntBank, VECTORIZED_OPERATIONS, BLOCK_CELLS
+from solution_cache import SolutionCache
+
+# Conditional operation -> type of its branches, grown from the outputs stored in the bank.
+CONDITIONAL_OPERATIONS = {
+    StrIte: STR_TYPES['type'],
+    IntIteInt: INT_TYPES['type'],
+}
 
 
 class ProgramsList():
     def __init__(self):
         self.plist = {}
+        # Outputs of the programs, parallel to self.plist. Boolean programs keep a bitmask over the examples.
+        self.outputs = {}
+        # Outputs of the integer programs, kept as int64 matrices for the vectorized operations.
+        self.int_bank = IntBank()
+
+    def insert(self, size, program, outputs):
+        if (program.getReturnType() == BOOL_TYPES['type']):
+            outputs = to_bitmask(outputs)
+        self.insert_stored(size, program, outputs)
+
+    """
+        Same as insert, with the outputs as they are kept in self.outputs (the bitmask of a boolean program).
+    """
+
+    def insert_stored(self, size, program, outputs):
+        if (size not in self.plist):
+            self.plist[size] = {}
+
+        if (program.getReturnType() not in self.plist[size]):
+            self.plist[size][program.getReturnType()] = []
+
+        if (size not in self.outputs):
+            self.outputs[size] = {}
+
+        if (program.getReturnType() not in self.outputs[size]):
+            self.outputs[size][program.getReturnType()] = []
+
+        # Lets a program grown in a worker process refer to its operands in the bank.
+        program.bank_position = (size, program.getReturnType(), len(self.plist[size][program.getReturnType()]))
+        self.plist[size][program.getReturnType()].append(program)
+        self.outputs[size][program.getReturnType()].append(outputs)
+
+        if (program.getReturnType() == INT_TYPES['type']):
+            self.int_bank.insert(size, outputs)
 
     def get_programs_all(self, size):
         if size in self.plist:
@@ -24,6 +72,152 @@ class ProgramsList():
     def get_programs(self, size, type):
         return self.plist[size][type] if size in self.plist and type in self.plist[size] else []
 
+    def get_outputs(self, size, type):
+        return self.outputs[size][type] if size in self.outputs and type in self.outputs[size] else []
+
+    def count_programs(self):
+        return sum(len(programs) for types in self.plist.values() for programs in types.values())
+
+
+def operand_reference(program):
+    # Operands that are not in the bank (e.g. the constant operands of BoolEqual) are sent as they are.
+    return program.bank_position if hasattr(program, 'bank_position') else program
+
+
+def resolve_operand(plist, operand):
+    return plist.plist[operand[0]][operand[1]][operand[2]] if isinstance(operand, tuple) else operand
+
+
+def grow_unit(search, operation, combination, start, stop, test_cases):
+    """
+        Runs in a worker process. Evaluates the candidates of operation.grow for the first operands
+        [start, stop) and returns [number of candidates, new candidates, value domain rejections]:
+        new candidates are (position, class, operand references, outputs) for the candidates whose outputs
+        are neither in the bank when the level started nor produced earlier in the unit, rejections are
+        the positions of the candidates rejected by the value domain caps.
+    """
+    candidates = []
+    rejections = []
+    seen = set()
+    number_candidates = 0
+    for position, program in enumerate(operation.grow(search.plist, combination, slice(start, stop))):
+        number_candidates += 1
+        rejections_before = search.value_domain_rejections
+        outputs = search.evaluate(program, test_cases)
+        if (outputs == None):
+            if (search.value_domain_rejections != rejections_before):
+                rejections.append(position)
+            continue
+
+        outputs_key = search.transform_output(outputs)
+        if (outputs_key in search.output or outputs_key in seen):
+            continue
+        seen.add(outputs_key)
+        candidates.append((position, type(program),
+                           [operand_reference(getattr(program, child)) for child in program.CHILDREN],
+                           outputs))
+
+    return [number_candidates, candidates, rejections]
+
+
+def worker_loop(search, tasks, results, updates):
+    """
+        Runs in a worker process of WorkerPool until it reads None from tasks. The bank of search is brought
+        to the version of each unit with the programs read from updates before the unit is grown.
+    """
+    version = 0
+    while True:
+        task = tasks.get()
+        if (task is None):
+            return
+
+        unit, unit_version, operation, combination, start, stop, test_cases = task
+        while (version < unit_version):
+            version, programs = pickle.loads(updates.get())
+            for size, program_class, operands, outputs in programs:
+                program = program_class(*[resolve_operand(search.plist, operand) for operand in operands])
+                search.plist.insert_stored(size, program, outputs)
+                search.output.add(outputs if program.getReturnType() == BOOL_TYPES['type'] else tuple(outputs))
+
+        try:
+            result = grow_unit(search, operation, combination, start, stop, test_cases)
+        except Exception as exception:
+            result = exception
+        results.put((unit, result))
+
+
+class WorkerPool():
+    """
+        Worker processes of a parallel Search, forked once from the search by its first parallel level and
+        closed at the end of synthesize. Each worker keeps its own copy of the bank: update sends the programs
+        added since the last update to every worker, and a unit submitted after it runs on the updated bank.
+    """
+
+    def __init__(self, search):
+        context = multiprocessing.get_context('fork')
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.updates = [context.Queue() for _ in range(search.processes)]
+        # Number of programs of each (size, type) of the bank that the workers hold.
+        self.sent = {(size, program_type): len(programs)
+                     for size, types in search.plist.plist.items() for program_type, programs in types.items()}
+        self.version = 0
+        self.next_unit = 0
+        self.finished = {}
+        self.workers = [context.Process(target=worker_loop, args=(search, self.tasks, self.results, updates),
+                                        daemon=True)
+                        for updates in self.updates]
+        for worker in self.workers:
+            worker.start()
+
+    def update(self, plist):
+        programs = []
+        for size in sorted(plist.plist):
+            for program_type, size_programs in plist.plist[size].items():
+                sent = self.sent.get((size, program_type), 0)
+                for program, outputs in zip(size_programs[sent:], plist.outputs[size][program_type][sent:]):
+                    programs.append((size, type(program),
+                                     [operand_reference(getattr(program, child)) for child in program.CHILDREN],
+                                     outputs))
+                self.sent[(size, program_type)] = len(size_programs)
+        if (len(programs) == 0):
+            return
+
+        self.version += 1
+        message = pickle.dumps([self.version, programs])
+        for updates in self.updates:
+            updates.put(message)
+
+    def submit(self, operation, combination, start, stop, test_cases):
+        unit = self.next_unit
+        self.next_unit += 1
+        self.tasks.put((unit, self.version, operation, combination, start, stop, test_cases))
+        return unit
+
+    def result(self, unit):
+        while (unit not in self.finished):
+            try:
+                finished_unit, result = self.results.get(timeout=1)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self.workers):
+                    raise RuntimeError("A worker process of the parallel search exited")
+                continue
+            self.finished[finished_unit] = result
+
+        result = self.finished.pop(unit)
+        if (isinstance(result, Exception)):
+            raise result
+        return result
+
+    def close(self):
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
+        for pending in [self.tasks, self.results] + self.updates:
+            pending.cancel_join_thread()
+            pending.close()
+
 
 class Search():
 
@@ -37,6 +231,16 @@ class Search():
         self.int_literals = []
         self.int_var = []
         self.bool_literals = []
+        # Value domain caps (see value_domain_caps), set in synthesize from value_domain_factor.
+        self.value_domain_factor = VALUE_DOMAIN_FACTOR
+        self.max_int_magnitude = None
+        self.max_string_length = None
+        self.value_domain_rejections = 0
+        # Worker processes used to grow a size level, see grow_parallel.
+        self.processes = BUS_PROCESSES
+        self.pool = None
+        # True if the programs that return ERROR on some of the examples are kept (see MultiSpecSearch).
+        self.keeps_errors = False
 
     """
         Returns [is_correct, is_equivalent]
@@ -48,6 +252,13 @@ class Search():
         if (outputs == None):
             return False, True
 
+        return self.check_outputs(program, outputs, test_cases)
+
+    """
+        Same as eval_and_equivalence_check for a program that is already evaluated.
+    """
+
+    def check_outputs(self, program, outputs, test_cases):
         iscorrect, _ = self.is_correct(outputs, test_cases)
 
         if (iscorrect):
@@ -67,40 +278,300 @@ class Search():
             yield combination
 
     def grow(self, nt_operations, test_cases, allowed_size):
+        if (self.processes > 1 and self.plist.count_programs() >= PARALLEL_MIN_BANK):
+            return self.grow_parallel(nt_operations, test_cases, allowed_size)
 
         for operation in nt_operations:
             for combination in self.findCartesianProduct(self.plist.plist.keys(), operation.ARITY):
                 if (sum(list(combination)) + 1) != allowed_size:
                     continue
 
+                if (operation in VECTORIZED_OPERATIONS):
+                    is_correct, program = self.grow_vectorized(
+                        operation, combination, test_cases, allowed_size)
+                    if (is_correct):
+                        return is_correct, program
+                    continue
+
+                if (operation in CONDITIONAL_OPERATIONS):
+                    is_correct, program = self.grow_conditional(
+                        operation, combination, test_cases, allowed_size)
+                    if (is_correct):
+                        return is_correct, program
+                    continue
+
                 for program in operation.grow(self.plist, combination):
-                    is_correct, is_equivalent = self.eval_and_equivalence_check(
-                        program, test_cases)
+                    outputs = self.evaluate(program, test_cases)
+
+                    if (outputs == None):
+                        continue
+
+                    is_correct, is_equivalent = self.check_outputs(
+                        program, outputs, test_cases)
 
                     if (is_correct):
                         return is_correct, program
 
                     if (not is_equivalent):
-                        if (allowed_size not in self.plist.plist):
-                            self.plist.plist[allowed_size] = {}
+                        self.plist.insert(allowed_size, program, outputs)
+        return False, None
+
+    """
+        Same as grow, with the candidates of the operations that are not vectorized evaluated by a pool of
+        self.processes workers (see WorkerPool). The work of the level is split per operation, size combination
+        and range of first operands; the workers read the bank as it was when the level started and return only
+        the candidates whose outputs are new (see grow_unit). Their results are merged here in the order of
+        the serial enumeration, so the bank, the solution and the number of evaluations are the same as grow's.
+    """
+
+    def grow_parallel(self, nt_operations, test_cases, allowed_size):
+        if (self.pool is None):
+            self.pool = WorkerPool(self)
+        self.pool.update(self.plist)
+
+        units = {}
+        for operation in nt_operations:
+            if (operation in VECTORIZED_OPERATIONS or operation in CONDITIONAL_OPERATIONS):
+                continue
+            for combination in self.findCartesianProduct(self.plist.plist.keys(), operation.ARITY):
+                if (sum(list(combination)) + 1) != allowed_size:
+                    continue
+                units[(operation, combination)] = self.submit_units(
+                    operation, combination, test_cases)
+
+        for operation in nt_operations:
+            for combination in self.findCartesianProduct(self.plist.plist.keys(), operation.ARITY):
+                if (sum(list(combination)) + 1) != allowed_size:
+                    continue
+
+                if (operation in VECTORIZED_OPERATIONS):
+                    is_correct, program = self.grow_vectorized(
+                        operation, combination, test_cases, allowed_size)
+                elif (operation in CONDITIONAL_OPERATIONS):
+                    is_correct, program = self.grow_conditional(
+                        operation, combination, test_cases, allowed_size)
+                else:
+                    is_correct, program = self.merge_units(
+                        units[(operation, combination)], test_cases, allowed_size)
+                if (is_correct):
+                    return is_correct, program
+
+        return False, None
+
+    def submit_units(self, operation, combination, test_cases):
+        first_operand_type = operation.OPERANDS[0].return_type
+        if (first_operand_type is None):
+            number_first_operands = len(self.plist.get_programs_all(combination[0]))
+        else:
+            number_first_operands = len(self.plist.get_programs(combination[0], first_operand_type))
+        if (number_first_operands == 0):
+            return []
+
+        step = math.ceil(number_first_operands / (self.processes * UNITS_PER_PROCESS))
+        return [self.pool.submit(operation, combination, start, start + step, test_cases)
+                for start in range(0, number_first_operands, step)]
+
+    def merge_units(self, units, test_cases, allowed_size):
+        for unit in units:
+            number_candidates, candidates, rejections = self.pool.result(unit)
+            base_evals = self.evals
+
+            for position, program_class, operands, outputs in candidates:
+                self.evals = base_evals + position + 1
+                if (self.transform_output(outputs) in self.output):
+                    continue
+
+                program = program_class(*[resolve_operand(self.plist, operand) for operand in operands])
+                is_correct, is_equivalent = self.check_outputs(
+                    program, outputs, test_cases)
 
-                        if (program.getReturnType() not in self.plist.plist[allowed_size]):
-                            self.plist.plist[allowed_size][program.getReturnType()] = [
-                            ]
+                if (is_correct):
+                    self.value_domain_rejections += bisect.bisect_left(rejections, position)
+                    return is_correct, program
+
+                if (not is_equivalent):
+                    self.plist.insert(allowed_size, program, outputs)
+
+            self.evals = base_evals + number_candidates
+            self.value_domain_rejections += len(rejections)
+
+        return False, None
+
+    """
+        Grows an integer -> integer or integer -> boolean operation over a whole layer x layer block
+        of the integer matrices of the bank. Candidates are visited in the same order as operation.grow
+        and the number of evaluations is the same; program objects are only created for candidates whose
+        outputs are new. Candidates that cannot be computed exactly in int64 are interpreted as usual.
+    """
+
+    def grow_vectorized(self, operation, combination, test_cases, allowed_size):
+        program_class, block_operation = VECTORIZED_OPERATIONS[operation]
+        layer1, layer2 = combination
+        layer1_prog = self.plist.get_programs(layer1, INT_TYPES['type'])
+        layer2_prog = self.plist.get_programs(layer2, INT_TYPES['type'])
+        if (len(layer1_prog) == 0 or len(layer2_prog) == 0):
+            return False, None
+        # Same normal form as grow_operands.
+        if (operation.COMMUTATIVE and layer1 > layer2):
+            return False, None
+
+        keep1 = np.ones(len(layer1_prog), dtype=bool)
+        keep2 = np.ones(len(layer2_prog), dtype=bool)
+        if (operation.IDENTITY is not None):
+            keep2 = np.array([not is_int_literal(prog2, operation.IDENTITY) for prog2 in layer2_prog])
+            if (operation.COMMUTATIVE):
+                keep1 = np.array([not is_int_literal(prog1, operation.IDENTITY) for prog1 in layer1_prog])
+        ordered_operands = operation.COMMUTATIVE and layer1 == layer2
+
+        values1, exact1 = self.plist.int_bank.get_matrix(layer1)
+        values2, exact2 = self.plist.int_bank.get_matrix(layer2)
+        number_examples = values1.shape[1]
+
+        if (operation.DISTINCT_OPERANDS == 'key'):
+            keys1 = np.array([prog1.getKey() for prog1 in layer1_prog])
+            keys2 = np.array([prog2.getKey() for prog2 in layer2_prog])
+
+        step = max(1, BLOCK_CELLS // (len(layer2_prog) * number_examples))
+        for start in range(0, len(layer1_prog), step):
+            stop = min(start + step, len(layer1_prog))
+            number_rows = (stop - start) * len(layer2_prog)
+
+            values, error_cells, fallback_cells = block_operation(
+                values1[start:stop, None, :], values2[None, :, :])
+            values = values.reshape(number_rows, number_examples)
+
+            # A candidate with an ERROR output on any example is discarded, or interpreted if errors are kept.
+            if (error_cells is not None):
+                error = error_cells.any(axis=2)
+            else:
+                error = np.zeros((stop - start, len(layer2_prog)), dtype=bool)
+            fallback = ~exact1[start:stop, None] | ~exact2[None, :]
+            if (fallback_cells is not None):
+                fallback = fallback | fallback_cells.any(axis=2)
+            if (self.keeps_errors):
+                fallback = fallback | error
+            candidates = keep1[start:stop, None] & keep2[None, :]
+            if (operation.DISTINCT_OPERANDS == 'key'):
+                candidates &= keys1[start:stop, None] != keys2[None, :]
+            if (ordered_operands):
+                candidates &= np.arange(start, stop)[:, None] <= np.arange(len(layer2_prog))[None, :]
+
+            candidates = candidates.ravel()
+            fallback = candidates & fallback.ravel()
+            computed = candidates & ~fallback & ~error.ravel()
+            candidate_rows = np.flatnonzero(candidates)
+
+            if (self.max_int_magnitude is not None and issubclass(program_class, Int)):
+                out_of_domain = computed & (np.abs(values) > self.max_int_magnitude).any(axis=1)
+                self.value_domain_rejections += int(np.count_nonzero(out_of_domain))
+                computed &= ~out_of_domain
+
+            # Keep the first of the rows with identical outputs in this block.
+            computed_rows = np.flatnonzero(computed)
+            _, first_rows = np.unique(values[computed_rows], axis=0, return_index=True)
+            computed_rows = computed_rows[np.sort(first_rows)]
+
+            outputs_rows = values[computed_rows].tolist()
+            computed_outputs = dict(zip(computed_rows.tolist(), outputs_rows))
+
+            rows = np.union1d(computed_rows, np.flatnonzero(fallback))
+            evaluations_before = np.searchsorted(candidate_rows, rows)
+            base_evals = self.evals
+
+            for row, evaluations in zip(rows.tolist(), evaluations_before.tolist()):
+                prog1 = layer1_prog[start + row // len(layer2_prog)]
+                prog2 = layer2_prog[row % len(layer2_prog)]
+                self.evals = base_evals + evaluations
+
+                if (row in computed_outputs):
+                    outputs = computed_outputs[row]
+                    if (self.transform_output(outputs) in self.output):
+                        continue
+                    self.evals += 1
+                    program = program_class(prog1, prog2)
+                else:
+                    program = program_class(prog1, prog2)
+                    outputs = self.evaluate(program, test_cases)
+                    if (outputs == None):
+                        continue
+
+                is_correct, is_equivalent = self.check_outputs(
+                    program, outputs, test_cases)
+
+                if (is_correct):
+                    return is_correct, program
+
+                if (not is_equivalent):
+                    self.plist.insert(allowed_size, program, outputs)
+
+            self.evals = base_evals + len(candidate_rows)
+
+        return False, None
+
+    """
+        Grows an ite operation from the outputs of the bank: the outputs of a candidate are taken from the
+        true or the false case according to the bitmask of the condition, no program is interpreted.
+        Conditions that are true or false on every example are skipped, the candidate would be equivalent
+        to one of its cases. A condition that is ERROR on an example (see to_bitmask) gives ERROR there, and
+        one that is true on every other example is skipped too: the true case solves every specification
+        that the candidate would solve.
+    """
+
+    def grow_conditional(self, operation, combination, test_cases, allowed_size):
+        case_type = CONDITIONAL_OPERATIONS[operation]
+        layer1, layer2, layer3 = combination
+        layer1_prog = self.plist.get_programs(layer1, BOOL_TYPES['type'])
+        layer1_masks = self.plist.get_outputs(layer1, BOOL_TYPES['type'])
+        layer2_prog = self.plist.get_programs(layer2, case_type)
+        layer2_outputs = self.plist.get_outputs(layer2, case_type)
+        layer3_prog = self.plist.get_programs(layer3, case_type)
+        layer3_outputs = self.plist.get_outputs(layer3, case_type)
+
+        number_examples = len(test_cases)
+        full_mask = (1 << number_examples) - 1
+        for prog1, mask in zip(layer1_prog, layer1_masks):
+            errors = mask >> number_examples
+            mask &= full_mask
+            if (mask == 0 or mask | errors == full_mask):
+                continue
+            selectors = bitmask_selectors(mask, number_examples)
+            if (errors):
+                selectors = [ERROR if error else selector
+                             for selector, error in zip(selectors, bitmask_selectors(errors, number_examples))]
+
+            for prog2, outputs2 in zip(layer2_prog, layer2_outputs):
+                for prog3, outputs3 in zip(layer3_prog, layer3_outputs):
+                    if (prog2 is prog3):
+                        continue
+                    self.evals += 1
+                    outputs = tuple([ERROR if selector is ERROR else output2 if selector else output3
+                                     for selector, output2, output3 in zip(selectors, outputs2, outputs3)])
+                    if (outputs in self.output):
+                        continue
+
+                    program = operation(prog1, prog2, prog3)
+                    is_correct, is_equivalent = self.check_outputs(
+                        program, outputs, test_cases)
+
+                    if (is_correct):
+                        return is_correct, program
+
+                    if (not is_equivalent):
+                        self.plist.insert(allowed_size, program, outputs)
 
-                        self.plist.plist[allowed_size][program.getReturnType()
-                                                       ].append(program)
         return False, None
 
     def evaluate(self, program, test_cases):
         self.evals += 1
         outputs = []
         for test_case in test_cases:
-            try:
-                output = program.interpret(test_case)
-                outputs.append(output)
-            except:
+            output = program.interpret(test_case)
+            if (output is ERROR):
                 return None
+            outputs.append(output)
+        if not within_value_domain(outputs, self.max_int_magnitude, self.max_string_length):
+            self.value_domain_rejections += 1
+            return None
         return outputs
 
     def is_correct(self, outputs, test_cases):
@@ -111,14 +582,19 @@ class Search():
         # returns [is_correct, is_partially_correct, results]
         return [False, results]
 
+    def set_value_domain(self, test_cases, str_literals, int_literals):
+        self.max_int_magnitude, self.max_string_length = value_domain_caps(
+            test_cases, str_literals, int_literals, self.value_domain_factor)
+
+    """
+        Key of the outputs in the equivalence set: the bitmask of a boolean program (an integer, it never
+        equals the tuple of outputs of a string or integer program), the tuple of outputs otherwise.
+    """
+
     def transform_output(self, outputs):
-        new_outputs = []
-        for output in outputs:
-            if (type(output) is bool):
-                new_outputs.append(str(output))
-            else:
-                new_outputs.append(output)
-        return tuple(new_outputs)
+        if (len(outputs) > 0 and type(outputs[0]) is bool):
+            return to_bitmask(outputs)
+        return tuple(outputs)
 
     def transform_terminals(self, terminals, type):
         if (len(terminals) == 0):
@@ -144,7 +620,15 @@ class Search():
 
         return new_terminals
 
-    def synthesize(self, bound, grammar_nt, str_var, str_literals, int_var, int_literals, test_cases):
+    """
+        literal_tiers optionally maps string literals to a cost tier (see rank_literals),
+        a literal of tier t enters the bank with size 1 + t instead of 1.
+    """
+
+    def synthesize(self, bound, grammar_nt, str_var, str_literals, int_var, int_literals, test_cases,
+                   literal_tiers=None):
+
+        self.set_value_domain(test_cases, str_literals, int_literals)
 
         # Create program from for constants and args.
         bool_literals = [str(True), str(False)]
@@ -158,27 +642,150 @@ class Search():
 
         self.plist.plist[1] = {}
         for terminal in terminals:
-            is_correct, is_equivalent = self.eval_and_equivalence_check(
-                terminal, test_cases)
+            outputs = self.evaluate(terminal, test_cases)
+            if (outputs == None):
+                continue
+
+            is_correct, is_equivalent = self.check_outputs(
+                terminal, outputs, test_cases)
             if (is_correct):  # if the terminal is correct, return it
                 return terminal, self.evals
 
             if (not is_equivalent):
-                if (terminal.getReturnType() not in self.plist.plist[1]):
-                    self.plist.plist[1][terminal.getReturnType()] = []
-                self.plist.plist[1][terminal.getReturnType()].append(terminal)
+                size = 1
+                if (literal_tiers is not None and isinstance(terminal, StrLiteral)):
+                    size += literal_tiers.get(terminal.value, 0)
+                self.plist.insert(size, terminal, outputs)
 
         current_size = 2
-        while (current_size <= bound):
-            prog_found, prog = self.grow(
-                grammar_nt, test_cases, current_size)
-            current_size += 1
-            if (prog_found):
-                return prog, self.evals
+        try:
+            while (current_size <= bound):
+                prog_found, prog = self.grow(
+                    grammar_nt, test_cases, current_size)
+                current_size += 1
+                if (prog_found):
+                    return prog, self.evals
+        finally:
+            if (self.pool is not None):
+                self.pool.close()
+                self.pool = None
 
         return None, self.evals
 
 
+class MultiSpecSearch(Search):
+    """
+        Shared enumeration for a family of specifications that use the same variables,
+        e.g. bikes / bikes-long / bikes-long-repeat / bikes_small.
+
+        Every candidate is evaluated once on the union of the inputs of all specifications.
+        Its outputs are then projected on the examples of each specification and looked up
+        by target output tuple, so one bank is enumerated for the whole family.
+
+        A candidate that returns ERROR on some of the inputs is kept, with ERROR in their slots:
+        it still solves the specifications that do not have these inputs.
+    """
+
+    def __init__(self, benchmarks, test_cases_list):
+        super().__init__()
+        self.keeps_errors = True
+        self.solutions = {benchmark: None for benchmark in benchmarks}
+        self.solution_evals = {benchmark: None for benchmark in benchmarks}
+        self.unsolved = len(benchmarks)
+
+        variables = [key for key in test_cases_list[0][0] if key != self.TEST_OUT_STR]
+
+        # Union of the inputs of all specifications, in the order they are first seen.
+        self.inputs = []
+        input_index = {}
+
+        """
+        self.targets has a structure like this:
+        {(indices into self.inputs):
+            {(target outputs): [benchmarks], ...},
+         ...
+        }
+        """
+        self.targets = {}
+        self.family_test_cases = [test_case for test_cases in test_cases_list for test_case in test_cases]
+        for benchmark, test_cases in zip(benchmarks, test_cases_list):
+            indices = []
+            for test_case in test_cases:
+                assert sorted(variables) == sorted(
+                    key for key in test_case if key != self.TEST_OUT_STR), \
+                    "specifications in a family must share the same variables"
+                input_key = tuple(test_case[variable] for variable in variables)
+                if input_key not in input_index:
+                    input_index[input_key] = len(self.inputs)
+                    self.inputs.append(
+                        {variable: test_case[variable] for variable in variables})
+                indices.append(input_index[input_key])
+
+            target = tuple(test_case[self.TEST_OUT_STR] for test_case in test_cases)
+            self.targets.setdefault(tuple(indices), {}).setdefault(
+                target, []).append(benchmark)
+
+    """
+        Returns [all_specs_solved, is_equivalent]
+    """
+
+    def check_outputs(self, program, outputs, test_cases):
+        # A candidate that fails on every input cannot solve any specification.
+        if (all(output is ERROR for output in outputs)):
+            return self.unsolved == 0, True
+
+        self.record_solutions(program, outputs)
+
+        outputs_tuple = self.transform_output(outputs)
+        outputs_exists = outputs_tuple in self.output
+
+        if (not outputs_exists):
+            self.output.add(outputs_tuple)
+
+        return self.unsolved == 0, outputs_exists
+
+    def set_value_domain(self, test_cases, str_literals, int_literals):
+        # The caps also account for the outputs of every specification.
+        super().set_value_domain(self.family_test_cases, str_literals, int_literals)
+
+    def evaluate(self, program, test_cases):
+        # Same as Search.evaluate, an ERROR output is kept in its slot instead of discarding the program.
+        self.evals += 1
+        outputs = [program.interpret(test_case) for test_case in test_cases]
+        if not within_value_domain(outputs, self.max_int_magnitude, self.max_string_length):
+            self.value_domain_rejections += 1
+            return None
+        return outputs
+
+    def transform_output(self, outputs):
+        # The type of the outputs is the type of the first one that is not ERROR.
+        for output in outputs:
+            if (output is not ERROR):
+                return to_bitmask(outputs) if type(output) is bool else tuple(outputs)
+        return tuple(outputs)
+
+    def record_solutions(self, program, outputs):
+        for indices in list(self.targets):
+            targets = self.targets[indices]
+            projected = tuple(outputs[index] for index in indices)
+            if any(output is ERROR for output in projected) or projected not in targets:
+                continue
+
+            for benchmark in targets.pop(projected):
+                self.solutions[benchmark] = program
+                self.solution_evals[benchmark] = self.evals
+                self.unsolved -= 1
+
+            if (len(targets) == 0):
+                del self.targets[indices]
+
+    def synthesize(self, bound, grammar_nt, str_var, str_literals, int_var, int_literals,
+                   literal_tiers=None):
+        super().synthesize(bound, grammar_nt, str_var, str_literals,
+                           int_var, int_literals, self.inputs, literal_tiers)
+        return self.solutions, self.solution_evals, self.evals
+
+
 if __name__ == "__main__":
 
     TaskId = None
@@ -188,20 +795,43 @@ if __name__ == "__main__":
     """
     Should take three arguments:
     1. TaskId (1-205) - Total number of tasks is 205 in SyGuS - sygus_string_benchmarks.txt
+       A comma separated list of TaskIds (e.g. 29,30,31,32) enumerates them together with a shared bank.
+       The tasks must share the same variables, e.g. a benchmark family like bikes / bikes-long / bikes_small.
     2. Hard or Easy - 0 for easy, 1 for hard, if not specified, defaults to easy.
+    Optional flags:
+    --no-cache - do not read or write the solution cache.
+    --processes=N - grow each size level of the bank with N worker processes (default BUS_PROCESSES).
+    --value-domain-factor=F - reject the programs with values larger than F times the largest value of the
+      task (see value_domain_caps), the search is no longer complete. Off by default (VALUE_DOMAIN_FACTOR).
     """
+    flags = [argument for argument in sys.argv[1:] if argument.startswith("--")]
+    arguments = [argument for argument in sys.argv if not argument.startswith("--")]
+    use_cache = "--no-cache" not in flags
+    processes = BUS_PROCESSES
+    value_domain_factor = VALUE_DOMAIN_FACTOR
+    for flag in flags:
+        if flag.startswith("--processes="):
+            processes = int(flag.split("=", 1)[1])
+        elif flag.startswith("--value-domain-factor="):
+            value_domain_factor = float(flag.split("=", 1)[1])
+    assert processes >= 1
+
     # Assert that the number of arguments is correct.
-    assert len(sys.argv) == 2 or len(sys.argv) == 3
-    # Assert that the task id is correct.
-    assert int(sys.argv[1]) >= 1 and int(sys.argv[1]) <= 205
+    assert len(arguments) == 2 or len(arguments) == 3
+    # Assert that the task ids are correct.
+    task_ids = [int(task_id) for task_id in arguments[1].split(",")]
+    for task_id in task_ids:
+        assert task_id >= 1 and task_id <= 205
     # Assert that the difficulty is correct.
-    if len(sys.argv) == 3:
-        assert int(sys.argv[2]) == 0 or int(sys.argv[2]) == 1
+    if len(arguments) == 3:
+        assert int(arguments[2]) == 0 or int(arguments[2]) == 1
 
-    difficulty = int(sys.argv[2]) if len(sys.argv) == 3 else 0
+    difficulty = int(arguments[2]) if len(arguments) == 3 else 0
 
-    slurm_task_id = sys.argv[1]
-    TaskId = int(slurm_task_id) - 1
+    slurm_task_id = arguments[1]
+    TaskIds = [task_id - 1 for task_id in task_ids]
+    TaskId = TaskIds[0] if len(TaskIds) == 1 else ",".join(
+        str(task_id) for task_id in TaskIds)
     logging.basicConfig(filename=log_filename,
                         filemode='a',
                         format="[Task: " +
@@ -239,57 +869,130 @@ if __name__ == "__main__":
         all_alphabets = list(uppercase_alphabets.union(uppercase_alphabets))
         string_literals = list(set(string_literals + all_alphabets))
 
-    # Get the problem.
-    benchmark = None
-    filename = benchmarks[TaskId]
-
-    benchmark = filename
-
-    specification_parser = StrParser(benchmark)
-    specifications = specification_parser.parse()
+    # Get the problems.
+    family = [benchmarks[task_id] for task_id in TaskIds]
+    family_specifications = [StrParser(benchmark).parse() for benchmark in family]
+    benchmark = family[0]
+    specifications = family_specifications[0]
     # logging.info("\n")
 
+    # A family is synthesized with the literals of all of its tasks.
+    family_string_literals = list(specifications[1])
+    family_integer_literals = list(specifications[3])
+    for family_specification in family_specifications[1:]:
+        family_string_literals += [literal for literal in family_specification[1]
+                                   if literal not in family_string_literals]
+        family_integer_literals += [literal for literal in family_specification[3]
+                                    if literal not in family_integer_literals]
+
     if (not accumulate_all):
         string_variables = specifications[0]
-        string_literals = specifications[1]
+        string_literals = family_string_literals
         integer_variables = specifications[2]
-        integer_literals = specifications[3]
+        integer_literals = family_integer_literals
     else:
         string_variables = specifications[0]
         integer_variables = specifications[2]
-        string_literals = list(set(specifications[1] + string_literals))
-        integer_literals = list(set(specifications[3] + integer_literals))
+        string_literals = list(set(family_string_literals + string_literals))
+        integer_literals = list(set(family_integer_literals + integer_literals))
 
     input_output_examples = specifications[4]
 
-    # Synthesizer
-    synthesizer = Search()
+    # In hard mode, literals that are unrelated to the task's examples are moved to more expensive tiers.
+    literal_tiers = None
+    if (accumulate_all and RANK_HARD_MODE_LITERALS):
+        string_literals, literal_tiers = rank_literals(
+            string_literals, family_string_literals,
+            [test_case for family_specification in family_specifications
+             for test_case in family_specification[4]],
+            string_variables)
 
     begin_time = datetime.now()
 
-    # passing bound as 1000
-    solution, num = synthesizer.synthesize(1000, dsl_functions, 
-                                           string_variables, 
-                                           string_literals,
-                                           integer_variables, 
-                                           integer_literals, 
-                                           input_output_examples)
-
-    time_taken = str(datetime.now() - begin_time)
-
-    if solution is not None:
-        logging.info("Benchmark: " + str(benchmark))
-        logging.info("Result: Success")
-        logging.info("Program: " + solution.toString())
-        logging.info("Number of evaluations: " + str(num))
+    if len(family) > 1:
+        synthesizer = MultiSpecSearch(
+            family, [family_specification[4] for family_specification in family_specifications])
+        synthesizer.processes = processes
+        synthesizer.value_domain_factor = value_domain_factor
+
+        # passing bound as 1000
+        solutions, solution_evals, num = synthesizer.synthesize(1000, dsl_functions,
+                                                                string_variables,
+                                                                string_literals,
+                                                                integer_variables,
+                                                                integer_literals,
+                                                                literal_tiers)
+
+        for benchmark in family:
+            solution = solutions[benchmark]
+            logging.info("Benchmark: " + str(benchmark))
+            if solution is not None:
+                logging.info("Result: Success")
+                logging.info("Program: " + solution.toString())
+                logging.info("Number of evaluations: " + str(solution_evals[benchmark]))
+            else:
+                logging.info("Result: Fail")
+                logging.info("Program: None")
+                logging.info("Number of evaluations: " + str(num))
+        logging.info("Total number of evaluations: " + str(num))
+        logging.info("Number of value domain rejections: " +
+                     str(synthesizer.value_domain_rejections))
         logging.info(str(datetime.now()))
         logging.info("Time taken: " + str(datetime.now() - begin_time))
     else:
-        logging.info("Benchmark: " + str(benchmark))
-        logging.info("Result: Fail")
-        logging.info("Program: None")
-        logging.info("Number of evaluations: " + str(num))
-        logging.info(str(datetime.now()))
-        logging.info("Time taken: " + str(datetime.now() - begin_time))
+        solution_cache = SolutionCache() if use_cache else None
+        cache_key = SolutionCache.make_key(string_variables, integer_variables,
+                                           string_literals, integer_literals,
+                                           input_output_examples, dsl_functions,
+                                           "bus", difficulty, value_domain_factor)
+        cached = solution_cache.get(
+            cache_key, input_output_examples) if solution_cache is not None else None
+
+        if cached is not None:
+            solution, cache_entry = cached
+            num = cache_entry['evaluations']
+        else:
+            # Synthesizer
+            synthesizer = Search()
+            synthesizer.processes = processes
+            synthesizer.value_domain_factor = value_domain_factor
+
+            # passing bound as 1000
+            solution, num = synthesizer.synthesize(1000, dsl_functions, 
+                                                   string_variables, 
+                                                   string_literals,
+                                                   integer_variables, 
+                                                   integer_literals, 
+                                                   input_output_examples,
+                                                   literal_tiers)
+
+            if solution is not None and solution_cache is not None:
+                solution_cache.put(cache_key, solution, num)
+
+        time_taken = str(datetime.now() - begin_time)
+
+        if solution is not None:
+            logging.info("Benchmark: " + str(benchmark))
+            logging.info("Result: Success")
+            logging.info("Program: " + solution.toString())
+            if cached is not None:
+                # This run did not search, the evaluations were counted by the run that filled the cache.
+                logging.info("Cached: True")
+                logging.info("Number of evaluations of the cached run: " + str(num))
+            else:
+                logging.info("Number of evaluations: " + str(num))
+            logging.info(str(datetime.now()))
+            logging.info("Time taken: " + str(datetime.now() - begin_time))
+        else:
+            logging.info("Benchmark: " + str(benchmark))
+            logging.info("Result: Fail")
+            logging.info("Program: None")
+            logging.info("Number of evaluations: " + str(num))
+            logging.info(str(datetime.now()))
+            logging.info("Time taken: " + str(datetime.now() - begin_time))
+
+        if cached is None:
+            logging.info("Number of value domain rejections: " +
+                         str(synthesizer.value_domain_rejections))
 
     logging.info("\n\n")
@@ -0,0 +1,256 @@
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+
+"""
+NumPy inference for the BUSTLE cost model.
+
+The model is a small Keras MLP saved as HDF5. Its layers are read from the 'model_config' attribute and its
+weights from the 'model_weights' group with h5py, the forward pass is a chain of float32 matmuls. TensorFlow is
+only needed to compare against Keras (see check_parity).
+
+The first Dense layer holds almost all the weights (property signature length x units), it can be stored in
+float16 or int8 (see quantize_kernel). The rows of a batch can also be split between threads, NumPy releases the
+GIL in the matmuls.
+"""
+
+
+def softmax(x):
+    exponentials = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return exponentials / np.sum(exponentials, axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': softmax,
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+}
+
+# Layers that are the identity at inference time.
+PASS_THROUGH_LAYERS = ('InputLayer', 'Dropout', 'Flatten')
+
+# Storage precisions of the kernel of the first Dense layer.
+PRECISIONS = ('float32', 'float16', 'int8')
+
+
+def decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class NumpyBustleModel:
+    """
+        Drop-in replacement of the Keras model for inference: predict(features) returns the same
+        (programs x outputs) float32 array as keras.Model.predict.
+    """
+
+    def __init__(self, layers, precision='float32', threads=1):
+        # [(kind, parameters), ...] applied in order, a first Dense layer is stored as an 'input' layer.
+        self.layers = layers
+        if layers and layers[0][0] == 'dense':
+            kernel, bias, activation = layers[0][1]
+            self.layers = [('input', quantize_kernel(kernel, precision) + (bias, activation))] + layers[1:]
+        self.precision = precision
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+    @classmethod
+    def load(cls, filename, precision='float32', threads=1):
+        with h5py.File(filename, 'r') as f:
+            model_config = json.loads(decode(f.attrs['model_config']))
+            weights = f['model_weights'] if 'model_weights' in f else f
+
+            layers_config = model_config['config']
+            if isinstance(layers_config, dict):
+                layers_config = layers_config['layers']
+
+            layers = []
+            for layer in layers_config:
+                kind = layer['class_name']
+                config = layer['config']
+                if kind in PASS_THROUGH_LAYERS:
+                    continue
+                parameters = [np.asarray(weights[config['name']][decode(weight_name)], dtype=np.float32)
+                              for weight_name in weights[config['name']].attrs['weight_names']]
+                if kind == 'Dense':
+                    bias = parameters[1] if config.get('use_bias', True) else None
+                    layers.append(('dense', (parameters[0], bias, get_activation(config.get('activation')))))
+                elif kind == 'Activation':
+                    layers.append(('activation', get_activation(config['activation'])))
+                elif kind == 'BatchNormalization':
+                    gamma, beta, mean, variance = batch_normalization_parameters(config, parameters)
+                    scale = gamma / np.sqrt(variance + np.float32(config.get('epsilon', 1e-3)))
+                    layers.append(('scale', (scale, beta - mean * scale)))
+                else:
+                    raise ValueError("Layer " + kind + " is not supported by the NumPy BUSTLE model")
+        return cls(layers, precision, threads)
+
+    def predict(self, features, verbose=0):
+        features = np.asarray(features, dtype=np.float32)
+        if self.executor is None or len(features) < 2 * self.threads:
+            return self.forward(features)
+        return np.concatenate(list(self.executor.map(self.forward, np.array_split(features, self.threads))))
+
+    def forward(self, features):
+        outputs = features
+        for kind, parameters in self.layers:
+            if kind == 'input':
+                weights, scale, bias, activation = parameters
+                outputs = outputs @ weights.astype(np.float32)
+                if scale is not None:
+                    outputs *= scale
+                if bias is not None:
+                    outputs += bias
+                outputs = activation(outputs)
+            elif kind == 'dense':
+                kernel, bias, activation = parameters
+                outputs = outputs @ kernel
+                if bias is not None:
+                    outputs += bias
+                outputs = activation(outputs)
+            elif kind == 'scale':
+                scale, offset = parameters
+                outputs = outputs * scale + offset
+            else:
+                outputs = parameters(outputs)
+        return outputs
+
+
+def get_activation(name):
+    name = 'linear' if name is None else name
+    if name not in ACTIVATIONS:
+        raise ValueError("Activation " + name + " is not supported by the NumPy BUSTLE model")
+    return ACTIVATIONS[name]
+
+
+def quantize_kernel(kernel, precision):
+    """
+        (weights, scale) with kernel ~ weights * scale: weights are stored in the given precision, scale is None
+        except for int8, which is quantized symmetrically with one scale per unit.
+    """
+    if precision == 'float32':
+        return kernel, None
+    if precision == 'float16':
+        return kernel.astype(np.float16), None
+    if precision == 'int8':
+        scale = np.max(np.abs(kernel), axis=0) / np.float32(127)
+        scale[scale == 0] = 1
+        return np.round(kernel / scale).astype(np.int8), scale.astype(np.float32)
+    raise ValueError("Precision " + str(precision) + " is not one of " + ", ".join(PRECISIONS))
+
+
+def batch_normalization_parameters(config, parameters):
+    # gamma and beta are only stored when scale and center are enabled.
+    parameters = list(parameters)
+    size = parameters[-1].shape[0]
+    gamma = parameters.pop(0) if config.get('scale', True) else np.ones(size, dtype=np.float32)
+    beta = parameters.pop(0) if config.get('center', True) else np.zeros(size, dtype=np.float32)
+    return gamma, beta, parameters[0], parameters[1]
+
+
+def check_parity(filename, number_rows=1000, tolerance=1e-5, seed=0):
+    """
+        Compares the NumPy model with Keras on random property signatures (0/1 features, like the one-hot
+        encoding of populate_sub_program_ps). Returns the largest absolute difference, raises if it is above
+        the tolerance.
+    """
+    import tensorflow.keras.models as keras_model
+
+    keras_bustle_model = keras_model.load_model(filename)
+    numpy_bustle_model = NumpyBustleModel.load(filename)
+
+    number_features = keras_bustle_model.input_shape[-1]
+    features = np.random.default_rng(seed).integers(0, 2, size=(number_rows, number_features)).astype(np.float32)
+
+    difference = np.max(np.abs(keras_bustle_model.predict(features, verbose=0) -
+                               numpy_bustle_model.predict(features)))
+    if not difference <= tolerance:
+        raise AssertionError("NumPy and Keras predictions differ by " + str(difference))
+    return difference
+
+
+def random_signatures(number_rows, number_features, sub_program_length, seed=0):
+    """
+        Stand-in for recorded property signatures: one-hot groups of 4 columns, the problem part (all the columns
+        before the last sub_program_length) is the same in every row like in the batches of Bee.
+    """
+    rng = np.random.default_rng(seed)
+    signatures = np.zeros((number_rows, number_features), dtype=np.float32)
+    groups = rng.integers(0, 4, size=(number_rows, number_features // 4))
+    groups[:, :(number_features - sub_program_length) // 4] = groups[0, :(number_features - sub_program_length) // 4]
+    signatures.reshape(number_rows, -1, 4)[np.arange(number_rows)[:, None], np.arange(groups.shape[1]), groups] = 1
+    return signatures
+
+
+def check_accuracy(filename, signatures, precision='int8', threads=1):
+    """
+        Compares the model in the given mode with the float32 model on held-out property signatures. Returns the
+        largest absolute difference of the probabilities and the fraction of the signatures whose cost in Bee,
+        round(-log2(probability)), changes.
+    """
+    reference = NumpyBustleModel.load(filename).predict(signatures)
+    predictions = NumpyBustleModel.load(filename, precision, threads).predict(signatures)
+    difference = float(np.max(np.abs(reference - predictions)))
+    # a probability rounded to 0 would give an infinite cost
+    tiny = np.finfo(np.float32).tiny
+    changed_costs = float(np.mean(np.round(-np.log2(np.clip(reference, tiny, 1))) !=
+                                  np.round(-np.log2(np.clip(predictions, tiny, 1)))))
+    return difference, changed_costs
+
+
+def benchmark(filename, signatures, batch_sizes=(1000, 10000, 100000), precision='int8', threads=1, repeat=3):
+    """
+        [(batch size, seconds of the float32 model, seconds of the model in the given mode), ...], the
+        batches repeat the rows of signatures (which should come from one task, like the batches of Bee).
+    """
+    models = [NumpyBustleModel.load(filename), NumpyBustleModel.load(filename, precision, threads)]
+    timings = []
+    for batch_size in batch_sizes:
+        batch = np.resize(signatures, (batch_size, signatures.shape[1]))
+        seconds = []
+        for model in models:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                model.predict(batch)
+            seconds.append((time.perf_counter() - start) / repeat)
+        timings.append((batch_size,) + tuple(seconds))
+    return timings
+
+
+if __name__ == "__main__":
+    """
+    Parity check against Keras, requires TensorFlow:
+    python bustle_model.py [model file], defaults to the model loaded by bee.py.
+    Accuracy and speed of an inference mode against the float32 model:
+    python bustle_model.py accuracy|benchmark [model file] [signatures .npy file],
+    with the mode of utils.py (BUSTLE_MODEL_*), the signatures default to random_signatures.
+    """
+    from utils import models_directory, SUB_PROGRAM_PS_LENGTH, BUSTLE_MODEL_PRECISION, BUSTLE_MODEL_THREADS
+
+    command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] in ('accuracy', 'benchmark') else None
+    arguments = sys.argv[2:] if command else sys.argv[1:]
+    model_filename = arguments[0] if len(arguments) > 0 else models_directory + "bustle_model_01.hdf5"
+    mode = (BUSTLE_MODEL_PRECISION, BUSTLE_MODEL_THREADS)
+
+    if command is None:
+        print("Largest difference with Keras: " + str(check_parity(model_filename)))
+    else:
+        if len(arguments) > 1:
+            held_out_signatures = np.load(arguments[1]).astype(np.float32)
+        else:
+            number_features = NumpyBustleModel.load(model_filename).layers[0][1][0].shape[0]
+            held_out_signatures = random_signatures(10000, number_features, SUB_PROGRAM_PS_LENGTH)
+        if command == 'accuracy':
+            difference, changed_costs = check_accuracy(model_filename, held_out_signatures, *mode)
+            print("Precision " + mode[0] + ": largest difference " + str(difference) + ", " +
+                  str(round(100 * changed_costs, 3)) + "% of the costs change")
+        else:
+            for batch_size, float32_seconds, mode_seconds in benchmark(model_filename, held_out_signatures, *mode):
+                print(str(batch_size) + " rows: float32 " + str(round(float32_seconds, 4)) + "s, " +
+                      mode[0] + ", " + str(mode[1]) + " thread(s) " + str(round(mode_seconds, 4)) + "s")
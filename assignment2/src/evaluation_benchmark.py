@@ -0,0 +1,126 @@
+import sys
+import time
+
+import sygus_string_dsl
+from bus import Search
+from sygus_parser import StrParser
+from sygus_string_dsl import *
+from utils import *
+
+"""
+Evaluations per second of BUS on error-heavy tasks.
+
+Most of the candidates of these tasks fail on some example (IndexOf of a substring that is not there, CharAt out
+of range, StrToInt of a non numeric string). Each task is enumerated up to a bound with Search, without value
+domain caps, and the number of evaluations, the share of them that fail and the evaluations per second are
+printed. The tasks only use Search.synthesize: run the script on the commit before the ERROR sentinel for the
+numbers of the exception based interpreter.
+
+The error path is also measured alone: an always failing CharAt evaluated as Search.evaluate does (ERROR
+sentinel), against the same program written with the exception based interpreter and its try/except.
+"""
+
+DSL_FUNCTIONS = [StrConcat, StrReplace, StrSubstr, StrIte, StrIntToStr, StrCharAt, StrLower, StrUpper, IntStrToInt,
+                 IntPlus, IntMinus, IntLength, IntIteInt, IntIndexOf, IntFirstIndexOf, IntMultiply, IntModulo,
+                 BoolEqual, BoolContain, BoolSuffixof, BoolPrefixof, BoolGreaterThan, BoolLessThan]
+
+# exceljet1, phone-6-short, phone-6, count-consecutive-monthly-orders
+ERROR_HEAVY_TASKS = [57, 133, 134, 45]
+
+
+class BenchmarkSearch(Search):
+    """
+        Search without value domain caps that counts the evaluations that fail.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.failed_evaluations = 0
+
+    def set_value_domain(self, test_cases, str_literals, int_literals):
+        pass
+
+    def evaluate(self, program, test_cases):
+        outputs = super().evaluate(program, test_cases)
+        if (outputs is None):
+            self.failed_evaluations += 1
+        return outputs
+
+
+def benchmark_task(benchmark, bound):
+    """
+        Returns [evaluations, failed evaluations, seconds] of the enumeration of the task up to bound.
+    """
+    specifications = StrParser(benchmark).parse()
+    synthesizer = BenchmarkSearch()
+    start = time.perf_counter()
+    synthesizer.synthesize(bound, DSL_FUNCTIONS, specifications[0], specifications[1], specifications[2],
+                           specifications[3], specifications[4])
+    return [synthesizer.evals, synthesizer.failed_evaluations, time.perf_counter() - start]
+
+
+class RaisingCharAt(StrCharAt):
+    __slots__ = ()
+
+    # StrCharAt.interpret of the exception based interpreter.
+    def interpret(self, env):
+        index = self.pos.interpret(env)
+        string_element = self.str.interpret(env)
+        return string_element[index]
+
+
+def exception_evaluate(program, test_cases):
+    # Search.evaluate of the exception based interpreter.
+    outputs = []
+    for test_case in test_cases:
+        try:
+            outputs.append(program.interpret(test_case))
+        except:
+            return None
+    return outputs
+
+
+def benchmark_error_path(number_evaluations=200000, number_examples=7):
+    """
+        Returns [evaluations per second with ERROR, evaluations per second with exceptions] of a CharAt that
+        fails on the first example.
+    """
+    test_cases = [{'name': 'abc', 'out': ''} for _ in range(number_examples)]
+    search = BenchmarkSearch()
+    sentinel_program = StrCharAt(StrVar('name'), IntLiteral(10))
+    raising_program = RaisingCharAt(StrVar('name'), IntLiteral(10))
+
+    start = time.perf_counter()
+    for _ in range(number_evaluations):
+        search.evaluate(sentinel_program, test_cases)
+    sentinel_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(number_evaluations):
+        exception_evaluate(raising_program, test_cases)
+    exception_seconds = time.perf_counter() - start
+    return [number_evaluations / sentinel_seconds, number_evaluations / exception_seconds]
+
+
+if __name__ == "__main__":
+    """
+    python src/evaluation_benchmark.py [bound] [comma separated TaskIds], from the directory of config/, the
+    bound defaults to 7 and the tasks to ERROR_HEAVY_TASKS.
+    """
+    bound = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    task_ids = [int(task_id) for task_id in sys.argv[2].split(",")] if len(sys.argv) > 2 else ERROR_HEAVY_TASKS
+
+    with open(config_directory + "sygus_string_benchmarks.txt") as f:
+        benchmarks = f.read().splitlines()
+
+    for task_id in task_ids:
+        evaluations, failed_evaluations, seconds = benchmark_task(benchmarks[task_id - 1], bound)
+        print(benchmarks[task_id - 1] + ": " + str(evaluations) + " evaluations (" +
+              str(round(100 * failed_evaluations / evaluations, 1)) + "% fail) in " + str(round(seconds, 2)) +
+              "s, " + str(round(evaluations / seconds)) + " evaluations/s")
+
+    # The commits before the ERROR sentinel only have the exception based interpreter.
+    if hasattr(sygus_string_dsl, 'ERROR'):
+        sentinel_rate, exception_rate = benchmark_error_path()
+        print("Always failing CharAt: " + str(round(sentinel_rate)) + " evaluations/s with ERROR, " +
+              str(round(exception_rate)) + " evaluations/s with exceptions")
@@ -0,0 +1,253 @@
+import copy
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from bustle_model import NumpyBustleModel, random_signatures
+from utils import *
+
+"""
+Shared inference server for concurrent Bee searches.
+
+The server loads the BUSTLE model once and listens on a Unix socket. Every connection is a search (bee.py with
+--inference-server) that sends the property signatures of its programs and waits for their probabilities. The
+requests of all the connections go through one queue: the model thread runs the model on the rows of each request
+on their own, so the predictions of a request are the ones of the model in the search and do not depend on the
+requests of the other searches.
+
+A message is a header (number of rows, number of columns, little endian uint32) followed by the float32 rows. A
+request that can not be scored (its number of columns is not the input size of the model) is answered with the
+header (ERROR_ROWS, length of the message) followed by the UTF-8 error message, the connection stays open.
+"""
+
+HEADER = struct.Struct('<II')
+
+# Number of rows of the header of an error answer.
+ERROR_ROWS = 0xFFFFFFFF
+
+
+def read_exactly(stream, number_bytes):
+    data = stream.read(number_bytes)
+    if data is None or len(data) < number_bytes:
+        raise ConnectionError("The inference connection was closed")
+    return data
+
+
+def write_matrix(stream, matrix):
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    stream.write(HEADER.pack(*matrix.shape))
+    stream.write(matrix.tobytes())
+    stream.flush()
+
+
+def write_error(stream, message):
+    message = message.encode('utf-8')
+    stream.write(HEADER.pack(ERROR_ROWS, len(message)))
+    stream.write(message)
+    stream.flush()
+
+
+def read_matrix(stream):
+    rows, columns = HEADER.unpack(read_exactly(stream, HEADER.size))
+    if rows == ERROR_ROWS:
+        raise ValueError(read_exactly(stream, columns).decode('utf-8'))
+    return np.frombuffer(read_exactly(stream, rows * columns * 4), dtype=np.float32).reshape(rows, columns)
+
+
+def model_input_size(model):
+    # Keras models have an input shape, the NumPy model the kernel of its first layer.
+    if hasattr(model, 'input_shape'):
+        return model.input_shape[-1]
+    return model.layers[0][1][0].shape[0]
+
+
+class InferenceQueue:
+    """
+        Runs the model on the rows requested by concurrent threads, one request at a time.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.input_size = model_input_size(model)
+        # (features, future) of the pending requests.
+        self.requests = queue.Queue()
+        self.number_requests = 0
+        self.number_rows = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def predict(self, features):
+        """
+            Predictions of the rows of features, raises a ValueError if they do not have the input size of the
+            model.
+        """
+        if features.shape[1] != self.input_size:
+            raise ValueError("The request has " + str(features.shape[1]) + " columns, the model takes " +
+                             str(self.input_size))
+        future = Future()
+        self.requests.put((features, future))
+        return future.result()
+
+    def run(self):
+        while True:
+            features, future = self.requests.get()
+            try:
+                future.set_result(self.model.predict(features, verbose=0))
+            except Exception as exception:
+                future.set_exception(exception)
+                continue
+            self.number_requests += 1
+            self.number_rows += len(features)
+
+
+class InferenceRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                features = read_matrix(self.rfile)
+            except ConnectionError:
+                return
+            try:
+                predictions = self.server.requests.predict(features)
+            except Exception as exception:
+                # Only this request fails, the search can send the next one.
+                write_error(self.wfile, str(exception))
+                continue
+            write_matrix(self.wfile, predictions)
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, address, model):
+        if os.path.exists(address):
+            os.unlink(address)
+        super().__init__(address, InferenceRequestHandler)
+        self.requests = InferenceQueue(model)
+
+
+class InferenceClient:
+    """
+        Drop-in replacement of the model in bee.py: predict(features) sends the rows to the inference server
+        listening on address and returns its predictions.
+    """
+
+    def __init__(self, address):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.stream = self.socket.makefile('rwb')
+        # predict can be called by the scoring thread of bee.py and the main thread.
+        self.lock = threading.Lock()
+
+    def predict(self, features, verbose=0):
+        """
+            Predictions of the server, raises a ValueError with the message of the server if it could not score
+            the rows.
+        """
+        with self.lock:
+            write_matrix(self.stream, features)
+            return read_matrix(self.stream)
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+
+def load_model(filename):
+    if USE_KERAS_MODEL:
+        import tensorflow.keras.models as keras_model
+        return keras_model.load_model(filename)
+    return NumpyBustleModel.load(filename, BUSTLE_MODEL_PRECISION, BUSTLE_MODEL_THREADS)
+
+
+def benchmark(model, signatures, searches=(1, 4, 16), requests=20, address=None):
+    """
+        [(number of searches, seconds with a copy of the model per search, seconds through the server), ...]:
+        each search is a thread that scores the rows of signatures (one micro-batch of Bee) requests times, the
+        seconds are the time for all the searches to finish. The server listens on address, a temporary socket
+        by default.
+    """
+    directory = None
+    if address is None:
+        directory = tempfile.TemporaryDirectory()
+        address = os.path.join(directory.name, "bee.sock")
+    server = InferenceServer(address, model)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def search(search_model):
+        for _ in range(requests):
+            search_model.predict(signatures)
+
+    def run(models):
+        threads = [threading.Thread(target=search, args=(search_model,)) for search_model in models]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    timings = []
+    for number_searches in searches:
+        local_seconds = run([copy.deepcopy(model) for _ in range(number_searches)])
+        clients = [InferenceClient(address) for _ in range(number_searches)]
+        timings.append((number_searches, local_seconds, run(clients)))
+        for client in clients:
+            client.close()
+    server.shutdown()
+    server.server_close()
+    if directory is not None:
+        directory.cleanup()
+    return timings
+
+
+if __name__ == "__main__":
+    """
+    python inference_server.py [socket] [model file], the socket defaults to INFERENCE_SERVER_ADDRESS and the
+    model to the one loaded by bee.py. The searches connect with: python bee.py [TaskID] --inference-server=[socket]
+    Time of concurrent searches with a copy of the model each and through a server (see benchmark):
+    python inference_server.py benchmark [model file] [signatures .npy file], the signatures default to a
+    micro-batch of random_signatures.
+    """
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        model_filename = sys.argv[2] if len(sys.argv) > 2 else models_directory + "bustle_model_01.hdf5"
+        model = load_model(model_filename)
+        if len(sys.argv) > 3:
+            signatures = np.load(sys.argv[3]).astype(np.float32)
+        else:
+            signatures = random_signatures(INFERENCE_MICRO_BATCH_SIZE, model_input_size(model), SUB_PROGRAM_PS_LENGTH)
+        for number_searches, local_seconds, server_seconds in benchmark(model, signatures):
+            print(str(number_searches) + " searches of " + str(len(signatures)) + " rows: a model per search " +
+                  str(round(local_seconds, 3)) + "s, server " + str(round(server_seconds, 3)) + "s")
+        sys.exit(0)
+
+    address = sys.argv[1] if len(sys.argv) > 1 else INFERENCE_SERVER_ADDRESS
+    if address is None:
+        sys.exit("No socket given and INFERENCE_SERVER_ADDRESS is None")
+    model_filename = sys.argv[2] if len(sys.argv) > 2 else models_directory + "bustle_model_01.hdf5"
+
+    server = InferenceServer(address, load_model(model_filename))
+    print("Serving " + model_filename + " on " + address, flush=True)
+    # Stops on Ctrl-C or SIGTERM.
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        requests = server.requests
+        print(str(requests.number_rows) + " rows of " + str(requests.number_requests) + " requests")
+        server.server_close()
+        # the socket can already be gone, removed by hand or by a server started on the same address
+        if os.path.exists(address):
+            os.unlink(address)
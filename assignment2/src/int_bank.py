@@ -0,0 +1,100 @@
+import numpy as np
+
+from sygus_string_dsl import *
+
+"""
+Columnar storage of the integer programs of the BUS bank and vectorized versions of the
+integer -> integer and integer -> boolean operations.
+
+Values are only stored in the matrix while they are far enough from the int64 limits that the
+sum or difference of two stored values cannot overflow. Rows holding larger values, and products
+that may overflow, are flagged and left to the regular interpreter so results stay exact.
+"""
+MAX_MAGNITUDE = 2 ** 62
+MAX_SAFE_PRODUCT = float(2 ** 61)
+
+# Upper bound on the number of cells of a layer x layer block computed at once.
+BLOCK_CELLS = 1 << 22
+
+
+class IntBank:
+
+    def __init__(self):
+        """
+        self.matrices holds, per size, the list [values, exact, length]:
+        values: int64 matrix (capacity x examples), its first length rows are the outputs of the integer programs
+        of the size in ProgramsList, in the same order
+        exact: bool vector (capacity), False if a value of the row does not fit in the matrix or is ERROR
+        (MultiSpecSearch keeps the programs that fail on some of the examples)
+        The rows are appended on insert, the capacity is doubled when the matrix is full.
+        """
+        self.matrices = {}
+
+    def insert(self, size, outputs):
+        if size not in self.matrices:
+            self.matrices[size] = [np.empty((16, len(outputs)), dtype=np.int64), np.empty(16, dtype=bool), 0]
+        matrix = self.matrices[size]
+        values, exact, length = matrix
+        if length == len(values):
+            values = matrix[0] = np.concatenate([values, np.empty_like(values)])
+            exact = matrix[1] = np.concatenate([exact, np.empty_like(exact)])
+
+        exact[length] = all(value is not ERROR and -MAX_MAGNITUDE < value < MAX_MAGNITUDE for value in outputs)
+        values[length] = [value if value is not ERROR and -MAX_MAGNITUDE < value < MAX_MAGNITUDE else 0
+                          for value in outputs]
+        matrix[2] = length + 1
+
+    def get_matrix(self, size):
+        """
+            (values, exact) of the integer programs of the size, views of their first rows.
+        """
+        if size not in self.matrices:
+            return np.empty((0, 0), dtype=np.int64), np.empty(0, dtype=bool)
+        values, exact, length = self.matrices[size]
+        return values[:length], exact[:length]
+
+
+"""
+Block operations: take the left operands as a (programs1 x 1 x examples) array and the right
+operands as a (1 x programs2 x examples) array and return (values, error_cells, fallback_cells).
+error_cells marks outputs where the interpreter returns ERROR, fallback_cells marks results
+that cannot be computed exactly in int64. Either may be None when it cannot happen.
+"""
+
+
+def plus_block(left, right):
+    return left + right, None, None
+
+
+def minus_block(left, right):
+    return left - right, None, None
+
+
+def multiply_block(left, right):
+    fallback_cells = np.abs(left.astype(np.float64) * right) >= MAX_SAFE_PRODUCT
+    return np.where(fallback_cells, 0, left * right), None, fallback_cells
+
+
+def modulo_block(left, right):
+    # IntModulo returns ERROR on a zero divisor; np.mod follows Python's sign convention otherwise.
+    error_cells = np.broadcast_to(right == 0, np.broadcast_shapes(left.shape, right.shape))
+    return np.mod(left, np.where(right == 0, 1, right)), error_cells, None
+
+
+def greater_than_block(left, right):
+    return left > right, None, None
+
+
+"""
+Operation -> (class of the programs it grows, block operation). The operands are chosen with the normal form
+rules of the operation (COMMUTATIVE, IDENTITY, DISTINCT_OPERANDS == 'key', see grow_operands).
+BoolLessThan.grow builds BoolGreaterThan programs, its block mirrors that.
+"""
+VECTORIZED_OPERATIONS = {
+    IntPlus: (IntPlus, plus_block),
+    IntMinus: (IntMinus, minus_block),
+    IntMultiply: (IntMultiply, multiply_block),
+    IntModulo: (IntModulo, modulo_block),
+    BoolGreaterThan: (BoolGreaterThan, greater_than_block),
+    BoolLessThan: (BoolGreaterThan, greater_than_block),
+}
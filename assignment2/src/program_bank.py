@@ -0,0 +1,288 @@
+import itertools
+
+import numpy as np
+
+from cfg import BustlePCFG
+from sygus_string_dsl import *
+from utils import *
+
+"""
+Columnar program bank of Bee search (bee.py).
+
+A program of the bank is an integer id. Its operation code (position in BANK_OPERATIONS), the ids of its
+children (-1 for the missing ones), its cost, its return type code, its interned key (see program_key) and the id
+of its outputs are kept in parallel NumPy arrays. The values of the terminals are kept in a dict and the outputs
+in a list indexed by output id. self.layers[cost][type] holds the ids of the programs of that cost and type, in
+the order they were stored.
+
+grow yields the candidates of an operation as (operation, children ids), in the same order and with the same
+normal forms as operation.grow over a bank of program objects: both read the rules the operations declare
+(OPERANDS, COMMUTATIVE, IDENTITY, DISTINCT_OPERANDS, see grow_operands in sygus_string_dsl.py).
+A candidate is evaluated from the outputs of its children instead of interpreting its whole tree, and program
+objects are only built for the solution (see program).
+
+The costs are stored as they are: the indices of cost_list shift when a smaller cost is inserted.
+"""
+
+# Operation codes of the bank, also the operation codes of the search traces (see search_trace.py).
+BANK_OPERATIONS = TERMINALS + NON_TERMINALS
+OPERATION_CODES = {operation: code for code, operation in enumerate(BANK_OPERATIONS)}
+# Operands name the operations they leave out (see Operand).
+OPERATION_CODES_BY_NAME = {operation.name(): code for code, operation in enumerate(BANK_OPERATIONS)}
+
+MAX_CHILDREN = max(len(operation.CHILDREN) for operation in NON_TERMINALS)
+
+TYPE_CODES = {STR_TYPE: 0, INT_TYPE: 1, BOOL_TYPE: 2}
+RETURN_TYPES = {code: return_type for return_type, code in TYPE_CODES.items()}
+
+# Number of rows the columns are allocated with, they are doubled when they are full.
+BANK_INITIAL_CAPACITY = 4096
+
+
+class BankOutputs:
+    """
+        Operand of the evaluation probes of ProgramBank: the outputs of a program of the bank, interpret takes
+        the index of the example instead of its environment.
+    """
+    __slots__ = ('outputs',)
+
+    def interpret(self, index):
+        return self.outputs[index]
+
+
+class IdLayer:
+    """
+        Ids of the programs of one cost and type, a NumPy array that is doubled when it is full.
+    """
+
+    def __init__(self):
+        self.ids = np.empty(16, dtype=np.int32)
+        self.length = 0
+
+    def append(self, program_id):
+        if self.length == len(self.ids):
+            self.ids = np.concatenate([self.ids, np.empty(len(self.ids), dtype=np.int32)])
+        self.ids[self.length] = program_id
+        self.length += 1
+
+    def view(self):
+        return self.ids[:self.length]
+
+
+class ProgramBank:
+
+    def __init__(self, number_examples):
+        self.number_examples = number_examples
+        self.length = 0
+        self.operations = np.empty(BANK_INITIAL_CAPACITY, dtype=np.uint8)
+        self.children = np.empty((BANK_INITIAL_CAPACITY, MAX_CHILDREN), dtype=np.int32)
+        self.costs = np.empty(BANK_INITIAL_CAPACITY, dtype=np.int32)
+        self.types = np.empty(BANK_INITIAL_CAPACITY, dtype=np.uint8)
+        self.keys = np.empty(BANK_INITIAL_CAPACITY, dtype=np.int64)
+        self.output_ids = np.empty(BANK_INITIAL_CAPACITY, dtype=np.int32)
+        # output id -> outputs of the programs on the examples.
+        self.outputs = []
+        # id -> value of the terminals (the literal, or the name of the variable).
+        self.values = {}
+        self.layers = {}
+
+        # Terminals the normal forms leave out: the string literals of each rule of LITERAL_RULES, and the
+        # integer literals by value (IDENTITY).
+        self.rule_literals = {rule: [] for rule in LITERAL_RULES}
+        self.int_literals = {}
+        # (operation, value) -> id of the terminals that are not in the layers (the constant operands of BoolEqual).
+        self.constants = {}
+
+        # One program per operation whose operands are BankOutputs, it evaluates the candidates of the operation.
+        self.probes = {}
+        for operation in NON_TERMINALS:
+            probe = operation.__new__(operation)
+            for child in operation.CHILDREN:
+                setattr(probe, child, BankOutputs())
+            self.probes[operation] = probe
+
+    def __len__(self):
+        return self.length
+
+    def reserve_row(self):
+        if self.length == len(self.operations):
+            for column in ('operations', 'children', 'costs', 'types', 'keys', 'output_ids'):
+                array = getattr(self, column)
+                setattr(self, column, np.concatenate([array, np.empty_like(array)]))
+        self.length += 1
+        return self.length - 1
+
+    def store(self, operation, children, cost, return_type, key, outputs):
+        program_id = self.reserve_row()
+        self.operations[program_id] = OPERATION_CODES[operation]
+        self.children[program_id] = tuple(children) + (-1,) * (MAX_CHILDREN - len(children))
+        self.costs[program_id] = cost
+        self.types[program_id] = TYPE_CODES[return_type]
+        self.keys[program_id] = key
+        self.output_ids[program_id] = len(self.outputs)
+        self.outputs.append(outputs)
+        return program_id
+
+    def add_to_layer(self, program_id, cost, return_type):
+        if cost not in self.layers:
+            self.layers[cost] = {}
+        if return_type not in self.layers[cost]:
+            self.layers[cost][return_type] = IdLayer()
+        self.layers[cost][return_type].append(program_id)
+
+    def add_terminal(self, program, outputs, in_layers=True):
+        """
+            Stores the terminal program, with its outputs on the examples, and returns its id.
+        """
+        value = program.bool if isinstance(program, BoolLiteral) else program.value
+        program_id = self.store(type(program), (), program.size, program.getReturnType(), program.getKey(), outputs)
+        self.values[program_id] = value
+        if not in_layers:
+            self.constants[(type(program), value)] = program_id
+            return program_id
+
+        if isinstance(program, StrLiteral):
+            for rule, applies in LITERAL_RULES.items():
+                if applies(value):
+                    self.rule_literals[rule].append(program_id)
+        if isinstance(program, IntLiteral):
+            self.int_literals.setdefault(value, []).append(program_id)
+        self.add_to_layer(program_id, program.size, program.getReturnType())
+        return program_id
+
+    def add(self, operation, children, cost, outputs):
+        """
+            Stores the candidate (operation, children) with its cost and its outputs, returns its id.
+        """
+        key = INTERNED_PROGRAMS.setdefault((operation,) + tuple(int(self.keys[child]) for child in children),
+                                           len(INTERNED_PROGRAMS))
+        return_type = self.probes[operation].getReturnType()
+        program_id = self.store(operation, children, cost, return_type, key, outputs)
+        self.add_to_layer(program_id, cost, return_type)
+        return program_id
+
+    """
+        Candidates
+    """
+
+    def get_ids(self, cost, return_type):
+        if cost in self.layers and return_type in self.layers[cost]:
+            return self.layers[cost][return_type].view()
+        return np.empty(0, dtype=np.int32)
+
+    def get_ids_all(self, cost):
+        if cost in self.layers:
+            return np.concatenate([layer.view() for layer in self.layers[cost].values()])
+        return np.empty(0, dtype=np.int32)
+
+    def select(self, ids, operations=(), literals=()):
+        """
+            The ids without the programs of the operation codes and without the terminals of literals, as a list.
+        """
+        keep = np.ones(len(ids), dtype=bool)
+        if len(operations):
+            keep &= ~np.isin(self.operations[ids], operations)
+        if len(literals):
+            keep &= ~np.isin(ids, literals)
+        return ids[keep].tolist()
+
+    def operand_ids(self, operation, position, cost):
+        """
+            Ids of the programs of the cost that can be the operand at position of operation (see Operand).
+        """
+        operand = operation.OPERANDS[position]
+        if operand.return_type is None:
+            ids = self.get_ids_all(cost)
+        else:
+            ids = self.get_ids(cost, operand.return_type)
+        literals = []
+        if operand.excluded_literals is not None:
+            literals += self.rule_literals[operand.excluded_literals]
+        if operation.IDENTITY is not None and (position == len(operation.OPERANDS) - 1 or operation.COMMUTATIVE):
+            literals += self.int_literals.get(operation.IDENTITY, [])
+        return self.select(ids, [OPERATION_CODES_BY_NAME[name] for name in operand.excluded_operations], literals)
+
+    def grow(self, operation, costs):
+        """
+            Yields (operation, children ids) for the candidates of operation whose operands cost costs, in the
+            order of operation.grow (see grow_operands in sygus_string_dsl.py).
+        """
+        if operation.COMMUTATIVE and costs[0] > costs[1]:
+            return
+        candidate_operation = operation.GROWN_AS or operation
+        layers = [self.operand_ids(operation, position, cost) for position, cost in enumerate(costs)]
+        if len(layers) == 1:
+            for program_id in layers[0]:
+                yield candidate_operation, (program_id,)
+            return
+
+        *outer_layers, layer1, layer2 = layers
+        distinct = operation.DISTINCT_OPERANDS
+        if distinct == 'key':
+            layer1_keys = self.keys[layer1].tolist()
+            layer2_keys = self.keys[layer2].tolist()
+        else:
+            # the id of a program is its identity
+            layer1_keys = layer1
+            layer2_keys = layer2
+        ordered = operation.COMMUTATIVE and costs[0] == costs[1]
+        if ordered:
+            positions = {program_id: index for index, program_id in enumerate(layer2)}
+
+        incomparable_types = getattr(operation, 'INCOMPARABLE_TYPES', None)
+        if incomparable_types is not None:
+            return_types = dict(zip(layer1 + layer2, [RETURN_TYPES[code] for code in
+                                                      self.types[layer1 + layer2].tolist()]))
+            constants = (self.constants[(IntLiteral, 1)], self.constants[(IntLiteral, 2)])
+
+        for outer_operands in itertools.product(*outer_layers):
+            for id1, key1 in zip(layer1, layer1_keys):
+                start = positions[id1] if ordered else 0
+                for id2, key2 in zip(layer2[start:], layer2_keys[start:]):
+                    if distinct is not None and key1 == key2:
+                        continue
+                    if incomparable_types is not None and (return_types[id1], return_types[id2]) in incomparable_types:
+                        yield candidate_operation, constants
+                    else:
+                        yield candidate_operation, outer_operands + (id1, id2)
+
+    def evaluate(self, operation, children):
+        """
+            Outputs of the candidate on the examples, None if it returns ERROR on one of them.
+        """
+        probe = self.probes[operation]
+        for child, child_id in zip(operation.CHILDREN, children):
+            getattr(probe, child).outputs = self.outputs[self.output_ids[child_id]]
+        outputs = []
+        for index in range(self.number_examples):
+            output = probe.interpret(index)
+            if output is ERROR:
+                return None
+            outputs.append(output)
+        return outputs
+
+    def cost(self, operation, children):
+        # Cost of the candidate before the model: the costs of its children and the cost of the operation.
+        return sum(int(self.costs[child]) for child in children) + \
+            BustlePCFG.get_instance().get_cost(self.probes[operation])
+
+    """
+        Program objects
+    """
+
+    def program(self, program_id):
+        """
+            The program object of the id, with its cost as size.
+        """
+        operation = BANK_OPERATIONS[self.operations[program_id]]
+        if program_id in self.values:
+            program = operation(self.values[program_id])
+        else:
+            program = operation(*[self.program(child) for child in self.children[program_id]
+                                  if child >= 0])
+        program.size = int(self.costs[program_id])
+        return program
+
+    def candidate_program(self, operation, children):
+        return operation(*[self.program(child) for child in children])
+
@@ -1,4 +1,7 @@
 import re
+
+import numpy as np
+
 regex_digit = re.compile('\d')
 regex_only_digits = re.compile('^\d+$')
 regex_alpha = re.compile('[a-zA-Z]')
@@ -1389,3 +1392,137 @@ InputStringOutputBoolProperties = [
     is_parsed_input_len_and_output_same
 
 ]
+
+
+"""
+Batched properties, used by populate_batch_ps.
+The string only, integer only and boolean only properties map an array of outputs to a boolean array
+of the same shape, true where the property of the same name above holds for the output. The string
+only ones get the distinct strings of the batch (see BatchedStrings).
+The input-output properties take the (programs x examples) outputs of the sub-programs and the task
+outputs, which are broadcast over the examples axis; strings come as BatchedStrings.
+The lists are in the same order as the lists of properties above.
+"""
+
+
+class BatchedStrings:
+    """
+        A (rows x examples) list of strings stored as indexes (codes) into its distinct strings, so that the string
+        methods that numpy does not vectorize run once per distinct string.
+    """
+
+    def __init__(self, strings):
+        indexes = {}
+        self.codes = np.array([[indexes.setdefault(string, len(indexes)) for string in row] for row in strings],
+                              dtype=np.intp)
+        self.distinct = np.array(list(indexes), dtype=str)
+        self.strings = self.distinct[self.codes]
+        self.lengths = np.char.str_len(self.distinct)[self.codes]
+        self.lower = np.char.lower(self.distinct)[self.codes]
+
+
+def regex_matrix(regex, strings):
+    return np.array([regex.search(string) is not None for string in strings.tolist()], dtype=bool)
+
+
+def divisible_matrix(dividends, divisors):
+    nonzero = divisors != 0
+    return nonzero & (dividends % np.where(nonzero, divisors, 1) == 0)
+
+
+BatchedStringProperties = [
+    lambda s: np.char.str_len(s) == 0,
+    lambda s: np.char.str_len(np.char.strip(s)) == 1,
+    lambda s: np.char.str_len(np.char.strip(s)) <= 5,
+    lambda s: np.char.islower(s),
+    lambda s: np.char.isupper(s),
+    lambda s: np.char.find(s, " ") >= 0,
+    lambda s: np.char.find(s, ",") >= 0,
+    lambda s: np.char.find(s, ".") >= 0,
+    lambda s: np.char.find(s, "-") >= 0,
+    lambda s: np.char.find(s, "/") >= 0,
+    lambda s: regex_matrix(regex_digit, s),
+    lambda s: regex_matrix(regex_only_digits, s),
+    lambda s: regex_matrix(regex_alpha, s),
+    lambda s: regex_matrix(regex_alpha_only, s)
+]
+
+BatchedIntegerProperties = [
+    lambda i: i == 0,
+    lambda i: i == 1,
+    lambda i: i == 2,
+    lambda i: i < 0,
+    lambda i: (0 < i) & (i <= 3),
+    lambda i: (3 < i) & (i <= 9),
+    lambda i: i > 9
+]
+
+BatchedBooleanProperties = [lambda b: b]
+
+BatchedInputStringOutputStringProperties = [
+    lambda s, out: np.char.find(out.strings, s.strings) >= 0,
+    lambda s, out: np.char.startswith(out.strings, s.strings),
+    lambda s, out: np.char.endswith(out.strings, s.strings),
+    lambda s, out: np.char.find(s.strings, out.strings) >= 0,
+    lambda s, out: np.char.startswith(s.strings, out.strings),
+    lambda s, out: np.char.endswith(s.strings, out.strings),
+    lambda s, out: np.char.find(out.lower, s.lower) >= 0,
+    lambda s, out: np.char.startswith(out.lower, s.lower),
+    lambda s, out: np.char.endswith(out.lower, s.lower),
+    lambda s, out: np.char.find(s.lower, out.lower) >= 0,
+    lambda s, out: np.char.startswith(s.lower, out.lower),
+    lambda s, out: np.char.endswith(s.lower, out.lower),
+    lambda s, out: s.strings == out.strings,
+    lambda s, out: s.lower == out.lower,
+    lambda s, out: s.lengths == out.lengths,
+    lambda s, out: s.lengths < out.lengths,
+    lambda s, out: s.lengths > out.lengths
+]
+
+BatchedInputIntegerOutputStringProperties = [
+    lambda i, out: i < out.lengths,
+    lambda i, out: i <= out.lengths,
+    lambda i, out: i == out.lengths,
+    lambda i, out: i >= out.lengths,
+    lambda i, out: i > out.lengths,
+    lambda i, out: abs(i - out.lengths) <= 1,
+    lambda i, out: abs(i - out.lengths) <= 3
+]
+
+BatchedInputStringOutputIntegerProperties = [
+    lambda s, out: out < s.lengths,
+    lambda s, out: out <= s.lengths,
+    lambda s, out: out == s.lengths,
+    lambda s, out: out >= s.lengths,
+    lambda s, out: out > s.lengths,
+    lambda s, out: abs(s.lengths - out) <= 1,
+    lambda s, out: abs(s.lengths - out) <= 3
+]
+
+BatchedInputIntegerOutputIntegerProperties = [
+    lambda i, out: divisible_matrix(out, i),
+    lambda i, out: divisible_matrix(i, out),
+    lambda i, out: i < out,
+    lambda i, out: i <= out,
+    lambda i, out: i == out,
+    lambda i, out: i >= out,
+    lambda i, out: i > out,
+    lambda i, out: (i == 0) & (out == 0),
+    lambda i, out: (i == 1) & (out == 1),
+    lambda i, out: (i % 2 == 0) & (out % 2 == 0),
+    lambda i, out: (i % 2 == 1) & (out % 2 == 1),
+    lambda i, out: abs(i - out) <= 1,
+    lambda i, out: abs(i - out) <= 3
+]
+
+BatchedInputIntegerOutputBoolProperties = [
+    lambda i, out: (i != 0) & (out == True),
+    lambda i, out: (i == 0) & (out == False),
+    lambda i, out: (i != 0) == out
+]
+
+BatchedInputStringOutputBoolProperties = [
+    lambda s, out: (s.lengths != 0) & (out == True),
+    lambda s, out: (s.lengths == 0) & (out == False),
+    lambda s, out: (s.lengths != 0) == out
+]
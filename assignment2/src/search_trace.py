@@ -0,0 +1,121 @@
+import json
+
+import numpy as np
+
+from program_bank import BANK_OPERATIONS, MAX_CHILDREN
+
+"""
+Search traces of Bee (bee.py).
+
+A trace lists the programs of the bank in the order they are stored: the terminals of init_plist (with the
+constants of the bank that are not in its layers), then every scored program. A record holds the id of the
+program (its position in the trace), its operation, the ids of its children (-1 for the missing ones) and the
+probability predicted by the model (NaN for the terminals). The file is a JSON header line followed by the
+records, a packed NumPy structured array.
+
+Replaying a trace gives every program the recorded probability of the program with the same operation and
+children, without the property signatures and the model: the search is reproduced bit for bit, and changes to
+the queue or the bank can be compared on the same costs. A program that is not in the trace (the replayed search
+stored a program that the recorded one did not) raises a KeyError.
+"""
+
+TRACE_VERSION = 2
+
+# Operation codes of the records, the operation codes of the bank (see program_bank.py).
+TRACE_OPERATIONS = BANK_OPERATIONS
+
+TRACE_RECORD = np.dtype([('id', '<u4'), ('operation', 'u1'), ('children', '<i4', (MAX_CHILDREN,)),
+                         ('probability', '<f4')])
+
+# Number of records written at once by SearchTraceWriter.
+TRACE_FLUSH_SIZE = 65536
+
+
+class SearchTrace:
+    """
+        Trace ids of the programs of the bank, shared by the writer and the replay.
+    """
+
+    def __init__(self):
+        # bank id -> trace id, the programs are added in the order of the bank.
+        self.ids = []
+        self.operation_codes = {operation: code for code, operation in enumerate(TRACE_OPERATIONS)}
+
+    def children_ids(self, children):
+        return tuple([self.ids[child] for child in children] + [-1] * (MAX_CHILDREN - len(children)))
+
+    def key(self, operation, children):
+        return (self.operation_codes[operation],) + self.children_ids(children)
+
+    def close(self):
+        pass
+
+
+class SearchTraceWriter(SearchTrace):
+    """
+        Records the programs of one search to filename.
+    """
+
+    replay = False
+
+    def __init__(self, filename):
+        super().__init__()
+        self.file = open(filename, 'wb')
+        header = {'version': TRACE_VERSION, 'operations': [operation.name() for operation in TRACE_OPERATIONS]}
+        self.file.write((json.dumps(header) + '\n').encode('utf-8'))
+        self.records = []
+
+    def add(self, operation, children=(), probability=np.nan):
+        trace_id = len(self.ids)
+        self.ids.append(trace_id)
+        self.records.append((trace_id, self.operation_codes[operation], self.children_ids(children), probability))
+        if len(self.records) >= TRACE_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        np.array(self.records, dtype=TRACE_RECORD).tofile(self.file)
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class SearchTraceReplay(SearchTrace):
+    """
+        Probabilities of the programs of a search recorded by SearchTraceWriter.
+    """
+
+    replay = True
+
+    def __init__(self, filename):
+        super().__init__()
+        with open(filename, 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            records = np.fromfile(f, dtype=TRACE_RECORD)
+        if header['version'] != TRACE_VERSION or \
+                header['operations'] != [operation.name() for operation in TRACE_OPERATIONS]:
+            raise ValueError("The trace " + filename + " was recorded with another version or DSL")
+
+        terminals = np.isnan(records['probability'])
+        # the terminals are matched in the order of init_plist.
+        self.terminals = records[terminals][['id', 'operation']].tolist()
+        # (operation, children ids) -> (trace id, probability) of the scored programs.
+        self.programs = {(int(record['operation']),) + tuple(record['children'].tolist()):
+                         (int(record['id']), record['probability']) for record in records[~terminals]}
+
+    def add(self, operation, children=(), probability=None):
+        if probability is None:
+            trace_id, operation_code = self.terminals[len(self.ids)]
+            if operation_code != self.operation_codes[operation]:
+                raise KeyError("The terminals of the search differ from the trace")
+        else:
+            trace_id = self.programs[self.key(operation, children)][0]
+        self.ids.append(trace_id)
+
+    def probabilities(self, candidates):
+        """
+            Recorded probabilities of the candidates, (operation, children ids) pairs.
+        """
+        return np.array([self.programs[self.key(operation, children)][1] for operation, children in candidates],
+                        dtype=np.float32)
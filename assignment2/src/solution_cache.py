@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+import sygus_string_dsl
+from utils import *
+
+
+class SolutionCache:
+    """
+        Content addressed cache of solved tasks.
+
+        The key is a hash of the normalized specification: variables, literals, input-output examples,
+        DSL operations, synthesizer and easy/hard mode, and of the settings of utils.py that change the search
+        (hard mode literal ranking, value domain caps). The value holds the solution program, both as
+        a string and as a tree that can be rebuilt, and the number of evaluations of the original run.
+        A cached program is re-verified against the examples before it is returned.
+    """
+
+    def __init__(self, directory=cache_directory):
+        self.directory = directory
+
+    @staticmethod
+    def make_key(string_variables, integer_variables, string_literals, integer_literals,
+                 input_output, operations, synthesizer, difficulty, value_domain_factor=None):
+        specification = {
+            'string_variables': sorted(string_variables),
+            'integer_variables': sorted(integer_variables),
+            'string_literals': sorted(set(string_literals)),
+            'integer_literals': sorted(set(integer_literals)),
+            'input_output': [sorted(example.items()) for example in input_output],
+            'operations': [operation.name() for operation in operations],
+            'synthesizer': synthesizer,
+            'difficulty': difficulty,
+            'rank_hard_mode_literals': RANK_HARD_MODE_LITERALS,
+            'literal_top_k': LITERAL_TOP_K,
+            'value_domain': [value_domain_factor, MAX_INT_MAGNITUDE, MAX_STRING_LENGTH],
+        }
+        normalized = json.dumps(specification, sort_keys=True)
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key, input_output):
+        """
+            Returns [program, entry] for a cached solution that still satisfies the examples,
+            None otherwise.
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            program = deserialize_program(entry['tree'])
+            # an ill-typed tree fails in interpret
+            if not verify_program(program, input_output):
+                return None
+        except (ValueError, KeyError, IndexError, AttributeError, TypeError):
+            return None
+        return [program, entry]
+
+    def put(self, key, program, evaluations, **statistics):
+        entry = {
+            'program': program.toString(),
+            'tree': serialize_program(program),
+            'evaluations': evaluations,
+        }
+        entry.update(statistics)
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so that concurrent runs never read a partial entry.
+        temporary_path = self.get_path(key) + '.' + str(os.getpid())
+        with open(temporary_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temporary_path, self.get_path(key))
+
+
+def terminal_value(program):
+    return program.bool if isinstance(program, sygus_string_dsl.BoolLiteral) else program.value
+
+
+def serialize_program(program):
+    if program.CHILDREN:
+        return [type(program).__name__] + [serialize_program(getattr(program, child))
+                                           for child in program.CHILDREN]
+    return [type(program).__name__, terminal_value(program)]
+
+
+# Classes a cached tree may name, anything else in the file is rejected.
+PROGRAM_CLASSES = {operation.__name__: operation
+                   for operation in sygus_string_dsl.TERMINALS + sygus_string_dsl.NON_TERMINALS}
+
+
+def deserialize_program(tree):
+    if tree[0] not in PROGRAM_CLASSES:
+        raise ValueError("Unknown operation " + str(tree[0]) + " in the solution cache")
+    program_class = PROGRAM_CLASSES[tree[0]]
+    if program_class.CHILDREN and len(tree) != len(program_class.CHILDREN) + 1:
+        raise ValueError("Wrong number of operands for " + tree[0] + " in the solution cache")
+    if program_class.CHILDREN:
+        return program_class(*[deserialize_program(child) for child in tree[1:]])
+    return program_class(tree[1])
+
+
+def verify_program(program, input_output):
+    for example in input_output:
+        if program.interpret(example) != example['out']:
+            return False
+    return True
@@ -6,19 +6,192 @@ from utils import *
 
 # Try and except are added in each class to make sure that the code can run without the cost model with BUS.
 
+class ErrorValue:
+    """
+        Type of ERROR. A single instance that is only equal to itself, never a value of the DSL, and that
+        is still ERROR after pickling (the parallel workers of bus.py) or copying.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'ERROR'
+
+    def __reduce__(self):
+        return 'ERROR'
+
+
+# Returned by interpret when an operation gets an input it is not defined on (e.g. a missing index,
+# a non numeric string, a zero divisor, a substring that IndexOf does not find). Every operation returns
+# ERROR as soon as one of the values it needs is ERROR, so evaluation never raises and callers only check
+# the final output.
+ERROR = ErrorValue()
+
+# Hash-consing table: maps the structure of a program (its class and the keys of its children,
+# or its value for terminals) to an interned integer id. Structurally identical programs share
+# the same key, so the pruning checks in grow are O(1) instead of rendering subtrees with toString().
+INTERNED_PROGRAMS = {}
+
+# Attributes shared by every program, the classes declare __slots__ so a program has no per-instance __dict__:
+# the banks of the searches hold millions of them. Besides the cost (size), the id and the interned key,
+# bee.py caches the outputs of a candidate and bus.py records its position in the bank.
+PROGRAM_SLOTS = ('size', 'id', 'key', 'outputs', 'bank_position')
+
+
+def program_key(program):
+    key = getattr(program, 'key', None)
+    if key is None:
+        if program.CHILDREN:
+            signature = (type(program),) + tuple(program_key(getattr(program, child))
+                                                 for child in program.CHILDREN)
+        else:
+            signature = (type(program), program.toString())
+        key = INTERNED_PROGRAMS.setdefault(signature, len(INTERNED_PROGRAMS))
+        program.key = key
+    return key
+
+
+# Return types of the programs, the 'type' of STR_TYPES, INT_TYPES and BOOL_TYPES.
+STR_TYPE = 'str'
+INT_TYPE = 'integer'
+BOOL_TYPE = 'boolean'
+
+# String literals an operand can leave out (see Operand), by their value.
+LITERAL_RULES = {
+    'empty': lambda value: value == "",
+    'lower': lambda value: value == value.lower(),
+    'upper': lambda value: value == value.upper(),
+}
+
+
+class Operand:
+    """
+        An operand of an operation: the return type of its programs (None for every type), the operations
+        (by name) and the string literals (a rule of LITERAL_RULES) that are left out of it.
+    """
+    __slots__ = ('return_type', 'excluded_operations', 'excluded_literals')
+
+    def __init__(self, return_type, excluded_operations=(), excluded_literals=None):
+        self.return_type = return_type
+        self.excluded_operations = excluded_operations
+        self.excluded_literals = excluded_literals
+
+    def has_exclusions(self):
+        return len(self.excluded_operations) > 0 or self.excluded_literals is not None
+
+    def excludes(self, program):
+        if type(program).__name__ in self.excluded_operations:
+            return True
+        return self.excluded_literals is not None and isinstance(program, StrLiteral) and \
+            LITERAL_RULES[self.excluded_literals](program.value)
+
+
+"""
+Normal forms
+The grow functions only yield one form of programs that are equal on every input:
+- idempotence and absorption: StrLower/StrUpper are not applied to StrLower/StrUpper programs, nor to
+  literals that are already in that case.
+- associativity: concatenations are right associative, the first operand of StrConcat is never a StrConcat.
+- identity literals: concatenation with "", x.replace(a, a), x + 0, x - 0, x * 1 and ite(c, a, a) are skipped.
+- commutativity: the operands of IntPlus, IntMultiply and BoolEqual are ordered by size and then by position
+  in the bank, so (b, a) is never grown next to (a, b); BoolEqual(a, a) is skipped.
+An operation declares its rules as class attributes, read by grow_operands and by the columnar bank of Bee
+(program_bank.py):
+- OPERANDS: an Operand per operand, its type and the programs left out of it.
+- COMMUTATIVE: the two operands are ordered, (b, a) is not grown.
+- IDENTITY: integer literal that leaves the other operand unchanged, it is left out of the last operand (and of
+  the first one of a commutative operation).
+- DISTINCT_OPERANDS: None, 'key' or 'program', the candidates whose last two operands have the same key or are
+  the same program are skipped.
+- GROWN_AS: None, or the operation whose programs are grown instead (BoolLessThan grows BoolGreaterThan).
+
+grow(plist, combination, first_operands) yields the programs whose operands have the costs of combination. The
+first operand is the outermost loop and first_operands is a slice of its layer (OPERANDS[0]): the slices [0, k)
+and [k, n) yield the programs of the whole layer in the same order, bus.py splits a level this way.
+"""
+
+
+def is_int_literal(program, value):
+    return isinstance(program, IntLiteral) and program.value == value
+
+
+def grow_operands(operation, plist, combination, first_operands=slice(None)):
+    """
+        Yields the tuples of operands of operation in normal form, whose costs are combination.
+    """
+    if operation.COMMUTATIVE and combination[0] > combination[1]:
+        # grown as (right, left) by the combination (layer2, layer1)
+        return
+
+    layers = []
+    for position, (cost, operand) in enumerate(zip(combination, operation.OPERANDS)):
+        if operand.return_type is None:
+            programs = plist.get_programs_all(cost)
+        else:
+            programs = plist.get_programs(cost, operand.return_type)
+        if position == 0:
+            programs = programs[first_operands]
+        # pruning rules do not depend on the other operands, filter each layer once
+        if operand.has_exclusions():
+            programs = [program for program in programs if not operand.excludes(program)]
+        if operation.IDENTITY is not None and (position == len(combination) - 1 or operation.COMMUTATIVE):
+            programs = [program for program in programs if not is_int_literal(program, operation.IDENTITY)]
+        layers.append(programs)
+
+    if len(layers) == 1:
+        for program in layers[0]:
+            yield (program,)
+        return
+
+    *outer_layers, layer1, layer2 = layers
+    distinct = operation.DISTINCT_OPERANDS
+    if distinct is not None:
+        same = program_key if distinct == 'key' else id
+        layer2_keys = [same(program) for program in layer2]
+    ordered = operation.COMMUTATIVE and combination[0] == combination[1]
+    if ordered:
+        # positions in the second layer, the first one may only hold a part of the same layer (see bus.py)
+        positions = {id(program): index for index, program in enumerate(layer2)}
+
+    for outer_operands in itertools.product(*outer_layers):
+        for program1 in layer1:
+            start = positions[id(program1)] if ordered else 0
+            if distinct is None:
+                for program2 in layer2[start:]:
+                    yield outer_operands + (program1, program2)
+                continue
+            key1 = same(program1)
+            for program2, key2 in zip(layer2[start:], layer2_keys[start:]):
+                if key1 != key2:
+                    yield outer_operands + (program1, program2)
+
+
 class Str:
+    CHILDREN = ()
+    __slots__ = PROGRAM_SLOTS
+    # Normal form rules of the operations, see grow_operands.
+    OPERANDS = ()
+    COMMUTATIVE = False
+    IDENTITY = None
+    DISTINCT_OPERANDS = None
+    GROWN_AS = None
+
     def __init__(self):
         self.size = 0
 
     def getReturnType(self):
         return STR_TYPES['type']
 
+    def getKey(self):
+        return program_key(self)
+
     @classmethod
     def name(cls):
         return cls.__name__
 
 
 class StrLiteral(Str):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
         try:
@@ -38,6 +211,8 @@ class StrLiteral(Str):
 
 
 class StrVar(Str):
+    __slots__ = ('value',)
+
     def __init__(self, name):
         self.value = name
         try:
@@ -58,6 +233,10 @@ class StrVar(Str):
 
 class StrConcat(Str):
     ARITY = 2
+    # concat(concat(a, b), c) is grown as concat(a, concat(b, c))
+    OPERANDS = (Operand(STR_TYPE, ('StrConcat',), 'empty'), Operand(STR_TYPE, excluded_literals='empty'))
+    CHILDREN = ('x', 'y')
+    __slots__ = CHILDREN
 
     def __init__(self, x, y):
         self.x = x
@@ -72,7 +251,13 @@ class StrConcat(Str):
         return 'concat(' + self.x.toString() + ", " + self.y.toString() + ")"
 
     def interpret(self, env):
-        return self.x.interpret(env) + self.y.interpret(env)
+        x = self.x.interpret(env)
+        if x is ERROR:
+            return ERROR
+        y = self.y.interpret(env)
+        if y is ERROR:
+            return ERROR
+        return x + y
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
@@ -80,25 +265,18 @@ class StrConcat(Str):
         self.y.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        # skip if the cost combination exceeds the limit
-        layer1, layer2 = combination
-        # retrive bank of programs with costs c[0] and c[1]
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLiteral) and prog1.toString() == EMPTY_STRING:
-                continue
-            for prog2 in layer2_prog:
-                if isinstance(prog2, StrLiteral) and prog2.toString() == EMPTY_STRING:
-                    continue
-                program = StrConcat(prog1, prog2)
-                yield program
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrConcat, plist, combination, first_operands):
+            yield StrConcat(*operands)
 
 
 class StrReplace(Str):
     ARITY = 3
+    OPERANDS = (Operand(STR_TYPE, ('StrLiteral',)), Operand(STR_TYPE, ('StrVar',), 'empty'), Operand(STR_TYPE))
+    # x.replace(a, a) = x
+    DISTINCT_OPERANDS = 'key'
+    CHILDREN = ('str', 'old', 'new')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, old, new):
         self.str = input_str
@@ -115,7 +293,16 @@ class StrReplace(Str):
         return self.str.toString() + '.replace(' + self.old.toString() + ", " + self.new.toString() + ")"
 
     def interpret(self, env):
-        return self.str.interpret(env).replace(self.old.interpret(env), self.new.interpret(env), 1)
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        old = self.old.interpret(env)
+        if old is ERROR:
+            return ERROR
+        new = self.new.interpret(env)
+        if new is ERROR:
+            return ERROR
+        return input_str.replace(old, new, 1)
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
@@ -124,29 +311,18 @@ class StrReplace(Str):
         self.new.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2, layer3 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-        layer3_prog = plist.get_programs(layer3, STR_TYPES['type'])
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLiteral):
-                continue
-            for prog2 in layer2_prog:
-                p2_str = prog2.toString()
-                if p2_str == EMPTY_STRING:
-                    continue
-                is_p2_var = isinstance(prog2, StrVar)
-                if is_p2_var:
-                    continue
-                for prog3 in layer3_prog:
-                    if prog3.toString() == p2_str:
-                        continue
-                    yield StrReplace(prog1, prog2, prog3)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrReplace, plist, combination, first_operands):
+            yield StrReplace(*operands)
 
 
 class StrSubstr(Str):
     ARITY = 3
+    OPERANDS = (Operand(STR_TYPE, ('StrLiteral',)), Operand(INT_TYPE), Operand(INT_TYPE))
+    # x.Substr(a, a) = ""
+    DISTINCT_OPERANDS = 'key'
+    CHILDREN = ('str', 'start', 'end')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, start, end):
         self.str = input_str
@@ -163,7 +339,16 @@ class StrSubstr(Str):
         return self.str.toString() + ".Substr(" + self.start.toString() + "," + self.end.toString() + ")"
 
     def interpret(self, env):
-        return self.str.interpret(env)[self.start.interpret(env): self.end.interpret(env)]
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        start = self.start.interpret(env)
+        if start is ERROR:
+            return ERROR
+        end = self.end.interpret(env)
+        if end is ERROR:
+            return ERROR
+        return input_str[start: end]
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
@@ -172,24 +357,18 @@ class StrSubstr(Str):
         self.end.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2, layer3 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-        layer3_prog = plist.get_programs(layer3, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLiteral):
-                continue
-            for prog2 in layer2_prog:
-                for prog3 in layer3_prog:
-                    if prog2.toString() == prog3.toString():
-                        continue
-                    yield StrSubstr(prog1, prog2, prog3)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrSubstr, plist, combination, first_operands):
+            yield StrSubstr(*operands)
 
 
 class StrIte(Str):
     ARITY = 3
+    OPERANDS = (Operand(BOOL_TYPE), Operand(STR_TYPE), Operand(STR_TYPE))
+    # ite(c, a, a) = a
+    DISTINCT_OPERANDS = 'program'
+    CHILDREN = ('condition', 'true_case', 'false_case')
+    __slots__ = CHILDREN
 
     def __init__(self, condition, true_case, false_case):
         self.condition = condition
@@ -206,7 +385,10 @@ class StrIte(Str):
         return "(if" + self.condition.toString() + " then " + self.true_case.toString() + " else " + self.false_case.toString() + ")"
 
     def interpret(self, env):
-        if self.condition.interpret(env):
+        condition = self.condition.interpret(env)
+        if condition is ERROR:
+            return ERROR
+        if condition:
             return self.true_case.interpret(env)
         else:
             return self.false_case.interpret(env)
@@ -218,20 +400,16 @@ class StrIte(Str):
         self.false_case.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2, layer3 = combination
-        layer1_prog = plist.get_programs(layer1, BOOL_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-        layer3_prog = plist.get_programs(layer3, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                for prog3 in layer3_prog:
-                    yield StrIte(prog1, prog2, prog3)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrIte, plist, combination, first_operands):
+            yield StrIte(*operands)
 
 
 class StrIntToStr(Str):
     ARITY = 1
+    OPERANDS = (Operand(INT_TYPE),)
+    CHILDREN = ('int',)
+    __slots__ = CHILDREN
 
     def __init__(self, input_int):
         self.int = input_int
@@ -245,24 +423,27 @@ class StrIntToStr(Str):
         return self.int.toString() + ".IntToStr()"
 
     def interpret(self, env):
-        return str(self.int.interpret(env))
+        value = self.int.interpret(env)
+        if value is ERROR:
+            return ERROR
+        return str(value)
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
         self.int.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1 = combination[0]
-
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            yield StrIntToStr(prog1)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrIntToStr, plist, combination, first_operands):
+            yield StrIntToStr(*operands)
 
 
 class StrLower(Str):
     ARITY = 1
+    # lower(lower(x)) = lower(x), lower(upper(x)) = lower(x)
+    OPERANDS = (Operand(STR_TYPE, ('StrLower', 'StrUpper'), 'lower'),)
+    CHILDREN = ('str',)
+    __slots__ = CHILDREN
 
     def __init__(self, input_str):
         self.str = input_str
@@ -276,25 +457,27 @@ class StrLower(Str):
         return self.str.toString() + ".lower()"
 
     def interpret(self, env):
-        return self.str.interpret(env).lower()
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        return input_str.lower()
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
         self.str.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1 = combination[0]
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLower):
-                continue
-            yield StrLower(prog1)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrLower, plist, combination, first_operands):
+            yield StrLower(*operands)
 
 
 class StrUpper(Str):
     ARITY = 1
+    # upper(upper(x)) = upper(x), upper(lower(x)) = upper(x)
+    OPERANDS = (Operand(STR_TYPE, ('StrLower', 'StrUpper'), 'upper'),)
+    CHILDREN = ('str',)
+    __slots__ = CHILDREN
 
     def __init__(self, input_str):
         self.str = input_str
@@ -308,25 +491,26 @@ class StrUpper(Str):
         return self.str.toString() + ".upper()"
 
     def interpret(self, env):
-        return self.str.interpret(env).upper()
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        return input_str.upper()
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
         self.str.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1 = combination[0]
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrUpper):
-                continue
-            yield StrUpper(prog1)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrUpper, plist, combination, first_operands):
+            yield StrUpper(*operands)
 
 
 class StrCharAt(Str):
     ARITY = 2
+    OPERANDS = (Operand(STR_TYPE, excluded_literals='empty'), Operand(INT_TYPE))
+    CHILDREN = ('str', 'pos')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, pos):
         self.str = input_str
@@ -342,10 +526,14 @@ class StrCharAt(Str):
 
     def interpret(self, env):
         index = self.pos.interpret(env)
+        if index is ERROR:
+            return ERROR
         string_element = self.str.interpret(env)
+        if string_element is ERROR:
+            return ERROR
         if 0 <= index < len(string_element):
             return string_element[index]
-        return None
+        return ERROR
 
     def getProgramIds(self, program_ids):
         program_ids.add(self)
@@ -353,37 +541,45 @@ class StrCharAt(Str):
         self.pos.getProgramIds(program_ids)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLiteral) and prog1.toString() == EMPTY_STRING:
-                continue
-            for prog2 in layer2_prog:
-                yield StrCharAt(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(StrCharAt, plist, combination, first_operands):
+            yield StrCharAt(*operands)
 
 
 # String type and classes
-STR_TYPES = {'type': 'str', 'classes': (StrLiteral, StrVar, StrConcat, StrReplace,
+STR_TYPES = {'type': STR_TYPE, 'classes': (StrLiteral, StrVar, StrConcat, StrReplace,
                                         StrSubstr, StrIte, StrIntToStr, StrCharAt, StrLower, StrUpper)}
 
 
 # Contains all operations with return type int
 
 class Int:
+    CHILDREN = ()
+    __slots__ = PROGRAM_SLOTS
+    # Normal form rules of the operations, see grow_operands.
+    OPERANDS = ()
+    COMMUTATIVE = False
+    IDENTITY = None
+    DISTINCT_OPERANDS = None
+    GROWN_AS = None
+
     def __init__(self):
         self.size = 0
 
     def getReturnType(self):
         return INT_TYPES['type']
 
+    def getKey(self):
+        return program_key(self)
+
     @classmethod
     def name(cls):
         return cls.__name__
 
 
 class IntLiteral(Int):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
         try:
@@ -403,6 +599,8 @@ class IntLiteral(Int):
 
 
 class IntVar(Int):
+    __slots__ = ('value',)
+
     def __init__(self, name):
         self.value = name
         try:
@@ -423,6 +621,9 @@ class IntVar(Int):
 
 class IntStrToInt(Int):
     ARITY = 1
+    OPERANDS = (Operand(STR_TYPE),)
+    CHILDREN = ('str',)
+    __slots__ = CHILDREN
 
     def __init__(self, input_str):
         self.str = input_str
@@ -437,26 +638,29 @@ class IntStrToInt(Int):
 
     def interpret(self, env):
         value = self.str.interpret(env)
+        if value is ERROR:
+            return ERROR
         if regex_only_digits.search(value) is not None:
             return int(value)
-        return None
+        return ERROR
 
     def getProgramIds(self, programIds):
         programIds.add(self)
         self.str.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1 = combination[0]
-
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            yield IntStrToInt(prog1)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntStrToInt, plist, combination, first_operands):
+            yield IntStrToInt(*operands)
 
 
 class IntPlus(Int):
     ARITY = 2
+    OPERANDS = (Operand(INT_TYPE), Operand(INT_TYPE))
+    COMMUTATIVE = True
+    IDENTITY = 0
+    CHILDREN = ('left', 'right')
+    __slots__ = CHILDREN
 
     def __init__(self, left, right):
         self.left = left
@@ -471,7 +675,13 @@ class IntPlus(Int):
         return "(" + self.left.toString() + " + " + self.right.toString() + ")"
 
     def interpret(self, env):
-        return self.left.interpret(env) + self.right.interpret(env)
+        left = self.left.interpret(env)
+        if left is ERROR:
+            return ERROR
+        right = self.right.interpret(env)
+        if right is ERROR:
+            return ERROR
+        return left + right
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -479,19 +689,18 @@ class IntPlus(Int):
         self.right.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield IntPlus(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntPlus, plist, combination, first_operands):
+            yield IntPlus(*operands)
 
 
 class IntMinus(Int):
     ARITY = 2
+    OPERANDS = (Operand(INT_TYPE), Operand(INT_TYPE))
+    IDENTITY = 0
+    DISTINCT_OPERANDS = 'key'
+    CHILDREN = ('left', 'right')
+    __slots__ = CHILDREN
 
     def __init__(self, left, right):
         self.left = left
@@ -506,7 +715,13 @@ class IntMinus(Int):
         return "(" + self.left.toString() + " - " + self.right.toString() + ")"
 
     def interpret(self, env):
-        return self.left.interpret(env) - self.right.interpret(env)
+        left = self.left.interpret(env)
+        if left is ERROR:
+            return ERROR
+        right = self.right.interpret(env)
+        if right is ERROR:
+            return ERROR
+        return left - right
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -514,19 +729,18 @@ class IntMinus(Int):
         self.right.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield IntMinus(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntMinus, plist, combination, first_operands):
+            yield IntMinus(*operands)
 
 
 class IntMultiply(Int):
     ARITY = 2
+    OPERANDS = (Operand(INT_TYPE), Operand(INT_TYPE))
+    COMMUTATIVE = True
+    IDENTITY = 1
+    CHILDREN = ('left', 'right')
+    __slots__ = CHILDREN
 
     def __init__(self, left, right):
         self.left = left
@@ -541,7 +755,13 @@ class IntMultiply(Int):
         return "(" + self.left.toString() + " * " + self.right.toString() + ")"
 
     def interpret(self, env):
-        return self.left.interpret(env) * self.right.interpret(env)
+        left = self.left.interpret(env)
+        if left is ERROR:
+            return ERROR
+        right = self.right.interpret(env)
+        if right is ERROR:
+            return ERROR
+        return left * right
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -549,19 +769,16 @@ class IntMultiply(Int):
         self.right.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield IntMultiply(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntMultiply, plist, combination, first_operands):
+            yield IntMultiply(*operands)
 
 
 class IntModulo(Int):
     ARITY = 2
+    OPERANDS = (Operand(INT_TYPE), Operand(INT_TYPE))
+    CHILDREN = ('left', 'right')
+    __slots__ = CHILDREN
 
     def __init__(self, left, right):
         self.left = left
@@ -576,10 +793,13 @@ class IntModulo(Int):
         return "(" + self.left.toString() + " % " + self.right.toString() + ")"
 
     def interpret(self, env):
-        try:
-            return self.left.interpret(env) % self.right.interpret(env)
-        except ZeroDivisionError:
-            return None
+        left = self.left.interpret(env)
+        if left is ERROR:
+            return ERROR
+        right = self.right.interpret(env)
+        if right is ERROR or right == 0:
+            return ERROR
+        return left % right
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -587,19 +807,16 @@ class IntModulo(Int):
         self.right.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield IntModulo(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntModulo, plist, combination, first_operands):
+            yield IntModulo(*operands)
 
 
 class IntLength(Int):
     ARITY = 1
+    OPERANDS = (Operand(STR_TYPE),)
+    CHILDREN = ('str',)
+    __slots__ = CHILDREN
 
     def __init__(self, input_str):
         self.str = input_str
@@ -613,23 +830,28 @@ class IntLength(Int):
         return self.str.toString() + ".Length()"
 
     def interpret(self, env):
-        return len(self.str.interpret(env))
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        return len(input_str)
 
     def getProgramIds(self, programIds):
         programIds.add(self)
         self.str.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1 = combination[0]
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            yield IntLength(prog1)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntLength, plist, combination, first_operands):
+            yield IntLength(*operands)
 
 
 class IntIteInt(Int):
     ARITY = 3
+    OPERANDS = (Operand(BOOL_TYPE), Operand(INT_TYPE), Operand(INT_TYPE))
+    # ite(c, a, a) = a
+    DISTINCT_OPERANDS = 'program'
+    CHILDREN = ('condition', 'true_case', 'false_case')
+    __slots__ = CHILDREN
 
     def __init__(self, condition, true_case, false_case):
         self.condition = condition
@@ -646,7 +868,10 @@ class IntIteInt(Int):
         return "(if" + self.condition.toString() + " then " + self.true_case.toString() + " else " + self.false_case.toString() + ")"
 
     def interpret(self, env):
-        if self.condition.interpret(env):
+        condition = self.condition.interpret(env)
+        if condition is ERROR:
+            return ERROR
+        if condition:
             return self.true_case.interpret(env)
         else:
             return self.false_case.interpret(env)
@@ -658,20 +883,17 @@ class IntIteInt(Int):
         self.false_case.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2, layer3 = combination
-        layer1_prog = plist.get_programs(layer1, BOOL_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-        layer3_prog = plist.get_programs(layer3, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                for prog3 in layer3_prog:
-                    yield IntIteInt(prog1, prog2, prog3)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntIteInt, plist, combination, first_operands):
+            yield IntIteInt(*operands)
 
 
 class IntIndexOf(Int):
     ARITY = 3
+    OPERANDS = (Operand(STR_TYPE, excluded_literals='empty'), Operand(STR_TYPE, excluded_literals='empty'),
+                Operand(INT_TYPE))
+    CHILDREN = ('input_str', 'substr', 'start')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, substr, start):
         self.input_str = input_str
@@ -689,14 +911,18 @@ class IntIndexOf(Int):
 
     def interpret(self, env):
         start_position = self.start.interpret(env)
+        if start_position is ERROR:
+            return ERROR
         sub_string = self.substr.interpret(env)
+        if sub_string is ERROR:
+            return ERROR
         super_string = self.input_str.interpret(env)
-        index = None
-        try:
-            index = super_string.index(sub_string, start_position)
-        except ValueError as ve:
-            pass
-        return index
+        if super_string is ERROR:
+            return ERROR
+        # A substring that is not found is ERROR, as in the original interpreter (str.index raised and the
+        # program was discarded), not the -1 of the SyGuS str.indexof.
+        index = super_string.find(sub_string, start_position)
+        return index if index != -1 else ERROR
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -705,25 +931,17 @@ class IntIndexOf(Int):
         self.start.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2, layer3 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-        layer3_prog = plist.get_programs(layer3, INT_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLiteral) and prog1.toString() == EMPTY_STRING:
-                continue
-            for prog2 in layer2_prog:
-                if isinstance(prog2, StrLiteral) and prog2.toString() == EMPTY_STRING:
-                    continue
-                for prog3 in layer3_prog:
-                    yield IntIndexOf(prog1, prog2, prog3)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntIndexOf, plist, combination, first_operands):
+            yield IntIndexOf(*operands)
 
 
 # bustle additional integer classes (equivalent of intfind)
 class IntFirstIndexOf(Int):
     ARITY = 2
+    OPERANDS = (Operand(STR_TYPE, excluded_literals='empty'), Operand(STR_TYPE, excluded_literals='empty'))
+    CHILDREN = ('input_str', 'substr')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, substr):
         self.input_str = input_str
@@ -740,13 +958,15 @@ class IntFirstIndexOf(Int):
 
     def interpret(self, env):
         sub_string = self.substr.interpret(env)
+        if sub_string is ERROR:
+            return ERROR
         super_string = self.input_str.interpret(env)
-        index = None
-        try:
-            index = super_string.index(sub_string)
-        except ValueError as ve:
-            pass
-        return index
+        if super_string is ERROR:
+            return ERROR
+        # A substring that is not found is ERROR, as in the original interpreter (str.index raised and the
+        # program was discarded), not the -1 of the SyGuS str.indexof.
+        index = super_string.find(sub_string)
+        return index if index != -1 else ERROR
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -754,40 +974,45 @@ class IntFirstIndexOf(Int):
         self.substr.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-
-        for prog1 in layer1_prog:
-            if isinstance(prog1, StrLiteral) and prog1.toString() == EMPTY_STRING:
-                continue
-            for prog2 in layer2_prog:
-                if isinstance(prog2, StrLiteral) and prog2.toString() == EMPTY_STRING:
-                    continue
-                yield IntFirstIndexOf(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(IntFirstIndexOf, plist, combination, first_operands):
+            yield IntFirstIndexOf(*operands)
 
 
 # Integer type and classes
-INT_TYPES = {'type': 'integer', 'classes': (IntLiteral, IntVar, IntStrToInt, IntPlus, IntMultiply, IntModulo,
+INT_TYPES = {'type': INT_TYPE, 'classes': (IntLiteral, IntVar, IntStrToInt, IntPlus, IntMultiply, IntModulo,
                                             IntMinus, IntLength, IntIteInt, IntIndexOf, IntFirstIndexOf)}
 
 # Contains all operations with return type bool
 
 
 class Bool:
+    CHILDREN = ()
+    __slots__ = PROGRAM_SLOTS
+    # Normal form rules of the operations, see grow_operands.
+    OPERANDS = ()
+    COMMUTATIVE = False
+    IDENTITY = None
+    DISTINCT_OPERANDS = None
+    GROWN_AS = None
+
     def __init__(self):
         self.size = 0
 
     def getReturnType(self):
         return BOOL_TYPES['type']
 
+    def getKey(self):
+        return program_key(self)
+
     @classmethod
     def name(cls):
         return cls.__name__
 
 
 class BoolLiteral(Bool):
+    __slots__ = ('bool',)
+
     def __init__(self, boolean):
         self.bool = True if boolean is True else False
         try:
@@ -808,6 +1033,14 @@ class BoolLiteral(Bool):
 
 class BoolEqual(Bool):
     ARITY = 2
+    # operands of every type, a == a is always true
+    OPERANDS = (Operand(None), Operand(None))
+    COMMUTATIVE = True
+    DISTINCT_OPERANDS = 'program'
+    # types of operands that are never equal, BoolEqual(1, 2) is grown for them
+    INCOMPARABLE_TYPES = {(STR_TYPE, INT_TYPE), (INT_TYPE, STR_TYPE), (BOOL_TYPE, STR_TYPE), (STR_TYPE, BOOL_TYPE)}
+    CHILDREN = ('left', 'right')
+    __slots__ = CHILDREN
 
     def __init__(self, left, right):
         self.left = left
@@ -822,7 +1055,13 @@ class BoolEqual(Bool):
         return "Equal(" + self.left.toString() + "," + self.right.toString() + ")"
 
     def interpret(self, env):
-        return True if self.left.interpret(env) == self.right.interpret(env) else False
+        left = self.left.interpret(env)
+        if left is ERROR:
+            return ERROR
+        right = self.right.interpret(env)
+        if right is ERROR:
+            return ERROR
+        return True if left == right else False
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -830,26 +1069,19 @@ class BoolEqual(Bool):
         self.right.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs_all(layer1)
-        layer2_prog = plist.get_programs_all(layer2)
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                if (
-                        (isinstance(prog1, STR_TYPES['classes']) and isinstance(prog2, INT_TYPES['classes'])) or
-                        (isinstance(prog1, INT_TYPES['classes']) and isinstance(prog2, STR_TYPES['classes'])) or
-                        (isinstance(prog1, BOOL_TYPES['classes']) and isinstance(prog2, STR_TYPES['classes'])) or
-                        (isinstance(prog1, STR_TYPES['classes']) and isinstance(
-                            prog2, BOOL_TYPES['classes']))
-                ):
-                    yield BoolEqual(IntLiteral(1), IntLiteral(2))
-                else:
-                    yield BoolEqual(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for left, right in grow_operands(BoolEqual, plist, combination, first_operands):
+            if (left.getReturnType(), right.getReturnType()) in BoolEqual.INCOMPARABLE_TYPES:
+                yield BoolEqual(IntLiteral(1), IntLiteral(2))
+            else:
+                yield BoolEqual(left, right)
 
 
 class BoolContain(Bool):
     ARITY = 2
+    OPERANDS = (Operand(STR_TYPE), Operand(STR_TYPE))
+    CHILDREN = ('str', 'substr')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, substr):
         self.str = input_str
@@ -865,7 +1097,13 @@ class BoolContain(Bool):
         return self.str.toString() + ".Contain(" + self.substr.toString() + ")"
 
     def interpret(self, env):
-        return True if self.substr.interpret(env) in self.str.interpret(env) else False
+        sub_string = self.substr.interpret(env)
+        if sub_string is ERROR:
+            return ERROR
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        return True if sub_string in input_str else False
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -873,17 +1111,16 @@ class BoolContain(Bool):
         self.substr.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield BoolContain(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(BoolContain, plist, combination, first_operands):
+            yield BoolContain(*operands)
 
 
 class BoolSuffixof(Bool):
     ARITY = 2
+    OPERANDS = (Operand(STR_TYPE), Operand(STR_TYPE))
+    CHILDREN = ('str', 'suffix')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, suffix):
         self.str = input_str
@@ -899,7 +1136,13 @@ class BoolSuffixof(Bool):
         return self.suffix.toString() + ".SuffixOf(" + self.str.toString() + ")"
 
     def interpret(self, env):
-        return True if self.str.interpret(env).endswith(self.suffix.interpret(env)) else False
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        suffix = self.suffix.interpret(env)
+        if suffix is ERROR:
+            return ERROR
+        return True if input_str.endswith(suffix) else False
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -907,17 +1150,16 @@ class BoolSuffixof(Bool):
         self.suffix.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield BoolSuffixof(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(BoolSuffixof, plist, combination, first_operands):
+            yield BoolSuffixof(*operands)
 
 
 class BoolPrefixof(Bool):
     ARITY = 2
+    OPERANDS = (Operand(STR_TYPE), Operand(STR_TYPE))
+    CHILDREN = ('str', 'prefix')
+    __slots__ = CHILDREN
 
     def __init__(self, input_str, prefix):
         self.str = input_str
@@ -933,7 +1175,13 @@ class BoolPrefixof(Bool):
         return self.prefix.toString() + ".Prefixof(" + self.str.toString() + ")"
 
     def interpret(self, env):
-        return True if self.str.interpret(env).startswith(self.prefix.interpret(env)) else False
+        input_str = self.str.interpret(env)
+        if input_str is ERROR:
+            return ERROR
+        prefix = self.prefix.interpret(env)
+        if prefix is ERROR:
+            return ERROR
+        return True if input_str.startswith(prefix) else False
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -941,17 +1189,17 @@ class BoolPrefixof(Bool):
         self.prefix.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, STR_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, STR_TYPES['type'])
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                yield BoolPrefixof(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(BoolPrefixof, plist, combination, first_operands):
+            yield BoolPrefixof(*operands)
 
 
 class BoolGreaterThan(Bool):
     ARITY = 2
+    OPERANDS = (Operand(INT_TYPE), Operand(INT_TYPE))
+    DISTINCT_OPERANDS = 'key'
+    CHILDREN = ('first_int', 'second_int')
+    __slots__ = CHILDREN
 
     def __init__(self, first_int, second_int):
         self.first_int = first_int
@@ -967,7 +1215,13 @@ class BoolGreaterThan(Bool):
         return self.first_int.toString() + " > " + self.second_int.toString()
 
     def interpret(self, env):
-        return True if self.first_int.interpret(env) > self.second_int.interpret(env) else False
+        first_int = self.first_int.interpret(env)
+        if first_int is ERROR:
+            return ERROR
+        second_int = self.second_int.interpret(env)
+        if second_int is ERROR:
+            return ERROR
+        return True if first_int > second_int else False
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -975,19 +1229,19 @@ class BoolGreaterThan(Bool):
         self.second_int.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                if prog1.toString() == prog2.toString():
-                    continue
-                yield BoolGreaterThan(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(BoolGreaterThan, plist, combination, first_operands):
+            yield BoolGreaterThan(*operands)
 
 
 class BoolLessThan(Bool):
     ARITY = 2
+    OPERANDS = (Operand(INT_TYPE), Operand(INT_TYPE))
+    DISTINCT_OPERANDS = 'key'
+    # a < b is grown as b > a
+    GROWN_AS = BoolGreaterThan
+    CHILDREN = ('first_int', 'second_int')
+    __slots__ = CHILDREN
 
     def __init__(self, first_int, second_int):
         self.first_int = first_int
@@ -1003,7 +1257,13 @@ class BoolLessThan(Bool):
         return self.first_int.toString() + " < " + self.second_int.toString()
 
     def interpret(self, env):
-        return True if self.first_int.interpret(env) < self.second_int.interpret(env) else False
+        first_int = self.first_int.interpret(env)
+        if first_int is ERROR:
+            return ERROR
+        second_int = self.second_int.interpret(env)
+        if second_int is ERROR:
+            return ERROR
+        return True if first_int < second_int else False
 
     def getProgramIds(self, programIds):
         programIds.add(self)
@@ -1011,20 +1271,14 @@ class BoolLessThan(Bool):
         self.second_int.getProgramIds(programIds)
 
     @staticmethod
-    def grow(plist, combination):
-        layer1, layer2 = combination
-        layer1_prog = plist.get_programs(layer1, INT_TYPES['type'])
-        layer2_prog = plist.get_programs(layer2, INT_TYPES['type'])
-        for prog1 in layer1_prog:
-            for prog2 in layer2_prog:
-                if prog1.toString() == prog2.toString():
-                    continue
-                yield BoolGreaterThan(prog1, prog2)
+    def grow(plist, combination, first_operands=slice(None)):
+        for operands in grow_operands(BoolLessThan, plist, combination, first_operands):
+            yield BoolGreaterThan(*operands)
 
 
 # Boolean classes and terminals
 
-BOOL_TYPES = {'type': 'boolean', 'classes': (BoolLiteral, BoolEqual, BoolContain,
+BOOL_TYPES = {'type': BOOL_TYPE, 'classes': (BoolLiteral, BoolEqual, BoolContain,
                                              BoolSuffixof, BoolPrefixof, BoolGreaterThan, BoolGreaterThan)}
 TERMINALS = [StrLiteral, StrVar, IntLiteral, IntVar, BoolLiteral]
 
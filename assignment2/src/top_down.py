@@ -0,0 +1,409 @@
+from datetime import datetime
+from itertools import product
+import logging
+import math
+import os
+import sys
+
+from bus import Search
+from sygus_parser import StrParser
+from sygus_string_dsl import *
+from utils import *
+
+
+class TopDownSearch():
+    """
+        Top-down deduction (FlashFill style) over the string DSL.
+
+        A small bank of programs is enumerated bottom-up and indexed by outputs. A target is looked up in
+        the bank first; otherwise the witness functions of StrLower/StrUpper, StrSubstr, StrCharAt,
+        StrReplace, StrConcat and IntFirstIndexOf/IntIndexOf turn the target into the values their arguments
+        must take on every example, and the arguments are deduced in turn.
+
+        A string specification is the tuple of the required outputs. An integer specification is a tuple
+        holding, per example, the frozenset of the accepted outputs (e.g. every position of a substring).
+    """
+
+    def __init__(self, bank_size=TOP_DOWN_BANK_SIZE, depth=TOP_DOWN_DEPTH):
+        self.bank_size = bank_size
+        self.depth = depth
+        self.evals = 0
+        self.deductions = 0
+        self.string_memo = {}
+        self.integer_memo = {}
+
+    def build_bank(self, grammar_nt, str_var, str_literals, int_var, int_literals, test_cases,
+                   literal_tiers=None):
+        """
+            Enumerates the bank, returns a program of the bank that already satisfies the examples or None.
+        """
+        self.test_cases = test_cases
+        search = Search()
+        program, self.evals = search.synthesize(self.bank_size, grammar_nt, str_var, str_literals,
+                                                int_var, int_literals, test_cases, literal_tiers)
+        if (program is not None):
+            return program
+
+        # [(program, outputs), ...] in the order of the bank, smaller programs first.
+        self.strings = []
+        self.integers = []
+        for size in sorted(search.plist.plist):
+            for program, outputs in zip(search.plist.get_programs(size, STR_TYPES['type']),
+                                        search.plist.get_outputs(size, STR_TYPES['type'])):
+                self.strings.append((program, tuple(outputs)))
+            for program, outputs in zip(search.plist.get_programs(size, INT_TYPES['type']),
+                                        search.plist.get_outputs(size, INT_TYPES['type'])):
+                self.integers.append((program, tuple(outputs)))
+
+        # outputs -> program, and lower/upper case outputs -> program, the first (smallest) program wins.
+        self.string_index = {}
+        self.lower_index = {}
+        self.upper_index = {}
+        # output on the first example -> [(program, outputs), ...], used to find substrings.
+        self.first_output_index = {}
+        for program, outputs in self.strings:
+            self.string_index.setdefault(outputs, program)
+            self.lower_index.setdefault(tuple(output.lower() for output in outputs), program)
+            self.upper_index.setdefault(tuple(output.upper() for output in outputs), program)
+            self.first_output_index.setdefault(outputs[0], []).append((program, outputs))
+
+        # outputs -> (position in the bank, program)
+        self.integer_index = {}
+        for position, (program, outputs) in enumerate(self.integers):
+            self.integer_index.setdefault(outputs, (position, program))
+        # The values of the integer programs of the bank on each example.
+        self.integer_values = [set(outputs[index] for _, outputs in self.integers)
+                               for index in range(len(test_cases))]
+        return None
+
+    """
+        String deduction
+    """
+
+    def deduce_string(self, target, depth):
+        if (target in self.string_index):
+            return self.string_index[target]
+        if (depth == 0):
+            return None
+
+        key = (target, depth)
+        if (key in self.string_memo):
+            return self.string_memo[key]
+        # Cut cycles (e.g. concat of an empty string) while the target is being deduced.
+        self.string_memo[key] = None
+
+        program = None
+        for witness in (self.witness_case, self.witness_substr, self.witness_char_at,
+                        self.witness_replace, self.witness_concat):
+            self.deductions += 1
+            program = witness(target, depth)
+            if (program is not None):
+                break
+
+        self.string_memo[key] = program
+        return program
+
+    def witness_case(self, target, depth):
+        if (all(output == output.lower() for output in target) and target in self.lower_index):
+            return StrLower(self.lower_index[target])
+        if (all(output == output.upper() for output in target) and target in self.upper_index):
+            return StrUpper(self.upper_index[target])
+        return None
+
+    def witness_substr(self, target, depth):
+        # An empty target is the substring of any string, the start and end values are not bounded.
+        if (any(output == "" for output in target)):
+            return None
+
+        for source, source_outputs in self.strings:
+            if (source_outputs == target or
+                    not all(output in source_output for output, source_output in zip(target, source_outputs))):
+                continue
+
+            # Substr clamps its bounds to the string: a start before -len is 0 and an end after len is len. The
+            # accepted values out of the string are the ones the integer programs of the bank take.
+            start_specification = []
+            for index, (output, source_output) in enumerate(zip(target, source_outputs)):
+                starts = set(start for position in find_all(source_output, output)
+                             for start in (position, position - len(source_output)))
+                if (source_output.startswith(output)):
+                    starts.update(value for value in self.integer_values[index] if value < -len(source_output))
+                start_specification.append(frozenset(starts))
+
+            for start_program, start_outputs in self.integer_candidates(tuple(start_specification), depth - 1):
+                end_specification = []
+                for index, (output, source_output, start) in enumerate(zip(target, source_outputs, start_outputs)):
+                    if (start < 0):
+                        start = max(start + len(source_output), 0)
+                    end = start + len(output)
+                    # A negative end counts from the end of the string, 0 would mean the start of the string.
+                    if (end < len(source_output)):
+                        end_specification.append(frozenset((end, end - len(source_output))))
+                    else:
+                        end_specification.append(frozenset(
+                            [end] + [value for value in self.integer_values[index] if value > end]))
+
+                end_program = self.deduce_integer(tuple(end_specification), depth - 1)
+                if (end_program is not None):
+                    return StrSubstr(source, start_program, end_program)
+        return None
+
+    def witness_char_at(self, target, depth):
+        if (not all(len(output) == 1 for output in target)):
+            return None
+
+        for source, source_outputs in self.strings:
+            if (not all(output in source_output for output, source_output in zip(target, source_outputs))):
+                continue
+
+            position_specification = tuple(frozenset(find_all(source_output, output))
+                                           for output, source_output in zip(target, source_outputs))
+            position_program = self.deduce_integer(position_specification, depth - 1)
+            if (position_program is not None):
+                return StrCharAt(source, position_program)
+        return None
+
+    def witness_replace(self, target, depth):
+        # The string to replace is taken from the literals, the source and the replacement from the bank.
+        old_programs = [(program, outputs) for program, outputs in self.strings
+                        if isinstance(program, StrLiteral) and program.value != ""]
+
+        for source, source_outputs in self.strings:
+            if (source_outputs == target):
+                continue
+
+            for old, old_outputs in old_programs:
+                new_target = []
+                for output, source_output, old_output in zip(target, source_outputs, old_outputs):
+                    position = source_output.find(old_output)
+                    suffix_length = len(source_output) - position - len(old_output)
+                    if (position == -1 or len(output) < position + suffix_length or
+                            output[:position] != source_output[:position] or
+                            output[len(output) - suffix_length:] != source_output[len(source_output) - suffix_length:]):
+                        break
+                    new_target.append(output[position:len(output) - suffix_length])
+                else:
+                    new = self.deduce_string(tuple(new_target), depth - 1)
+                    if (new is not None):
+                        return StrReplace(source, old, new)
+        return None
+
+    def witness_concat(self, target, depth):
+        # A non empty prefix from the bank and the rest deduced, then a non empty suffix from the bank.
+        for left, left_outputs in self.strings:
+            if (all(output.startswith(left_output) and 0 < len(left_output) < len(output)
+                    for output, left_output in zip(target, left_outputs))):
+                right = self.deduce_string(tuple(output[len(left_output):]
+                                                 for output, left_output in zip(target, left_outputs)), depth - 1)
+                if (right is not None):
+                    return StrConcat(left, right)
+
+        for right, right_outputs in self.strings:
+            if (all(output.endswith(right_output) and 0 < len(right_output) < len(output)
+                    for output, right_output in zip(target, right_outputs))):
+                left = self.deduce_string(tuple(output[:len(output) - len(right_output)]
+                                                for output, right_output in zip(target, right_outputs)), depth - 1)
+                if (left is not None):
+                    return StrConcat(left, right)
+        return None
+
+    """
+        Integer deduction
+    """
+
+    def lookup_integers(self, specification):
+        """
+            Yields (program, outputs) for the integer programs of the bank that satisfy the specification,
+            in the order of the bank.
+        """
+        if (math.prod(len(accepted) for accepted in specification) <= TOP_DOWN_LOOKUP_LIMIT):
+            matches = [self.integer_index[outputs] + (outputs,) for outputs in product(*specification)
+                       if outputs in self.integer_index]
+            for _, program, outputs in sorted(matches, key=lambda match: match[0]):
+                yield program, outputs
+            return
+
+        for program, outputs in self.integers:
+            if (all(output in accepted for output, accepted in zip(outputs, specification))):
+                yield program, outputs
+
+    def integer_candidates(self, specification, depth):
+        """
+            Yields (program, outputs) for every program of the bank that satisfies the specification,
+            then for the deduced program if there is one outside of the bank.
+        """
+        yield from self.lookup_integers(specification)
+        program = self.deduce_integer(specification, depth, in_bank=False)
+        if (program is not None):
+            self.evals += 1
+            yield program, tuple(program.interpret(test_case) for test_case in self.test_cases)
+
+    def deduce_integer(self, specification, depth, in_bank=True):
+        if (any(len(accepted) == 0 for accepted in specification)):
+            return None
+        if (in_bank):
+            for program, _ in self.lookup_integers(specification):
+                return program
+        if (depth == 0):
+            return None
+
+        key = (specification, depth)
+        if (key in self.integer_memo):
+            return self.integer_memo[key]
+        self.integer_memo[key] = None
+
+        self.deductions += 1
+        program = self.witness_index_of(specification, depth)
+        self.integer_memo[key] = program
+        return program
+
+    def witness_index_of(self, specification, depth):
+        """
+            IntFirstIndexOf(source, substring) where the first occurrence of the substring is an accepted
+            position, then IntIndexOf(source, substring, start) where the substring occurs at an accepted
+            position and start lies between the previous occurrence and that position.
+        """
+        for source, source_outputs in self.strings:
+            candidates = []
+            for position in specification[0]:
+                if (not 0 <= position <= len(source_outputs[0])):
+                    continue
+                for end in range(position, len(source_outputs[0]) + 1):
+                    candidates.extend(self.first_output_index.get(source_outputs[0][position:end], []))
+
+            for substring, substring_outputs in candidates:
+                if (all(source_output.find(substring_output) in accepted for source_output, substring_output, accepted
+                        in zip(source_outputs, substring_outputs, specification))):
+                    return IntFirstIndexOf(source, substring)
+
+            for substring, substring_outputs in candidates:
+                start_specification = []
+                for source_output, substring_output, accepted in zip(source_outputs, substring_outputs, specification):
+                    positions = [position for position in find_all(source_output, substring_output)
+                                 if position in accepted]
+                    if (len(positions) == 0):
+                        break
+                    # The first accepted occurrence, start may be anywhere after the previous occurrence.
+                    position = positions[0]
+                    previous = max([-1] + [other for other in find_all(source_output, substring_output)
+                                           if other < position])
+                    starts = set(range(previous + 1, position + 1))
+                    starts.update(start - len(source_output) for start in list(starts))
+                    start_specification.append(frozenset(starts))
+                else:
+                    start = self.deduce_integer(tuple(start_specification), depth - 1)
+                    if (start is not None):
+                        return IntIndexOf(source, substring, start)
+        return None
+
+    """
+        Returns the program and the number of evaluations, the bank counts its evaluations as BUS does and the
+        deduced program is evaluated once to verify it.
+    """
+
+    def synthesize(self, grammar_nt, str_var, str_literals, int_var, int_literals, test_cases,
+                   literal_tiers=None):
+        program = self.build_bank(grammar_nt, str_var, str_literals, int_var, int_literals, test_cases,
+                                  literal_tiers)
+        if (program is not None):
+            return program, self.evals
+
+        # Iterative deepening, the program with the fewest nested deductions is returned.
+        target = tuple(test_case['out'] for test_case in test_cases)
+        program = None
+        for depth in range(1, self.depth + 1):
+            if (all(isinstance(output, str) for output in target)):
+                program = self.deduce_string(target, depth)
+            elif (all(isinstance(output, int) and not isinstance(output, bool) for output in target)):
+                program = self.deduce_integer(tuple(frozenset((output,)) for output in target), depth)
+            if (program is not None):
+                break
+
+        if (program is None):
+            return None, self.evals
+
+        self.evals += 1
+        if (not all(program.interpret(test_case) == test_case['out'] for test_case in test_cases)):
+            return None, self.evals
+        return program, self.evals
+
+
+def find_all(string, substring):
+    positions = []
+    position = string.find(substring)
+    while (position != -1):
+        positions.append(position)
+        position = string.find(substring, position + 1)
+    return positions
+
+
+if __name__ == "__main__":
+
+    log_filename = logs_directory + "/top_down.log"
+    os.makedirs(os.path.dirname(log_filename), exist_ok=True)
+
+    """
+    Should take two arguments:
+    1. TaskId (1-205) - Total number of tasks is 205 in SyGuS - sygus_string_benchmarks.txt
+    2. Hard or Easy - 0 for easy, 1 for hard, if not specified, defaults to easy.
+    """
+    # Assert that the number of arguments is correct.
+    assert len(sys.argv) == 2 or len(sys.argv) == 3
+    # Assert that the task id is correct.
+    assert int(sys.argv[1]) >= 1 and int(sys.argv[1]) <= 205
+    # Assert that the difficulty is correct.
+    if len(sys.argv) == 3:
+        assert int(sys.argv[2]) == 0 or int(sys.argv[2]) == 1
+
+    difficulty = int(sys.argv[2]) if len(sys.argv) == 3 else 0
+    TaskId = int(sys.argv[1]) - 1
+    logging.basicConfig(filename=log_filename,
+                        filemode='a',
+                        format="[Task: " + str(TaskId) + "] " + '%(message)s',
+                        datefmt='%H:%M:%S',
+                        level=logging.DEBUG)
+
+    with open(config_directory + "sygus_string_benchmarks.txt") as f:
+        benchmarks = f.read().splitlines()
+
+    dsl_functions = [StrConcat, StrReplace, StrSubstr, StrIte, StrIntToStr, StrCharAt, StrLower, StrUpper, IntStrToInt,
+                     IntPlus, IntMinus, IntLength, IntIteInt, IntIndexOf, IntFirstIndexOf, IntMultiply, IntModulo,
+                     BoolEqual, BoolContain, BoolSuffixof, BoolPrefixof, BoolGreaterThan, BoolLessThan]
+
+    benchmark = benchmarks[TaskId]
+    specifications = StrParser(benchmark).parse()
+    string_variables = specifications[0]
+    string_literals = specifications[1]
+    integer_variables = specifications[2]
+    integer_literals = specifications[3]
+    input_output_examples = specifications[4]
+
+    literal_tiers = None
+    if difficulty == 1:
+        # Hard mode: the literals of all benchmarks and the alphabet, ranked against the task's examples.
+        all_string_literals = set(string_literals)
+        all_integer_literals = set(integer_literals)
+        for filename in benchmarks:
+            other_specifications = StrParser(filename).parse()
+            all_string_literals.update(other_specifications[1])
+            all_integer_literals.update(other_specifications[3])
+        all_string_literals.update(chr(character) for character in range(ord('A'), ord('Z') + 1))
+        string_literals, literal_tiers = rank_literals(sorted(all_string_literals), specifications[1],
+                                           input_output_examples, string_variables)
+        integer_literals = sorted(all_integer_literals)
+
+    begin_time = datetime.now()
+
+    synthesizer = TopDownSearch()
+    solution, num = synthesizer.synthesize(dsl_functions, string_variables, string_literals,
+                                           integer_variables, integer_literals, input_output_examples,
+                                           literal_tiers)
+
+    logging.info("Benchmark: " + str(benchmark))
+    logging.info("Result: " + ("Success" if solution is not None else "Fail"))
+    logging.info("Program: " + (solution.toString() if solution is not None else "None"))
+    logging.info("Number of evaluations: " + str(num))
+    logging.info("Number of deductions: " + str(synthesizer.deductions))
+    logging.info(str(datetime.now()))
+    logging.info("Time taken: " + str(datetime.now() - begin_time))
+    logging.info("\n")
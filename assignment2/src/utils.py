@@ -6,6 +6,7 @@ PATH_TO_STR_BENCHMARKS = "./sygus_string_tasks/"
 config_directory = "./config/"
 models_directory = "./models/"
 logs_directory = "./logs/"
+cache_directory = "./cache/"
 
 # sygus parser constants
 NT_STRING = "ntString String"
@@ -24,9 +25,183 @@ regex_alpha = re.compile('[a-zA-Z]')
 regex_alpha_only = re.compile('^[a-zA-Z]+$')
 
 
+# BUSTLE model inference
+# The model is run with NumPy (bustle_model.py), True loads it with Keras instead, which requires TensorFlow.
+USE_KERAS_MODEL = False
+# Inference mode of the NumPy model: precision of the first layer ('float32', 'float16' or 'int8') and number of
+# threads per batch.
+BUSTLE_MODEL_PRECISION = 'float32'
+BUSTLE_MODEL_THREADS = 1
+# The programs of a cost level are scored (property signatures and model) in micro-batches of this many programs
+# on a worker thread while the level is still being enumerated, 0 scores the whole level at its end instead.
+INFERENCE_MICRO_BATCH_SIZE = 2048
+# Memory budget in bytes of the property signatures of a micro-batch, ProgramList scores at most the rows that fit
+# in it at once (also when the whole level is scored at its end) and reuses one buffer for every micro-batch.
+INFERENCE_MEMORY_BUDGET = 64 * 2 ** 20
+# Number of predicted probabilities kept by ProgramList, keyed by the property signature of the sub-program
+# (least recently used entries are dropped first).
+PREDICTION_MEMO_SIZE = 100000
+# Unix socket of a shared inference server (inference_server.py) that bee.py sends its property signatures to
+# instead of loading the model, None loads the model in the process. The server runs the model on the rows of each
+# request on their own, the probabilities do not depend on the other searches.
+INFERENCE_SERVER_ADDRESS = None
+
+
+# Value domain caps
+# Programs with an integer output larger in magnitude than the integer cap, or a string output longer than
+# the string cap, are rejected when they are evaluated. Explicit caps, None to derive them from the examples.
+MAX_INT_MAGNITUDE = None
+MAX_STRING_LENGTH = None
+# Derived caps are this factor times the largest value of the task (examples and literals). None, the default,
+# disables them: a capped search is incomplete, it rejects e.g. x * 100 before a division. bus.py and bee.py
+# enable them with --value-domain-factor=F.
+VALUE_DOMAIN_FACTOR = None
+
+
+def value_domain_caps(examples, string_literals, integer_literals, factor=VALUE_DOMAIN_FACTOR):
+    """
+        Returns [max_int_magnitude, max_string_length] for a task, either value can be None (no cap).
+        The string cap is derived from the longest string of the task, the integer cap from the largest
+        integer, numeric string or string length of the task.
+    """
+    values = [value for example in examples for value in example.values()]
+    values += list(string_literals) + list(integer_literals)
+
+    longest_string = 1
+    largest_integer = 1
+    for value in values:
+        if isinstance(value, str):
+            longest_string = max(longest_string, len(value))
+            if regex_only_digits.search(value) is not None:
+                largest_integer = max(largest_integer, int(value))
+        elif isinstance(value, int) and not isinstance(value, bool):
+            largest_integer = max(largest_integer, abs(value))
+    largest_integer = max(largest_integer, longest_string)
+
+    max_int_magnitude = MAX_INT_MAGNITUDE
+    max_string_length = MAX_STRING_LENGTH
+    if factor is not None:
+        if max_int_magnitude is None:
+            max_int_magnitude = factor * largest_integer
+        if max_string_length is None:
+            max_string_length = factor * longest_string
+    return [max_int_magnitude, max_string_length]
+
+
+def within_value_domain(outputs, max_int_magnitude, max_string_length):
+    for output in outputs:
+        if isinstance(output, str):
+            if max_string_length is not None and len(output) > max_string_length:
+                return False
+        elif isinstance(output, int) and not isinstance(output, bool):
+            if max_int_magnitude is not None and abs(output) > max_int_magnitude:
+                return False
+    return True
+
+
+# Boolean outputs
+# The outputs of a boolean program over the examples are kept as one integer, bit i is set if the output on
+# example i is True. Equivalence checks compare a single integer and ite programs pick their outputs per bit.
+# An ERROR output on example i (only kept by MultiSpecSearch) sets bit n + i instead, n the number of examples.
+def to_bitmask(outputs):
+    mask = 0
+    for index, output in enumerate(outputs):
+        if output is True:
+            mask |= 1 << index
+        elif output is not False:
+            mask |= 1 << (len(outputs) + index)
+    return mask
+
+
+def bitmask_selectors(mask, number_examples):
+    return [(mask >> index) & 1 for index in range(number_examples)]
+
+
+# Parallel enumeration (bus.py)
+# Number of worker processes that grow a size level of the bank, 1 enumerates in the main process.
+BUS_PROCESSES = 1
+# Levels are only split across processes once the bank holds at least this many programs.
+PARALLEL_MIN_BANK = 5000
+# The first operands of an operation are split into about this many work units per process.
+UNITS_PER_PROCESS = 4
+
+
+# Top-down deduction (top_down.py)
+# Programs up to this size are enumerated bottom-up and indexed by their outputs.
+TOP_DOWN_BANK_SIZE = 5
+# Maximum number of nested witness functions between the target and the programs of the bank.
+TOP_DOWN_DEPTH = 3
+# Integer specifications with at most this many combinations of accepted values are looked up in the index,
+# larger ones scan the integer programs of the bank.
+TOP_DOWN_LOOKUP_LIMIT = 256
+
+# Hard mode literal ranking
+# If enabled, the literals collected from all benchmarks in hard mode are ranked against the task's examples.
+RANK_HARD_MODE_LITERALS = True
+# Number of best scoring literals (besides the task's own literals) kept in the cheapest tier.
+LITERAL_TOP_K = 10
+# Characters that usually separate the fields the programs extract.
+DELIMITERS = set(" ,.-/_@:;()|#")
+
+
+def score_literal(literal, test_cases, string_variables):
+    """
+        Scores the relevance of a string literal for a task:
+        - how often it appears in the outputs (weight 4)
+        - how often it appears in the string inputs (weight 2)
+        - whether it is a delimiter that appears in the inputs (1)
+    """
+    if len(literal) == 0:
+        return 0
+
+    output_occurrences = 0
+    input_occurrences = 0
+    for test_case in test_cases:
+        if isinstance(test_case['out'], str) and literal in test_case['out']:
+            output_occurrences += 1
+        if any(literal in test_case[string_variable] for string_variable in string_variables):
+            input_occurrences += 1
+
+    score = 4 * output_occurrences / len(test_cases) + 2 * input_occurrences / len(test_cases)
+    if input_occurrences > 0 and all(character in DELIMITERS for character in literal):
+        score += 1
+    return score
+
+
+def rank_literals(string_literals, task_literals, test_cases, string_variables, top_k=LITERAL_TOP_K):
+    """
+        Ranks the string literals by relevance for the task and assigns each of them a cost tier:
+        0 - the task's own literals and the top_k best scoring ones
+        1 - the other literals that appear in the examples
+        2 - fallback tier, literals that do not appear in the examples at all
+        Returns the literals sorted by tier then score, and a dict literal -> tier.
+    """
+    scores = {literal: score_literal(literal, test_cases, string_variables)
+              for literal in string_literals}
+    ranked_literals = sorted(string_literals, key=lambda literal: (
+        literal not in task_literals, -scores[literal], literal))
+
+    literal_tiers = {}
+    kept = 0
+    for literal in ranked_literals:
+        if literal in task_literals:
+            literal_tiers[literal] = 0
+        elif scores[literal] > 0 and kept < top_k:
+            literal_tiers[literal] = 0
+            kept += 1
+        elif scores[literal] > 0:
+            literal_tiers[literal] = 1
+        else:
+            literal_tiers[literal] = 2
+
+    ranked_literals.sort(key=lambda literal: literal_tiers[literal])
+    return ranked_literals, literal_tiers
+
+
 # Util functions for beesearch
-def decimal_place_converter(number):
-    return float("{:.0f}".format(number))
+def quantize_cost(cost):
+    # Bee costs are integers, rounded half to even (as the "{:.0f}" formatting they replace).
+    return round(cost)
 
 
 def populate_property_value(property_signature, property_encoding):
@@ -284,7 +459,7 @@ def calculate_ps_for_problem(
                 self.parent_ps, self.property_encodings[property_value])
 
 
-# Calculate ps for each sub-program
+# Calculate ps for each sub-program, one program at a time (see populate_batch_ps for the batched version)
 def populate_sub_program_ps(self, program, test_row, outputs, child_input_outputs, STR_TYPES, INT_TYPES, BOOL_TYPES):
     # Calculate the property signatures of the current program.
     # boolean output of subexpression with boolean only properties
@@ -400,3 +575,81 @@ def populate_sub_program_ps(self, program, test_row, outputs, child_input_output
             property_value = Padding
             populate_property_value(
                 test_row, self.property_encodings[property_value])
+
+
+# Kinds of sub-program output, in the order of the sub-program part of the property signature (12 to 20 above):
+# (batched properties, output kind of the sub-program, output kind of the main program or None for any).
+SUB_PROGRAM_PS_BLOCKS = [
+    (BatchedBooleanProperties, "bool", None),
+    (BatchedIntegerProperties, "int", None),
+    (BatchedStringProperties, "str", None),
+    (BatchedInputIntegerOutputStringProperties, "int", "str"),
+    (BatchedInputStringOutputStringProperties, "str", "str"),
+    (BatchedInputIntegerOutputIntegerProperties, "int", "int"),
+    (BatchedInputStringOutputIntegerProperties, "str", "int"),
+    (BatchedInputIntegerOutputBoolProperties, "int", "bool"),
+    (BatchedInputStringOutputBoolProperties, "str", "bool"),
+]
+SUB_PROGRAM_PS_LENGTH = sum(len(properties) for properties, _, _ in SUB_PROGRAM_PS_BLOCKS) * len(EncodedPadding)
+
+
+def output_matrix(outputs, kind):
+    # outputs is a (rows x examples) list.
+    if kind == "str":
+        return BatchedStrings(outputs)
+    if kind == "bool":
+        return np.array(outputs, dtype=bool)
+    try:
+        return np.array(outputs, dtype=np.int64)
+    except OverflowError:
+        return np.array(outputs, dtype=object)
+
+
+def encode_properties(property_matrices):
+    """
+        (properties x programs x examples) boolean matrices to the one-hot encoding of
+        AllTrue/AllFalse/Mixed, a (programs x 4 * properties) matrix.
+    """
+    all_true = property_matrices.all(axis=2)
+    any_true = property_matrices.any(axis=2)
+    encoded = np.zeros(all_true.shape + (len(EncodedPadding),), dtype=np.float32)
+    encoded[..., EncodedAllTrue.index(1)] = all_true
+    encoded[..., EncodedAllFalse.index(1)] = ~any_true
+    encoded[..., EncodedMixed.index(1)] = any_true & ~all_true
+    return encoded.transpose(1, 0, 2).reshape(all_true.shape[1], -1)
+
+
+# Calculate ps for a batch of sub-programs
+def populate_batch_ps(self, return_types, batch_outputs, features, STR_TYPES, INT_TYPES, BOOL_TYPES):
+    """
+        Batched populate_sub_program_ps: writes the property signatures of the sub-programs
+        into features, a (programs x property signature length) float32 matrix whose first
+        len(self.parent_ps) columns hold the property signature of the problem.
+        return_types[p] and batch_outputs[p] are the return type and the outputs on the examples
+        of the p-th sub-program.
+    """
+    kinds = {STR_TYPES['type']: "str", INT_TYPES['type']: "int", BOOL_TYPES['type']: "bool"}
+    task_outputs = output_matrix([[parent_output['out'] for parent_output in self.parent_input_output]],
+                                 self.parent_output_type)
+
+    rows = {"str": [], "int": [], "bool": []}
+    for program_index, return_type in enumerate(return_types):
+        rows[kinds[return_type]].append(program_index)
+    matrices = {kind: output_matrix([batch_outputs[program_index] for program_index in kind_rows], kind)
+                for kind, kind_rows in rows.items() if kind_rows}
+
+    column = len(self.parent_ps)
+    for properties, kind, parent_kind in SUB_PROGRAM_PS_BLOCKS:
+        stop = column + len(properties) * len(EncodedPadding)
+        features[:, column:stop] = np.tile(EncodedPadding, len(properties))
+        if kind in matrices and parent_kind in (None, self.parent_output_type):
+            if kind == "str" and parent_kind is None:
+                property_matrices = [batched_property(matrices[kind].distinct)[matrices[kind].codes]
+                                     for batched_property in properties]
+            elif parent_kind is None:
+                property_matrices = [batched_property(matrices[kind]) for batched_property in properties]
+            else:
+                property_matrices = [batched_property(matrices[kind], task_outputs)
+                                     for batched_property in properties]
+            features[rows[kind], column:stop] = encode_properties(np.array(property_matrices))
+        column = stop
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# The modules of src import each other by name and read their data relative to the assignment directory.
+ASSIGNMENT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ASSIGNMENT_DIRECTORY, 'src'))
+
+
+@pytest.fixture(autouse=True)
+def assignment_directory(monkeypatch):
+    monkeypatch.chdir(ASSIGNMENT_DIRECTORY)
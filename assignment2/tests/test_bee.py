@@ -0,0 +1,129 @@
+import heapq
+import random
+import zlib
+
+import numpy as np
+
+import bee
+from bee import BeeSearch, ProgramList
+from search_trace import SearchTraceWriter, SearchTraceReplay
+from sygus_string_dsl import *
+from utils import *
+
+
+class RebuildingProgramList(ProgramList):
+    """
+        The priority queue before rekey_pqs: a plain heap whose entries of the flagged arities all get the cost
+        of their indices and are heapified again whenever a batch generates a cost below the max cost used.
+    """
+
+    def push_combination(self, arity, cost, combination):
+        heapq.heappush(self.pq, (cost, arity, self.order, combination))
+        self.order += 1
+
+    def peek_combination(self):
+        return self.pq[0] if len(self.pq) else None
+
+    def pop_combinations(self, cost):
+        while len(self.pq) and self.pq[0][0] == cost:
+            _, arity, _, combination = heapq.heappop(self.pq)
+            self.pq_popped[arity].append(combination)
+            yield arity, combination
+
+    def rekey_pqs(self, first_changed_index):
+        rekeyed_arities = set()
+        for arity in range(1, MAX_ARITY + 1):
+            if (self.pq_last_max[arity][self.HEAPIFY]):
+                self.pq_last_max[arity][self.HEAPIFY] = False
+                rekeyed_arities.add(arity)
+        self.pq = [(sum(self.index_to_cost_comb(combination)) + 1, arity, order, combination)
+                   if arity in rekeyed_arities else (cost, arity, order, combination)
+                   for cost, arity, order, combination in self.pq]
+        heapq.heapify(self.pq)
+
+
+def pop_sequence(program_list_class, seed, steps=80):
+    """
+        Drives the queue as BeeSearch.search does, the costs of the programs of each level are drawn from seed
+        (small weights, so that costs below the max cost used and ties are frequent). The candidates are all
+        the Lower of the first terminal, of cost 1 before the model. Returns the popped
+        (cost, arity, combination) in order and the number of re-keys.
+    """
+    BustlePCFG.initialize(NON_TERMINALS, ['a'], [0], [], ['name'], [])
+    plist = program_list_class(['name'], [], [{'name': 'ab', 'out': 'b'}])
+    plist.inference_executor = None
+    plist.init_plist(['a'], [0], [], ['name'], [])
+    generator = random.Random(seed)
+    popped = []
+    for _ in range(steps):
+        cost = plist.get_next_cheapest()
+        for arity, combination in plist.pop_combinations(cost):
+            popped.append((cost, arity, combination))
+
+        candidates = [(StrLower, (0,), 1, ['ab']) for _ in range(generator.randint(0, 4))]
+        # A probability of 2^-k adds k to the cost of the program.
+        plist.scored_batches = [(candidates, [2.0 ** -generator.randint(1, 12) for _ in candidates])]
+        plist.process_batch_jobs()
+        plist.generate_next_set_of_combinations()
+    plist.close()
+    return popped, plist.number_reheapify_calls
+
+
+def test_rekeyed_queue_pops_as_the_rebuilt_queue():
+    for seed in range(5):
+        popped, rekeys = pop_sequence(ProgramList, seed)
+        assert rekeys > 0
+        assert len(set(cost for cost, _, _ in popped)) < len(popped)
+        assert (popped, rekeys) == pop_sequence(RebuildingProgramList, seed)
+
+
+class UniformModel:
+    def predict(self, rows, verbose=0):
+        return np.full((len(rows), 1), 0.5, dtype=np.float32)
+
+
+def test_solution_is_built_from_the_bank(monkeypatch):
+    monkeypatch.setattr(bee, 'BustleModel', UniformModel(), raising=False)
+    input_output = [{'name': 'ab-cd', 'out': 'AB'}, {'name': 'xy-z', 'out': 'XY'}]
+    search = BeeSearch(['name'], [], input_output)
+    solution, _, _ = search.synthesize(20, NON_TERMINALS, ['-'], [0], [], ['name'], [])
+    assert [solution.interpret(example) for example in input_output] == ['AB', 'XY']
+    assert solution.toString() == 'name.Substr(0,name.IndexOf("-")).upper()'
+
+
+class HashModel:
+    """
+        Deterministic probabilities between about 2^-7 and 1, a hash of the property signature of each row.
+    """
+
+    def predict(self, rows, verbose=0):
+        return np.array([[2.0 ** -(zlib.crc32(row.tobytes()) % 700 / 100 + 0.05)] for row in rows], dtype=np.float32)
+
+
+def bank_contents(bank):
+    return [(bank.program(program_id).toString(), int(bank.costs[program_id])) for program_id in range(len(bank))]
+
+
+def test_replayed_trace_reproduces_the_search(monkeypatch, tmp_path):
+    input_output = [{'name': 'ab-cd', 'out': 'AB'}, {'name': 'xy-z', 'out': 'XY'}]
+    arguments = (20, NON_TERMINALS, ['-'], [0], [], ['name'], [])
+    filename = str(tmp_path / "search.trace")
+
+    monkeypatch.setattr(bee, 'BustleModel', HashModel(), raising=False)
+    trace = SearchTraceWriter(filename)
+    recorded = BeeSearch(['name'], [], input_output, trace)
+    recorded_solution, recorded_evaluations, recorded_reheapifies = recorded.synthesize(*arguments)
+    trace.close()
+
+    monkeypatch.setattr(bee, 'BustleModel', None)
+    trace = SearchTraceReplay(filename)
+    replayed = BeeSearch(['name'], [], input_output, trace)
+    solution, evaluations, reheapifies = replayed.synthesize(*arguments)
+    trace.close()
+
+    assert recorded_solution is not None
+    assert solution.toString() == recorded_solution.toString()
+    assert (evaluations, reheapifies) == (recorded_evaluations, recorded_reheapifies)
+    assert replayed.number_value_domain_rejections == recorded.number_value_domain_rejections
+    # the same programs are stored with the same costs
+    assert bank_contents(replayed.plist.bank) == bank_contents(recorded.plist.bank)
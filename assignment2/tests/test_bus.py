@@ -0,0 +1,114 @@
+import bus
+from bus import Search, MultiSpecSearch
+from sygus_string_dsl import *
+
+DSL_FUNCTIONS = [StrConcat, StrReplace, StrSubstr, StrIte, StrIntToStr, StrCharAt, StrLower, StrUpper, IntStrToInt,
+                 IntPlus, IntMinus, IntLength, IntIteInt, IntIndexOf, IntFirstIndexOf, IntMultiply, IntModulo,
+                 BoolEqual, BoolContain, BoolSuffixof, BoolPrefixof, BoolGreaterThan, BoolLessThan]
+
+
+def test_multi_spec_keeps_programs_that_fail_on_other_inputs():
+    # B is solved by name.CharAt(2), which returns ERROR on the input of A.
+    spec_a = [{'name': 'ab', 'out': 'ab'}]
+    spec_b = [{'name': 'xyz', 'out': 'z'}, {'name': 'uvw', 'out': 'w'}]
+
+    solution_b, _ = Search().synthesize(6, DSL_FUNCTIONS, ['name'], [], [], [2], spec_b)
+    assert solution_b.toString() == 'name.CharAt(2)'
+
+    synthesizer = MultiSpecSearch(['a', 'b'], [spec_a, spec_b])
+    solutions, _, _ = synthesizer.synthesize(6, DSL_FUNCTIONS, ['name'], [], [], [2])
+    assert solutions['a'].toString() == 'name'
+    assert solutions['b'].toString() == solution_b.toString()
+
+
+def test_value_domain_caps_are_opt_in():
+    # 100 * x is larger than twice the largest value of the task before the modulo brings it back.
+    examples = [{'x': x, 'out': x * 100 % 13} for x in (5, 6, 7, 8, 9)]
+
+    solution, _ = Search().synthesize(5, DSL_FUNCTIONS, [], [], ['x'], [100, 13], examples)
+    assert solution.toString() == '((100 * x) % 13)'
+
+    capped = Search()
+    capped.value_domain_factor = 2
+    solution, _ = capped.synthesize(5, DSL_FUNCTIONS, [], [], ['x'], [100, 13], examples)
+    assert solution is None
+    assert capped.value_domain_rejections > 0
+
+
+def program_string(program):
+    return None if program is None else program.toString()
+
+
+def bank_contents(synthesizer):
+    return {(size, program_type): ([program.toString() for program in programs],
+                                   synthesizer.plist.get_outputs(size, program_type))
+            for size, types in synthesizer.plist.plist.items() for program_type, programs in types.items()}
+
+
+def test_parallel_search_matches_the_serial_search(monkeypatch):
+    monkeypatch.setattr(bus, 'PARALLEL_MIN_BANK', 0)
+    tasks = [
+        [['name'], [' ', '.'], [], [0, 1], [{'name': 'Nancy FreeHafer', 'out': 'N.'},
+                                           {'name': 'Andrew Cencici', 'out': 'A.'}]],
+        [['s'], ['-'], [], [0, 3], [{'s': '938-242-504', 'out': '242'}, {'s': '308-916-545', 'out': '916'}]],
+        [[], [], ['x'], [7], [{'x': x, 'out': x * x % 7} for x in (3, 4, 5, 11)]],
+    ]
+    for str_var, str_literals, int_var, int_literals, examples in tasks:
+        serial = Search()
+        serial_solution, _ = serial.synthesize(7, DSL_FUNCTIONS, str_var, str_literals, int_var, int_literals,
+                                               examples)
+        parallel = Search()
+        parallel.processes = 2
+        parallel_solution, _ = parallel.synthesize(7, DSL_FUNCTIONS, str_var, str_literals, int_var,
+                                                   int_literals, examples)
+
+        assert parallel.pool is None
+        assert program_string(parallel_solution) == program_string(serial_solution)
+        assert parallel.evals == serial.evals
+        assert parallel.value_domain_rejections == serial.value_domain_rejections
+        assert bank_contents(parallel) == bank_contents(serial)
+
+
+def capped_search():
+    synthesizer = Search()
+    synthesizer.value_domain_factor = 2
+    return synthesizer
+
+
+def run_searches(monkeypatch, searches, vectorized):
+    """
+        Runs each (make_synthesizer, synthesize) with the vectorized integer operations, or with operation.grow
+        and interpret for every candidate. Returns the solutions, evaluations, value domain rejections and banks.
+    """
+    with monkeypatch.context() as patch:
+        if not vectorized:
+            patch.setattr(bus, 'VECTORIZED_OPERATIONS', {})
+        results = []
+        for make_synthesizer, synthesize in searches:
+            synthesizer = make_synthesizer()
+            results.append((synthesize(synthesizer), synthesizer.evals, synthesizer.value_domain_rejections,
+                            bank_contents(synthesizer)))
+        return results
+
+
+def test_vectorized_operations_match_the_interpreter(monkeypatch):
+    # 2 ** 62 does not fit in the matrices, 2 ** 31 * 2 ** 31 is above MAX_SAFE_PRODUCT and x % 0 is ERROR.
+    int_literals = [0, 1, 2 ** 31, 2 ** 62]
+    examples = [{'x': x, 'out': x * 7 - 3} for x in (0, 3, -5, 2 ** 40)]
+    spec_a = [{'x': 0, 'out': -1}, {'x': 2, 'out': 1}]
+    spec_b = [{'x': 5, 'out': 2}, {'x': -4, 'out': -6}]
+    searches = [
+        (Search, lambda synthesizer: program_string(synthesizer.synthesize(
+            5, DSL_FUNCTIONS, [], [], ['x'], int_literals, examples)[0])),
+        # keeps the candidates with ERROR outputs
+        (lambda: MultiSpecSearch(['a', 'b'], [spec_a, spec_b]), lambda synthesizer: {
+            benchmark: program_string(solution) for benchmark, solution in synthesizer.synthesize(
+                5, DSL_FUNCTIONS, [], [], ['x'], int_literals)[0].items()}),
+        (capped_search, lambda synthesizer: program_string(synthesizer.synthesize(
+            5, DSL_FUNCTIONS, [], [], ['x'], [0, 1, 100], examples)[0])),
+    ]
+
+    vectorized_results = run_searches(monkeypatch, searches, True)
+    assert vectorized_results[0][1] > 1000
+    assert vectorized_results[2][2] > 0
+    assert run_searches(monkeypatch, searches, False) == vectorized_results
@@ -0,0 +1,24 @@
+import numpy as np
+
+from bustle_model import NumpyBustleModel, ACTIVATIONS, random_signatures, check_accuracy
+
+
+def random_model(number_features, units=32, precision='float32', seed=0, output_bias=0):
+    rng = np.random.default_rng(seed)
+    layers = [('dense', (rng.normal(size=(number_features, units)).astype(np.float32),
+                         rng.normal(size=units).astype(np.float32), ACTIVATIONS['relu'])),
+              ('dense', (rng.normal(size=(units, 1)).astype(np.float32) / units,
+                         np.full(1, output_bias, dtype=np.float32), ACTIVATIONS['sigmoid']))]
+    return NumpyBustleModel(layers, precision)
+
+
+def test_check_accuracy_of_probabilities_rounded_to_0(monkeypatch):
+    # the sigmoid of the output layer underflows to 0 in float32
+    monkeypatch.setattr(NumpyBustleModel, 'load', lambda filename, precision='float32', threads=1:
+                        random_model(64, precision=precision, output_bias=-200))
+    signatures = random_signatures(100, 64, 32)
+    with np.errstate(over='ignore'):
+        assert np.all(NumpyBustleModel.load(None, 'int8').predict(signatures) == 0)
+    # log2(0) would divide by zero
+    with np.errstate(divide='raise', over='ignore'):
+        assert check_accuracy(None, signatures) == (0.0, 0.0)
@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+import pytest
+
+from bustle_model import random_signatures
+from inference_server import InferenceClient, InferenceServer, benchmark
+from test_bustle_model import random_model
+
+
+@pytest.fixture
+def server_address(tmp_path):
+    address = str(tmp_path / "bee.sock")
+    server = InferenceServer(address, random_model(64))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield address
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_are_scored_on_their_own(server_address):
+    model = random_model(64)
+    signatures = random_signatures(300, 64, 32)
+    clients = [InferenceClient(server_address) for _ in range(3)]
+    requests = [signatures[:100], signatures[100:101], signatures[101:300]]
+    predictions = [None] * len(clients)
+
+    def search(index):
+        predictions[index] = clients[index].predict(requests[index])
+
+    threads = [threading.Thread(target=search, args=(index,)) for index in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for features, prediction in zip(requests, predictions):
+        assert np.array_equal(prediction, model.predict(features))
+    for client in clients:
+        client.close()
+
+
+def test_wrong_number_of_columns_only_rejects_the_request(server_address):
+    client = InferenceClient(server_address)
+    other_client = InferenceClient(server_address)
+    signatures = random_signatures(10, 64, 32)
+    with pytest.raises(ValueError, match="63 columns"):
+        client.predict(signatures[:, :63])
+    assert np.array_equal(client.predict(signatures), random_model(64).predict(signatures))
+    assert np.array_equal(other_client.predict(signatures), random_model(64).predict(signatures))
+    client.close()
+    other_client.close()
+
+
+def test_benchmark_times_the_searches(tmp_path):
+    timings = benchmark(random_model(64), random_signatures(10, 64, 32), searches=(1, 3), requests=2,
+                        address=str(tmp_path / "benchmark.sock"))
+    assert [number_searches for number_searches, _, _ in timings] == [1, 3]
+    assert all(local_seconds > 0 and server_seconds > 0 for _, local_seconds, server_seconds in timings)
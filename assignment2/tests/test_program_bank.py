@@ -0,0 +1,85 @@
+import itertools
+
+from cfg import BustlePCFG
+from program_bank import ProgramBank
+from sygus_string_dsl import *
+from utils import *
+
+ENVS = [{'name': 'ab-Cd', 'number': 3}, {'name': 'x', 'number': -2}]
+
+
+class ObjectBank:
+    """
+        The bank as program objects, with the interface operation.grow reads (ProgramList before the columnar bank).
+    """
+
+    def __init__(self, bank):
+        self.programs = {}
+        # program object -> its id in bank, programs are hashed by identity
+        self.ids = {}
+        for cost, types in bank.layers.items():
+            self.programs[cost] = {}
+            for return_type, layer in types.items():
+                self.programs[cost][return_type] = [bank.program(program_id) for program_id in layer.view().tolist()]
+                self.ids.update(zip(self.programs[cost][return_type], layer.view().tolist()))
+
+    def id(self, program):
+        return self.ids[program] if program in self.ids else program.toString()
+
+    def get_programs(self, cost, return_type):
+        return self.programs.get(cost, {}).get(return_type, [])
+
+    def get_programs_all(self, cost):
+        return [program for programs in self.programs.get(cost, {}).values() for program in programs]
+
+
+def interpret(program):
+    outputs = [program.interpret(env) for env in ENVS]
+    return None if ERROR in outputs else outputs
+
+
+def build_bank():
+    """
+        Terminals of cost 1, and the programs grown from them at cost 2 and 3 (a few per operation).
+    """
+    BustlePCFG.initialize(NON_TERMINALS, ['', '-', 'a', 'A'], [0, 1], [True], ['name'], ['number'])
+    bank = ProgramBank(len(ENVS))
+    for program in [StrLiteral(''), StrLiteral('-'), StrLiteral('a'), StrLiteral('A'), StrVar('name'),
+                    IntLiteral(0), IntLiteral(1), IntVar('number'), BoolLiteral(True)]:
+        bank.add_terminal(program, [program.interpret(env) for env in ENVS])
+    for value in (1, 2):
+        bank.add_terminal(IntLiteral(value), [value] * len(ENVS), in_layers=False)
+    for cost in (2, 3):
+        for operation in NON_TERMINALS:
+            grown = 0
+            for costs in itertools.product(range(1, cost), repeat=operation.ARITY):
+                for candidate_operation, children in bank.grow(operation, costs):
+                    outputs = bank.evaluate(candidate_operation, children)
+                    if outputs is not None and grown < 3:
+                        bank.add(candidate_operation, children, cost, outputs)
+                        grown += 1
+    return bank
+
+
+def test_bank_grows_the_candidates_of_the_dsl():
+    bank = build_bank()
+    objects = ObjectBank(bank)
+    # the constant operands of BoolEqual are not in the layers
+    constants = {program_id: bank.program(program_id).toString() for program_id in bank.constants.values()}
+    for operation in NON_TERMINALS:
+        for costs in itertools.product((1, 2, 3), repeat=operation.ARITY):
+            candidates = [(candidate_operation, tuple(constants.get(child, child) for child in children))
+                          for candidate_operation, children in bank.grow(operation, costs)]
+            programs = [(type(program), tuple(objects.id(getattr(program, child)) for child in program.CHILDREN))
+                        for program in operation.grow(objects, costs)]
+            assert candidates == programs
+
+
+def test_bank_evaluates_candidates_as_the_interpreter():
+    bank = build_bank()
+    for operation in NON_TERMINALS:
+        for costs in itertools.product((1, 2), repeat=operation.ARITY):
+            for candidate_operation, children in bank.grow(operation, costs):
+                program = bank.candidate_program(candidate_operation, children)
+                assert bank.evaluate(candidate_operation, children) == interpret(program)
+                assert bank.cost(candidate_operation, children) == program.size
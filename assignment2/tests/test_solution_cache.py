@@ -0,0 +1,49 @@
+import json
+
+import solution_cache
+from solution_cache import SolutionCache
+from sygus_string_dsl import *
+
+EXAMPLES = [{'name': 'ab', 'out': 'AB'}, {'name': 'cd', 'out': 'CD'}]
+
+
+def make_key(difficulty=0):
+    return SolutionCache.make_key(['name'], [], [' '], [0], EXAMPLES, [StrUpper, StrConcat], 'bus', difficulty)
+
+
+def test_get_returns_the_stored_program(tmp_path):
+    cache = SolutionCache(str(tmp_path))
+    cache.put(make_key(), StrUpper(StrVar('name')), 12)
+
+    program, entry = cache.get(make_key(), EXAMPLES)
+    assert program.toString() == 'name.upper()'
+    assert entry['evaluations'] == 12
+
+
+def test_get_rejects_a_program_that_fails_the_examples(tmp_path):
+    cache = SolutionCache(str(tmp_path))
+    cache.put(make_key(), StrLower(StrVar('name')), 12)
+    assert cache.get(make_key(), EXAMPLES) is None
+
+
+def test_key_depends_on_the_literal_ranking_settings(monkeypatch):
+    key = make_key(difficulty=1)
+    monkeypatch.setattr(solution_cache, 'LITERAL_TOP_K', solution_cache.LITERAL_TOP_K + 1)
+    assert make_key(difficulty=1) != key
+    monkeypatch.setattr(solution_cache, 'RANK_HARD_MODE_LITERALS', not solution_cache.RANK_HARD_MODE_LITERALS)
+    assert make_key(difficulty=1) != key
+
+
+def test_get_only_builds_dsl_operations(tmp_path):
+    cache = SolutionCache(str(tmp_path))
+    for tree in (['BustlePCFG', 'name'], ['StrUpper', ['copy', 'name']], ['StrUpper'], []):
+        with open(cache.get_path(make_key()), 'w') as f:
+            json.dump({'program': '', 'tree': tree, 'evaluations': 0}, f)
+        assert cache.get(make_key(), EXAMPLES) is None
+
+
+def test_get_misses_on_an_ill_typed_program(tmp_path):
+    cache = SolutionCache(str(tmp_path))
+    with open(cache.get_path(make_key()), 'w') as f:
+        json.dump({'program': '', 'tree': ['StrLower', ['IntLiteral', 3]], 'evaluations': 0}, f)
+    assert cache.get(make_key(), EXAMPLES) is None
@@ -0,0 +1,28 @@
+import copy
+import pickle
+
+from sygus_string_dsl import *
+
+ENV = {'name': 'ab-cd', 'number': 3}
+
+
+def test_error_is_a_distinct_singleton():
+    assert ERROR is not None and ERROR != None
+    assert pickle.loads(pickle.dumps([ERROR]))[0] is ERROR
+    assert copy.deepcopy(ERROR) is ERROR
+
+
+def test_undefined_inputs_return_error():
+    assert StrCharAt(StrVar('name'), IntLiteral(5)).interpret(ENV) is ERROR
+    assert IntStrToInt(StrVar('name')).interpret(ENV) is ERROR
+    assert IntModulo(IntVar('number'), IntLiteral(0)).interpret(ENV) is ERROR
+    assert IntFirstIndexOf(StrVar('name'), StrLiteral('x')).interpret(ENV) is ERROR
+    assert IntIndexOf(StrVar('name'), StrLiteral('a'), IntLiteral(1)).interpret(ENV) is ERROR
+
+
+def test_error_propagates_through_parents():
+    error = IntFirstIndexOf(StrVar('name'), StrLiteral('x'))
+    assert StrSubstr(StrVar('name'), IntLiteral(0), error).interpret(ENV) is ERROR
+    assert StrIntToStr(IntPlus(error, IntLiteral(1))).interpret(ENV) is ERROR
+    assert StrIte(BoolGreaterThan(error, IntLiteral(0)), StrVar('name'), StrLiteral('')).interpret(ENV) is ERROR
+    assert StrIte(BoolLiteral(False), StrCharAt(StrVar('name'), IntLiteral(9)), StrLiteral('ok')).interpret(ENV) == 'ok'
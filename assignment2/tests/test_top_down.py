@@ -0,0 +1,75 @@
+from sygus_parser import StrParser
+from sygus_string_dsl import *
+from top_down import TopDownSearch
+from utils import *
+
+DSL_FUNCTIONS = [StrConcat, StrReplace, StrSubstr, StrIte, StrIntToStr, StrCharAt, StrLower, StrUpper, IntStrToInt,
+                 IntPlus, IntMinus, IntLength, IntIteInt, IntIndexOf, IntFirstIndexOf, IntMultiply, IntModulo,
+                 BoolEqual, BoolContain, BoolSuffixof, BoolPrefixof, BoolGreaterThan, BoolLessThan]
+
+
+def search_with_terminals(names, str_literals, int_literals):
+    # Only the terminals are in the bank, each witness has to deduce the operation.
+    synthesizer = TopDownSearch(bank_size=1)
+    examples = [{'name': name, 'out': ''} for name in names]
+    assert synthesizer.build_bank(DSL_FUNCTIONS, ['name'], str_literals, [], int_literals, examples) is None
+    return synthesizer
+
+
+def test_witness_case():
+    synthesizer = search_with_terminals(['ab', 'Cd'], [], [])
+    assert synthesizer.witness_case(('AB', 'CD'), 1).toString() == 'name.upper()'
+    assert synthesizer.witness_case(('ab', 'cd'), 1).toString() == 'name.lower()'
+    assert synthesizer.witness_case(('Ab', 'cd'), 1) is None
+
+
+def test_witness_substr():
+    synthesizer = search_with_terminals(['abcd', 'xyz'], [], [1, 2, -1])
+    assert synthesizer.witness_substr(('bc', 'y'), 1).toString() == 'name.Substr(1,-1)'
+    assert synthesizer.witness_substr(('b', 'y'), 1).toString() == 'name.Substr(1,2)'
+
+
+def test_witness_substr_accepts_bounds_out_of_the_string():
+    # The suffix after the first character ends at 4 and 3, 10 is clamped to both, -10 is clamped to 0.
+    synthesizer = search_with_terminals(['abcd', 'xyz'], [], [1, 10])
+    assert synthesizer.witness_substr(('bcd', 'yz'), 1).toString() == 'name.Substr(1,10)'
+    synthesizer = search_with_terminals(['abcd', 'xyz'], [], [-10, 2])
+    assert synthesizer.witness_substr(('ab', 'xy'), 1).toString() == 'name.Substr(-10,2)'
+
+
+def test_witness_char_at():
+    synthesizer = search_with_terminals(['abc', 'xyz'], [], [1])
+    assert synthesizer.witness_char_at(('b', 'y'), 1).toString() == 'name.CharAt(1)'
+    assert synthesizer.witness_char_at(('c', 'z'), 1) is None
+
+
+def test_witness_replace():
+    synthesizer = search_with_terminals(['a-b', 'cd-e'], ['-', '.'], [])
+    assert synthesizer.witness_replace(('a.b', 'cd.e'), 1).toString() == 'name.replace("-", ".")'
+
+
+def test_witness_concat():
+    synthesizer = search_with_terminals(['ab', 'c'], ['!'], [])
+    assert synthesizer.witness_concat(('ab!', 'c!'), 1).toString() == 'concat(name, "!")'
+    assert synthesizer.witness_concat(('!ab', '!c'), 1).toString() == 'concat("!", name)'
+
+
+def test_witness_index_of():
+    synthesizer = search_with_terminals(['a-b-c', 'x-yy-z'], ['-'], [2])
+    first = (frozenset([1]), frozenset([1]))
+    assert synthesizer.witness_index_of(first, 1).toString() == 'name.IndexOf("-")'
+    second = (frozenset([3]), frozenset([4]))
+    assert synthesizer.witness_index_of(second, 1).toString() == 'name.IndexOf("-",2)'
+
+
+def test_solves_substring_tasks():
+    with open(config_directory + "sygus_string_benchmarks.txt") as f:
+        benchmarks = f.read().splitlines()
+
+    for benchmark in ['phone-6-short.sl', 'phone-5-short.sl', 'bikes.sl']:
+        assert benchmark in benchmarks
+        specifications = StrParser(benchmark).parse()
+        solution, _ = TopDownSearch().synthesize(DSL_FUNCTIONS, specifications[0], specifications[1],
+                                                 specifications[2], specifications[3], specifications[4])
+        assert solution is not None
+        assert all(solution.interpret(example) == example['out'] for example in specifications[4])
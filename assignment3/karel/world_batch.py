@@ -1,17 +1,124 @@
 import numpy as np
-from karel.world import World
 
+from config import Config
+from karel.world import MAX_API_CALLS, MAX_MARKERS_PER_SQUARE
 
-class WorldBatch:
+# Row and column offsets of a move, indexed by direction (north, east, south, west).
+DIRECTION_ROW = np.array([-1, 0, 1, 0])
+DIRECTION_COL = np.array([0, 1, 0, -1])
+
+# Action 5 is the "do nothing" action, for filling up empty space in the array
+NOP_ACTION = 5
+
+
+# N Karel worlds of the same size stepped together. The state is kept as arrays (hero position and
+# direction, walls, number of markers per cell) and every action is applied to all the worlds that
+# take it at once, with the same rules as World (crashes, leaps_behavior, API call limit). The
+# 16 channel states are updated in place, only on the cells that change.
+class BatchedWorld:
 
     def __init__(self, states: np.ndarray):
-        self.worlds: list[World] = []
-        for s in states:
-            self.worlds.append(World(s))
-
-    def step(self, actions):
-        assert len(self.worlds) == len(actions)
-        for w, a in zip(self.worlds, actions):
-            if a < 5: # Action 5 is the "do nothing" action, for filling up empty space in the array
-                w.run_action(a)
-        return np.array([w.get_state() for w in self.worlds])
\ No newline at end of file
+        # states: N x H x W x 16 (see STATE_TABLE)
+        self.s = states.astype(bool)
+        self.num_worlds, self.rows, self.cols, _ = self.s.shape
+        self.crashable = Config.env_is_crashable
+        self.leaps_behavior = Config.env_enable_leaps_behaviour
+        # The first hero channel of each world, like World
+        hero = self.s[:, :, :, :4].reshape(self.num_worlds, -1).argmax(axis=1)
+        self.hero_row, self.hero_col, self.hero_dir = np.unravel_index(hero, (self.rows, self.cols, 4))
+        self.walls = self.s[:, :, :, 4].copy()
+        self.markers = self.s[:, :, :, 5:].argmax(axis=3).astype(np.uint8)
+        self.crashed = np.zeros(self.num_worlds, dtype=bool)
+        self.num_api_calls = np.zeros(self.num_worlds, dtype=np.int64)
+        self.worlds = np.arange(self.num_worlds)
+
+    def __len__(self) -> int:
+        return self.num_worlds
+
+    def get_state(self) -> np.ndarray:
+        return self.s.copy()
+
+    # Function: place heroes
+    # ------------------
+    # Sets the position and direction of the heroes in mask.
+    def place_heroes(self, mask: np.ndarray, row: np.ndarray, col: np.ndarray, dir: np.ndarray) -> None:
+        worlds = self.worlds[mask]
+        self.s[worlds, self.hero_row[mask], self.hero_col[mask], self.hero_dir[mask]] = False
+        self.hero_row[mask], self.hero_col[mask], self.hero_dir[mask] = row[mask], col[mask], dir[mask]
+        self.s[worlds, self.hero_row[mask], self.hero_col[mask], self.hero_dir[mask]] = True
+
+    # Function: add markers
+    # ------------------
+    # Adds delta markers to the hero cell of the worlds in mask.
+    def add_markers(self, mask: np.ndarray, delta: int) -> None:
+        worlds, row, col = self.worlds[mask], self.hero_row[mask], self.hero_col[mask]
+        markers = self.markers[worlds, row, col].astype(np.int64)
+        self.s[worlds, row, col, 5 + markers] = False
+        self.s[worlds, row, col, 5 + markers + delta] = True
+        self.markers[worlds, row, col] = markers + delta
+
+    # Function: note api calls
+    # ------------------
+    # Counts an API call for the worlds in mask, the ones that exceed the limit are crashed.
+    def note_api_calls(self, mask: np.ndarray) -> None:
+        self.num_api_calls[mask] += 1
+        self.crashed |= mask & (self.num_api_calls > MAX_API_CALLS)
+
+    # Function: turn
+    # ------------------
+    # Rotates the heroes in mask that have not crashed, delta = -1 is turn left and 1 turn right.
+    def turn(self, mask: np.ndarray, delta: int) -> None:
+        mask = mask & ~self.crashed
+        self.place_heroes(mask, self.hero_row, self.hero_col, (self.hero_dir + delta) % 4)
+        self.note_api_calls(mask)
+
+    # Function: move
+    # ------------------
+    # Moves the heroes in mask that have not crashed when the cell they face is clear.
+    def move(self, mask: np.ndarray) -> None:
+        mask = mask & ~self.crashed
+        new_row = self.hero_row + DIRECTION_ROW[self.hero_dir]
+        new_col = self.hero_col + DIRECTION_COL[self.hero_dir]
+        inside = (new_row >= 0) & (new_row < self.rows) & (new_col >= 0) & (new_col < self.cols)
+        clear = inside & ~self.walls[self.worlds, np.clip(new_row, 0, self.rows - 1),
+                                     np.clip(new_col, 0, self.cols - 1)]
+        if self.crashable:
+            self.crashed |= mask & ~clear
+        moved = mask & clear & ~self.crashed
+        self.place_heroes(moved, new_row, new_col, self.hero_dir)
+        if self.leaps_behavior:
+            self.turn(mask & ~moved, -1)
+            self.turn(mask & ~moved, -1)
+        self.note_api_calls(mask)
+
+    # Function: pick marker
+    # ------------------
+    # Like World.pick_marker, also applies to the worlds that crashed.
+    def pick_marker(self, mask: np.ndarray) -> None:
+        markers = self.markers[self.worlds, self.hero_row, self.hero_col]
+        if self.crashable:
+            self.crashed |= mask & (markers == 0)
+        self.add_markers(mask & (markers > 0), -1)
+        self.note_api_calls(mask)
+
+    # Function: put marker
+    # ------------------
+    # Like World.put_marker, also applies to the worlds that crashed.
+    def put_marker(self, mask: np.ndarray) -> None:
+        markers = self.markers[self.worlds, self.hero_row, self.hero_col]
+        if self.crashable:
+            self.crashed |= mask & (markers == MAX_MARKERS_PER_SQUARE)
+        self.add_markers(mask & (markers < MAX_MARKERS_PER_SQUARE), 1)
+        self.note_api_calls(mask)
+
+    def step(self, actions) -> np.ndarray:
+        actions = np.asarray(actions).reshape(-1)
+        assert len(actions) == self.num_worlds
+        if np.any((actions < 0) | (actions > NOP_ACTION)):
+            raise NotImplementedError()
+        self.move(actions == 0)
+        self.turn(actions == 1, -1)
+        self.turn(actions == 2, 1)
+        self.pick_marker(actions == 3)
+        self.put_marker(actions == 4)
+        return self.get_state()
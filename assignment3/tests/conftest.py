@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The packages of the assignment (config, karel, ...) are imported from the assignment directory.
+ASSIGNMENT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ASSIGNMENT_DIRECTORY)
+# config parses the command line when it is imported, the arguments of pytest are not options of Config.
+sys.argv = sys.argv[:1]
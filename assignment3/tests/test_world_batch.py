@@ -0,0 +1,47 @@
+import itertools
+
+import numpy as np
+
+from config import Config
+from karel import world, world_batch
+from karel.world import World, MAX_MARKERS_PER_SQUARE
+from karel.world_batch import BatchedWorld, NOP_ACTION
+
+
+def random_states(rng, number_worlds, rows=6, cols=6):
+    """
+        Small worlds with many walls and markers up to MAX_MARKERS_PER_SQUARE, so that moves are blocked and
+        markers run out or overflow often. The hero is on a cell without a wall.
+    """
+    states = np.zeros((number_worlds, rows, cols, 16), dtype=bool)
+    for state in states:
+        walls = rng.random((rows, cols)) < 0.3
+        markers = np.where(rng.random((rows, cols)) < 0.5, rng.integers(0, MAX_MARKERS_PER_SQUARE + 1, (rows, cols)), 0)
+        row, col = rng.integers(0, rows), rng.integers(0, cols)
+        walls[row, col] = False
+        state[:, :, 4] = walls
+        state[np.arange(rows)[:, None], np.arange(cols), 5 + markers] = True
+        state[row, col, rng.integers(0, 4)] = True
+    return states
+
+
+def test_batched_world_steps_as_the_world(monkeypatch):
+    rng = np.random.default_rng(0)
+    for crashable, leaps_behavior, max_api_calls in itertools.product((False, True), (False, True), (1000, 30)):
+        monkeypatch.setattr(Config, 'env_is_crashable', crashable)
+        monkeypatch.setattr(Config, 'env_enable_leaps_behaviour', leaps_behavior)
+        monkeypatch.setattr(world, 'MAX_API_CALLS', max_api_calls)
+        monkeypatch.setattr(world_batch, 'MAX_API_CALLS', max_api_calls)
+        states = random_states(rng, 32)
+        worlds = [World(state.copy()) for state in states]
+        batched_world = BatchedWorld(states)
+        for actions in rng.integers(0, NOP_ACTION + 1, (60, len(worlds))):
+            batched_world.step(actions)
+            for single_world, action in zip(worlds, actions):
+                if action != NOP_ACTION:
+                    single_world.run_action(action)
+            assert np.array_equal(batched_world.get_state(), np.stack([w.get_state() for w in worlds]))
+            assert batched_world.crashed.tolist() == [w.is_crashed() for w in worlds]
+            assert batched_world.num_api_calls.tolist() == [w.numAPICalls for w in worlds]
+        if crashable or max_api_calls < 60:
+            assert batched_world.crashed.any()
@@ -6,7 +6,7 @@ from torch import nn
 from dsl import DSL
 from dsl.syntax_checker import PySyntaxChecker
 from karel.world import STATE_TABLE
-from karel.world_batch import WorldBatch
+from karel.world_batch import BatchedWorld
 from config import Config
 
 from ..utils import init
@@ -78,7 +78,7 @@ class BaseVAE(nn.Module):
         states_np = states.detach().cpu().numpy().astype(np.bool_)
         # C x H x W to H x W x C
         states_np = np.moveaxis(states_np,[-1,-2,-3], [-2,-3,-1])
-        self._world = WorldBatch(states_np)
+        self._world = BatchedWorld(states_np)
 
     def env_step(self, states: torch.Tensor, actions: torch.Tensor):
         states_np = states.detach().cpu().numpy().astype(np.bool_)